@@ -1,80 +1,63 @@
-import csv
-from datetime import datetime
-from io import TextIOWrapper
-from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from datetime import date
+
+from flask import Blueprint, render_template, redirect, request, flash, jsonify
+from sqlalchemy import select
 from models import db, AssetAssignment, Asset, Employee
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response, csv_stream_response, generate_csv_rows
+from lookups import employee_options
+from csv_import import import_csv, lookup_map, parse_keys, parse_date, parse_int
+from jobs import import_or_queue
+from custody import holder_on, holdings, snapshot_rows
+from reconciliation import discrepancies, last_run, reconcile, run_reconciliation, run_summary
 
 # Create Blueprint
 asset_assignment_bp = Blueprint("asset_assignment", __name__)
 
+# Register the assignments table with the shared list engine
+assignment_list = ListQuery(
+	AssetAssignment,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"assignment_id": AssetAssignment.assignment_id,
+		"asset_id": AssetAssignment.asset_id,
+		"employee_id": AssetAssignment.employee_id,
+		"assigned_date": AssetAssignment.assigned_date,
+		"returned_date": AssetAssignment.returned_date,
+	},
+	searchable=[
+		AssetAssignment.assignment_id,
+		Asset.asset_tag,
+		Employee.first_name,
+		Employee.last_name,
+		AssetAssignment.assigned_date,
+		AssetAssignment.returned_date,
+	],
+	# Create a join to query asset_assignment, asset, and employee tables
+	base_query=lambda: (
+		AssetAssignment.query
+		.join(Asset, AssetAssignment.asset_id == Asset.asset_id)
+		.join(Employee, AssetAssignment.employee_id == Employee.employee_id)
+	),
+	# Fill the asset and employee relationships from the joined rows
+	load_options=[
+		db.contains_eager(AssetAssignment.asset),
+		db.contains_eager(AssetAssignment.employee),
+	],
+)
+
 # Define main page
 @asset_assignment_bp.route("/asset_assignments", methods=["GET", "POST"])
 @role_required("admin", "manager", "user")
 def asset_assignments():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE asset_assignments AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# Look up related foreign keys by name if given
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY EXIST IN THEIR RESPECTIVE TABLES
-					asset = (
-						Asset.query.filter_by(asset_id=row.get("asset_id")).first()
-						if row.get("asset_id") else None
-					)
-					employee = (
-						Employee.query.filter_by(employee_id=row.get("employee_id")).first()
-						if row.get("employee_id") else None
-					)
-
-					# Parse dates
-					assigned_date = (
-						datetime.strptime(row.get("assigned_date"), "%Y-%m-%d").date()
-						if row.get("assigned_date") else None
-					)
-					returned_date = (
-						datetime.strptime(row.get("returned_date"), "%Y-%m-%d").date()
-						if row.get("returned_date") else None
-					)
-
-					# Only add assignment records if the referenced items exist
-					if asset and employee and assigned_date:
-						assignment = AssetAssignment(
-							asset_id=asset.asset_id,
-							employee_id=employee.employee_id,
-							assigned_date=assigned_date,
-							returned_date=returned_date,
-						)
-						db.session.add(assignment)
-						count += 1
-
-					# Update asset table
-					asset = Asset.query.get(asset.asset_id)
-					if asset:
-						asset.assigned_to = employee.employee_id
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} asset assignments from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			import_or_queue(import_asset_assignments_csv, file, "asset assignments")
 			return redirect("/asset_assignments")
 
 		# Manual form entry
@@ -99,10 +82,8 @@ def asset_assignments():
 
 			db.session.add(new_assignment)
 
-			# Update asset table
-			asset = Asset.query.get(asset_id)
-			if asset:
-				asset.assigned_to = employee_id
+			# Update asset table from the asset's open assignments
+			reconcile([int(asset_id)])
 
 			# commit entry and alert user
 			db.session.commit()
@@ -116,41 +97,19 @@ def asset_assignments():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	assets = Asset.query.order_by(Asset.name).all()
-	employees = Employee.query.order_by(Employee.last_name, Employee.first_name).all()
+	employees = employee_options()
 
-	# Handle sorting
-	sort = request.args.get("sort", "assignment_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"assignment_id": AssetAssignment.assignment_id,
-		"asset_id": AssetAssignment.asset_id,
-		"employee_id": AssetAssignment.employee_id,
-		"assigned_date": AssetAssignment.assigned_date,
-		"returned_date": AssetAssignment.returned_date,
-	}
-
-	sort_column = valid_columns.get(sort, AssetAssignment.assignment_id)
-
-	# Apply search if necessary
-	assignments = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		assignments = assignments.order_by(sort_column.desc())
-	else:
-		assignments = assignments.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = assignment_list.page(request.args)
 
 	# Display table
 	return render_template(
 		"asset_assignments.html",
-		assignments=assignments,
-		assets=assets,
+		assignments=page.items,
+		page=page,
 		employees=employees,
-		sort=sort,
-		direction=direction
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -160,6 +119,8 @@ def delete_asset_assignment(assignment_id):
 	assignment = AssetAssignment.query.get(assignment_id)
 	if assignment:
 		db.session.delete(assignment)
+		# The asset falls back to its previous open assignment, if any
+		reconcile([assignment.asset_id])
 		db.session.commit()
 	return redirect("/asset_assignments")
 
@@ -181,15 +142,14 @@ def edit_asset_assignment(assignment_id):
 		return redirect("/asset_assignments")
 
 	try:
+		previous_asset_id = record.asset_id
 		record.asset_id = asset_id
 		record.employee_id = employee_id
 		record.assigned_date = assigned_date
 		record.returned_date = returned_date or None
 
-		# Update table
-		asset = Asset.query.get(asset_id)
-		if asset:
-			asset.assigned_to = employee_id
+		# Update table, for the old asset too if the assignment moved
+		reconcile([previous_asset_id, int(asset_id)])
 
 		db.session.commit()
 		flash("Assignment updated successfully!", "success")
@@ -199,22 +159,137 @@ def edit_asset_assignment(assignment_id):
 
 	return redirect("/asset_assignments")
 
+# Edit form for a single assignment, loaded on demand by the assignments page
+@asset_assignment_bp.route("/asset_assignments/edit_form/<int:assignment_id>", methods=["GET"])
+@role_required("admin", "manager")
+def edit_asset_assignment_form(assignment_id):
+	assignment = AssetAssignment.query.get_or_404(assignment_id)
 
-# Search function
-def search_for(search):
-	# Create a join to query asset_assignment, asset, and employee tables
-	query = AssetAssignment.query \
-		.join(Asset, AssetAssignment.asset_id == Asset.asset_id) \
-		.join(Employee, AssetAssignment.employee_id == Employee.employee_id)
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(AssetAssignment.assignment_id.ilike(search_pattern)) |
-			(Asset.asset_tag.ilike(search_pattern)) |
-			(Employee.first_name.ilike(search_pattern)) |
-			(Employee.last_name.ilike(search_pattern)) |
-			(AssetAssignment.assigned_date.ilike(search_pattern)) |
-			(AssetAssignment.returned_date.ilike(search_pattern))
+	return render_template(
+		"asset_assignment_edit_form.html",
+		assignment=assignment,
+		employees=employee_options(),
+	)
+
+
+# Read a YYYY-MM-DD query parameter, defaulting to today
+def date_arg(name):
+	value = request.args.get(name)
+	if not value:
+		return date.today()
+	return date.fromisoformat(value)
+
+# Who held an asset on ?date= (default today), from the assignment history
+@asset_assignment_bp.route("/asset_assignments/custody/<int:asset_id>", methods=["GET"])
+@role_required("admin", "manager")
+def asset_custody(asset_id):
+	try:
+		day = date_arg("date")
+	except ValueError:
+		return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+	return jsonify({"asset_id": asset_id, "date": day.isoformat(), "holder": holder_on(asset_id, day)})
+
+# Assets an employee held at any point from ?start= to ?end= (both default to today)
+@asset_assignment_bp.route("/asset_assignments/holdings/<int:employee_id>", methods=["GET"])
+@role_required("admin", "manager")
+def employee_holdings(employee_id):
+	try:
+		start = date_arg("start")
+		end = date_arg("end")
+	except ValueError:
+		return jsonify({"error": "start and end must be YYYY-MM-DD"}), 400
+	if start > end:
+		return jsonify({"error": "start must not be after end"}), 400
+	return jsonify({
+		"employee_id": employee_id,
+		"start": start.isoformat(),
+		"end": end.isoformat(),
+		"assignments": holdings(employee_id, start, end),
+	})
+
+# Audit export: the holder of every asset on ?date= (default today), from the in-memory custody index
+@asset_assignment_bp.route("/asset_assignments/custody/export", methods=["GET"])
+@role_required("admin", "manager")
+def export_custody():
+	try:
+		day = date_arg("date")
+	except ValueError:
+		flash("Date must be YYYY-MM-DD.", "danger")
+		return redirect("/asset_assignments")
+	return csv_stream_response(
+		generate_csv_rows(["asset_id", "asset_tag", "employee_id", "employee_email", "assignment_id"], snapshot_rows(day)),
+		f"custody_{day.isoformat()}.csv"
+	)
+
+# Assets whose assigned_to disagrees with their latest open assignment, and the last reconciliation run
+@asset_assignment_bp.route("/asset_assignments/reconcile", methods=["GET"])
+@role_required("admin", "manager")
+def reconciliation_report():
+	count, found = discrepancies()
+	run = last_run()
+	return jsonify({"discrepancies": count, "assets": found, "last_run": run_summary(run) if run else None})
+
+# Fix every discrepancy now (see reconciliation.py; the CLI command does the same on a schedule)
+@asset_assignment_bp.route("/asset_assignments/reconcile", methods=["POST"])
+@role_required("admin")
+def reconcile_assignments():
+	try:
+		run, _ = run_reconciliation(incremental=request.form.get("incremental") == "1")
+		flash(f"Checked {run.checked} assets and fixed {run.fixed} assignments.", "success")
+	except Exception as e:
+		db.session.rollback()
+		flash(f"Error reconciling assignments: {e}", "danger")
+	return redirect("/asset_assignments")
+
+
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@asset_assignment_bp.route("/asset_assignments/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_asset_assignments():
+	return csv_response(
+		select(
+			AssetAssignment.assignment_id,
+			AssetAssignment.asset_id,
+			Asset.asset_tag,
+			AssetAssignment.employee_id,
+			Employee.email.label("employee_email"),
+			AssetAssignment.assigned_date,
+			AssetAssignment.returned_date,
 		)
+		.outerjoin(Asset, AssetAssignment.asset_id == Asset.asset_id)
+		.outerjoin(Employee, AssetAssignment.employee_id == Employee.employee_id)
+		.order_by(AssetAssignment.assignment_id),
+		"asset_assignments.csv"
+	)
+
+
+# Look up the assets and employees referenced by a batch of CSV rows
+def assignment_lookups(rows):
+	return {
+		"assets": lookup_map(Asset.asset_id, Asset.asset_id, parse_keys(row.get("asset_id") for row in rows)),
+		"employees": lookup_map(Employee.employee_id, Employee.employee_id, parse_keys(row.get("employee_id") for row in rows)),
+	}
+
 
-	return query
+# Import asset assignments from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY EXIST IN THEIR RESPECTIVE TABLES
+def import_asset_assignments_csv(file, progress=None):
+	def convert(row, lookups):
+		asset_id = parse_int(row.get("asset_id"), "asset_id")
+		employee_id = parse_int(row.get("employee_id"), "employee_id")
+		assigned_date = parse_date(row.get("assigned_date"), "assigned_date")
+		if asset_id not in lookups["assets"] or employee_id not in lookups["employees"] or not assigned_date:
+			return None
+
+		return {
+			"asset_id": asset_id,
+			"employee_id": employee_id,
+			"assigned_date": assigned_date,
+			"returned_date": parse_date(row.get("returned_date"), "returned_date"),
+		}
+
+	# Update the asset table from the open assignments, one UPDATE per batch
+	def update_assets(records):
+		reconcile(record["asset_id"] for record in records)
+
+	return import_csv(file, AssetAssignment.__table__, convert, "asset assignments", prepare=assignment_lookups, after_write=update_assets, progress=progress)
@@ -1,70 +1,55 @@
-import csv
-from datetime import datetime
-from io import TextIOWrapper
 from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from sqlalchemy import select
 from models import db, AssetDisposal, Asset
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from csv_import import import_csv, lookup_map, parse_keys, parse_date, parse_decimal, parse_int, RowError
+from jobs import import_or_queue
 
 # Create Blueprint
 asset_disposal_bp = Blueprint("asset_disposal", __name__)
 
+# Allowed disposal methods (from the AssetDisposal.method enum)
+DISPOSAL_METHODS = AssetDisposal.__table__.c.method.type.enums
+
+# Register the disposals table with the shared list engine
+disposal_list = ListQuery(
+	AssetDisposal,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"disposal_id": AssetDisposal.disposal_id,
+		"asset_id": AssetDisposal.asset_id,
+		"disposal_date": AssetDisposal.disposal_date,
+		"method": AssetDisposal.method,
+		"sale_value": AssetDisposal.sale_value,
+		"notes": AssetDisposal.notes,
+	},
+	searchable=[
+		AssetDisposal.disposal_id,
+		Asset.asset_tag,
+		Asset.name,
+		AssetDisposal.method,
+		AssetDisposal.sale_value,
+		AssetDisposal.notes,
+		AssetDisposal.disposal_date,
+	],
+	# Create a join to query AssetDisposal and Asset tables
+	base_query=lambda: AssetDisposal.query.join(Asset, AssetDisposal.asset_id == Asset.asset_id),
+	# Fill the asset relationship from the joined rows
+	load_options=[db.contains_eager(AssetDisposal.asset)],
+)
+
 # Define main page
 @asset_disposal_bp.route("/asset_disposals", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def asset_disposals():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE asset_disposals AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# Look up related foreign keys by name if given
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY EXIST IN THEIR RESPECTIVE TABLES
-					asset = (
-						Asset.query.filter_by(asset_id=row.get("asset_id")).first()
-						if row.get("asset_id") else None
-					)
-
-					# Parse dates and numbers
-					disposal_date = (
-						datetime.strptime(row.get("disposal_date"), "%Y-%m-%d").date()
-						if row.get("disposal_date") else None
-					)
-					sale_value = (
-						float(row.get("sale_value")) if row.get("sale_value") else None
-					)
-
-					# Only add disposal records if the asset exists and disposal_date is valid
-					if asset and disposal_date:
-						disposal = AssetDisposal(
-							asset_id=asset.asset_id,
-							disposal_date=disposal_date,
-							method=row.get("method"),
-							sale_value=sale_value,
-							notes=row.get("notes"),
-						)
-						db.session.add(disposal)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} asset disposals from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			import_or_queue(import_asset_disposals_csv, file, "asset disposals")
 			return redirect("/asset_disposals")
 
 		# Manual form entry
@@ -99,39 +84,15 @@ def asset_disposals():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	assets = Asset.query.order_by(Asset.name).all()
-
-	# Handle sorting
-	sort = request.args.get("sort", "disposal_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"disposal_id": AssetDisposal.disposal_id,
-		"asset_id": AssetDisposal.asset_id,
-		"disposal_date": AssetDisposal.disposal_date,
-		"method": AssetDisposal.method,
-		"sale_value": AssetDisposal.sale_value,
-		"notes": AssetDisposal.notes,
-	}
-
-	sort_column = valid_columns.get(sort, AssetDisposal.disposal_id)
-
-	# Apply search if necessary
-	disposals = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		disposals = disposals.order_by(sort_column.desc())
-	else:
-		disposals = disposals.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = disposal_list.page(request.args)
 
 	return render_template(
 		"asset_disposals.html",
-		disposals=disposals,
-		assets=assets,
-		sort=sort,
-		direction=direction
+		disposals=page.items,
+		page=page,
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -177,21 +138,50 @@ def edit_asset_disposal(disposal_id):
 	return redirect("/asset_disposals")
 
 
-# Search function
-def search_for(search):
-	# Create a join to query AssetDisposal and Asset tables
-	query = AssetDisposal.query.join(Asset, AssetDisposal.asset_id == Asset.asset_id)
-
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(AssetDisposal.disposal_id.cast(db.String).ilike(search_pattern)) |
-			(Asset.asset_tag.ilike(search_pattern)) |
-			(Asset.name.ilike(search_pattern)) |
-			(AssetDisposal.method.ilike(search_pattern)) |
-			(AssetDisposal.sale_value.cast(db.String).ilike(search_pattern)) |
-			(AssetDisposal.notes.ilike(search_pattern)) |
-			(AssetDisposal.disposal_date.cast(db.String).ilike(search_pattern))
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@asset_disposal_bp.route("/asset_disposals/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_asset_disposals():
+	return csv_response(
+		select(
+			AssetDisposal.disposal_id,
+			AssetDisposal.asset_id,
+			Asset.asset_tag,
+			AssetDisposal.disposal_date,
+			AssetDisposal.method,
+			AssetDisposal.sale_value,
+			AssetDisposal.notes,
 		)
+		.outerjoin(Asset, AssetDisposal.asset_id == Asset.asset_id)
+		.order_by(AssetDisposal.disposal_id),
+		"asset_disposals.csv"
+	)
+
+
+# Look up the assets referenced by a batch of CSV rows
+def disposal_lookups(rows):
+	return {
+		"assets": lookup_map(Asset.asset_id, Asset.asset_id, parse_keys(row.get("asset_id") for row in rows)),
+	}
+
 
-	return query
+# Import asset disposals from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY EXIST IN THEIR RESPECTIVE TABLES
+def import_asset_disposals_csv(file, progress=None):
+	def convert(row, lookups):
+		asset_id = parse_int(row.get("asset_id"), "asset_id")
+		disposal_date = parse_date(row.get("disposal_date"), "disposal_date")
+		if asset_id not in lookups["assets"] or not disposal_date:
+			return None
+		if row.get("method") not in DISPOSAL_METHODS:
+			raise RowError(f"invalid method '{row.get('method')}'")
+
+		return {
+			"asset_id": asset_id,
+			"disposal_date": disposal_date,
+			"method": row.get("method"),
+			"sale_value": parse_decimal(row.get("sale_value"), "sale_value"),
+			"notes": row.get("notes"),
+		}
+
+	return import_csv(file, AssetDisposal.__table__, convert, "asset disposals", prepare=disposal_lookups, progress=progress)
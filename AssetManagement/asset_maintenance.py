@@ -1,75 +1,55 @@
-import csv
-from datetime import datetime
-from io import TextIOWrapper
-from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from flask import Blueprint, render_template, redirect, request, flash, jsonify
+from sqlalchemy import select
 from models import db, AssetMaintenance, Asset
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from csv_import import import_csv, lookup_map, parse_keys, parse_date, parse_decimal, parse_int
+from jobs import import_or_queue
+from maintenance_schedule import refresh_next_due, due_queue, due_counts, DEFAULT_DAYS, MAX_DAYS, QUEUE_LIMIT
 
 # Create Blueprint
 asset_maintenance_bp = Blueprint("asset_maintenance", __name__)
 
+# Register the maintenances table with the shared list engine
+maintenance_list = ListQuery(
+	AssetMaintenance,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"maintenance_id": AssetMaintenance.maintenance_id,
+		"asset_id": AssetMaintenance.asset_id,
+		"maintenance_date": AssetMaintenance.maintenance_date,
+		"description": AssetMaintenance.description,
+		"performed_by": AssetMaintenance.performed_by,
+		"cost": AssetMaintenance.cost,
+		"next_due_date": AssetMaintenance.next_due_date,
+	},
+	searchable=[
+		AssetMaintenance.maintenance_id,
+		Asset.asset_tag,
+		Asset.name,
+		AssetMaintenance.description,
+		AssetMaintenance.performed_by,
+		AssetMaintenance.cost,
+		AssetMaintenance.maintenance_date,
+		AssetMaintenance.next_due_date,
+	],
+	# Create a join to query AssetMaintenance and Asset tables
+	base_query=lambda: AssetMaintenance.query.join(Asset, AssetMaintenance.asset_id == Asset.asset_id),
+	# Fill the asset relationship from the joined rows
+	load_options=[db.contains_eager(AssetMaintenance.asset)],
+)
+
 # Define main page
 @asset_maintenance_bp.route("/asset_maintenance", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def asset_maintenance():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE asset_maintenance AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# Look up related foreign keys by name if given
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY EXIST IN THEIR RESPECTIVE TABLES
-					asset = (
-						Asset.query.filter_by(asset_id=row.get("asset_id")).first()
-						if row.get("asset_id") else None
-					)
-
-					# Parse dates and numbers
-					maintenance_date = (
-						datetime.strptime(row.get("maintenance_date"), "%Y-%m-%d").date()
-						if row.get("maintenance_date") else None
-					)
-					next_due_date = (
-						datetime.strptime(row.get("next_due_date"), "%Y-%m-%d").date()
-						if row.get("next_due_date") else None
-					)
-					cost = (
-						float(row.get("cost")) if row.get("cost") else None
-					)
-
-					# Only add maintenance records if the asset exists and maintenance_date is valid
-					if asset and maintenance_date:
-						maintenance = AssetMaintenance(
-							asset_id=asset.asset_id,
-							maintenance_date=maintenance_date,
-							description=row.get("description"),
-							performed_by=row.get("performed_by"),
-							cost=cost,
-							next_due_date=next_due_date,
-						)
-						db.session.add(maintenance)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} asset maintenance records from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			import_or_queue(import_asset_maintenance_csv, file, "asset maintenance")
 			return redirect("/asset_maintenance")
 
 		# Manual form entry
@@ -95,6 +75,8 @@ def asset_maintenance():
 			)
 
 			db.session.add(new_record)
+			db.session.flush()
+			refresh_next_due([new_record.asset_id])
 			db.session.commit()
 			flash("Maintenance record added successfully!", "success")
 			return redirect("/asset_maintenance")
@@ -106,40 +88,15 @@ def asset_maintenance():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	assets = Asset.query.order_by(Asset.name).all()
-
-	# Handle sorting
-	sort = request.args.get("sort", "maintenance_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"maintenance_id": AssetMaintenance.maintenance_id,
-		"asset_id": AssetMaintenance.asset_id,
-		"maintenance_date": AssetMaintenance.maintenance_date,
-		"description": AssetMaintenance.description,
-		"performed_by": AssetMaintenance.performed_by,
-		"cost": AssetMaintenance.cost,
-		"next_due_date": AssetMaintenance.next_due_date,
-	}
-
-	sort_column = valid_columns.get(sort, AssetMaintenance.maintenance_id)
-
-	# Apply search if necessary
-	maintenances = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		maintenances = maintenances.order_by(sort_column.desc())
-	else:
-		maintenances = maintenances.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = maintenance_list.page(request.args)
 
 	return render_template(
 		"asset_maintenance.html",
-		maintenances=maintenances,
-		assets=assets,
-		sort=sort,
-		direction=direction
+		maintenances=page.items,
+		page=page,
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -149,6 +106,8 @@ def delete_asset_maintenance(maintenance_id):
 	record = AssetMaintenance.query.get(maintenance_id)
 	if record:
 		db.session.delete(record)
+		db.session.flush()
+		refresh_next_due([record.asset_id])
 		db.session.commit()
 	return redirect("/asset_maintenance")
 
@@ -176,6 +135,8 @@ def edit_asset_maintenance(maintenance_id):
 		record.performed_by = performed_by or None
 		record.cost = cost or None
 		record.next_due_date = next_due_date or None
+		db.session.flush()
+		refresh_next_due([record.asset_id])
 
 		# Update table
 		db.session.commit()
@@ -187,22 +148,67 @@ def edit_asset_maintenance(maintenance_id):
 	return redirect("/asset_maintenance")
 
 
-# Search function
-def search_for(search):
-	# Create a join to query AssetMaintenance and Asset tables
-	query = AssetMaintenance.query.join(Asset, AssetMaintenance.asset_id == Asset.asset_id)
-
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(AssetMaintenance.maintenance_id.cast(db.String).ilike(search_pattern)) |
-			(Asset.asset_tag.ilike(search_pattern)) |
-			(Asset.name.ilike(search_pattern)) |
-			(AssetMaintenance.description.ilike(search_pattern)) |
-			(AssetMaintenance.performed_by.ilike(search_pattern)) |
-			(AssetMaintenance.cost.cast(db.String).ilike(search_pattern)) |
-			(AssetMaintenance.maintenance_date.cast(db.String).ilike(search_pattern)) |
-			(AssetMaintenance.next_due_date.cast(db.String).ilike(search_pattern))
+# Assets overdue or due for maintenance within ?days= (default 30), most overdue first
+@asset_maintenance_bp.route("/asset_maintenance/due", methods=["GET"])
+@role_required("admin", "manager")
+def maintenance_due():
+	days = min(max(request.args.get("days", DEFAULT_DAYS, type=int), 0), MAX_DAYS)
+	limit = min(max(request.args.get("limit", QUEUE_LIMIT, type=int), 1), QUEUE_LIMIT)
+	return jsonify({
+		"days": days,
+		**due_counts(days),
+		"assets": due_queue(days, limit),
+	})
+
+
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@asset_maintenance_bp.route("/asset_maintenance/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_asset_maintenance():
+	return csv_response(
+		select(
+			AssetMaintenance.maintenance_id,
+			AssetMaintenance.asset_id,
+			Asset.asset_tag,
+			AssetMaintenance.maintenance_date,
+			AssetMaintenance.description,
+			AssetMaintenance.performed_by,
+			AssetMaintenance.cost,
+			AssetMaintenance.next_due_date,
 		)
+		.outerjoin(Asset, AssetMaintenance.asset_id == Asset.asset_id)
+		.order_by(AssetMaintenance.maintenance_id),
+		"asset_maintenance.csv"
+	)
+
+
+# Look up the assets referenced by a batch of CSV rows
+def maintenance_lookups(rows):
+	return {
+		"assets": lookup_map(Asset.asset_id, Asset.asset_id, parse_keys(row.get("asset_id") for row in rows)),
+	}
+
 
-	return query
\ No newline at end of file
+# Import asset maintenance records from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY EXIST IN THEIR RESPECTIVE TABLES
+def import_asset_maintenance_csv(file, progress=None):
+	def convert(row, lookups):
+		asset_id = parse_int(row.get("asset_id"), "asset_id")
+		maintenance_date = parse_date(row.get("maintenance_date"), "maintenance_date")
+		if asset_id not in lookups["assets"] or not maintenance_date:
+			return None
+
+		return {
+			"asset_id": asset_id,
+			"maintenance_date": maintenance_date,
+			"description": row.get("description"),
+			"performed_by": row.get("performed_by"),
+			"cost": parse_decimal(row.get("cost"), "cost"),
+			"next_due_date": parse_date(row.get("next_due_date"), "next_due_date"),
+		}
+
+	# Bring the next maintenance date of the batch's assets up to date
+	def update_assets(records):
+		refresh_next_due(record["asset_id"] for record in records)
+
+	return import_csv(file, AssetMaintenance.__table__, convert, "asset maintenance records", prepare=maintenance_lookups, after_write=update_assets, progress=progress)
@@ -1,56 +1,39 @@
-import csv
-from io import TextIOWrapper
-
 from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from sqlalchemy import select
 from models import db, AssetStatus
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from csv_import import import_csv, lookup_map, match_key
+from jobs import import_or_queue
 
 # Create Blueprint
 asset_status_bp = Blueprint("asset_status", __name__)
 
+# Register the statuses table with the shared list engine
+asset_status_list = ListQuery(
+	AssetStatus,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"status_id": AssetStatus.status_id,
+		"status_name": AssetStatus.status_name,
+	},
+	searchable=[
+		AssetStatus.status_id,
+		AssetStatus.status_name,
+	],
+)
+
 # Define main page
 @asset_status_bp.route("/asset_status", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def asset_statuses():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE asset_statuses AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
-					existing_status = (
-						AssetStatus.query.filter_by(status_name=row.get("status_name")).first()
-						if row.get("status_name") else None
-					)
-
-					# Only add status if it does not already exist
-					if not existing_status and row.get("status_name"):
-						status = AssetStatus(
-							status_name=row.get("status_name").strip(),
-						)
-						db.session.add(status)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} asset statuses from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			import_or_queue(import_asset_statuses_csv, file, "asset statuses")
 			return redirect("/asset_status")
 
 		# Manual form entry
@@ -76,32 +59,15 @@ def asset_statuses():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Handle sorting
-	sort = request.args.get("sort", "status_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"status_id": AssetStatus.status_id,
-		"status_name": AssetStatus.status_name,
-	}
-
-	sort_column = valid_columns.get(sort, AssetStatus.status_id)
-
-	# Apply search if necessary
-	statuses = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		statuses = statuses.order_by(sort_column.desc())
-	else:
-		statuses = statuses.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = asset_status_list.page(request.args)
 
 	return render_template(
 		"asset_status.html",
-		statuses=statuses,
-		sort=sort,
-		direction=direction
+		statuses=page.items,
+		page=page,
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -141,13 +107,35 @@ def edit_asset_status(status_id):
 	return redirect("/asset_status")
 
 
-# Search function
-def search_for(search):
-	query = AssetStatus.query
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(AssetStatus.status_id.ilike(search_pattern)) |
-			(AssetStatus.status_name.ilike(search_pattern))
-		)
-	return query
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@asset_status_bp.route("/asset_status/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_asset_statuses():
+	return csv_response(
+		select(AssetStatus.status_id, AssetStatus.status_name)
+		.order_by(AssetStatus.status_id),
+		"asset_statuses.csv"
+	)
+
+
+# Look up the existing statuses referenced by a batch of CSV rows
+def asset_status_lookups(rows):
+	return {
+		"statuses": lookup_map(AssetStatus.status_name, AssetStatus.status_id, ((row.get("status_name") or "").strip() for row in rows)),
+	}
+
+
+# Import asset statuses from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
+def import_asset_statuses_csv(file, progress=None):
+	seen = set()
+
+	def convert(row, lookups):
+		status_name = (row.get("status_name") or "").strip()
+		if not status_name or match_key(status_name) in lookups["statuses"] or match_key(status_name) in seen:
+			return None
+		seen.add(match_key(status_name))
+
+		return {"status_name": status_name}
+
+	return import_csv(file, AssetStatus.__table__, convert, "asset statuses", prepare=asset_status_lookups, progress=progress)
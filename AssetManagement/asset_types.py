@@ -1,61 +1,45 @@
-import csv
-from io import TextIOWrapper
-
 from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from sqlalchemy import select
 from models import db, AssetType
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from csv_import import import_csv, lookup_map, match_key, parse_int, RowError
+from depreciation import METHODS, DEFAULT_METHOD
+from jobs import import_or_queue
 
 # Create Blueprint
 asset_type_bp = Blueprint("asset_type", __name__)
 
+# Register the asset types table with the shared list engine
+asset_type_list = ListQuery(
+	AssetType,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"asset_type_id": AssetType.asset_type_id,
+		"name": AssetType.name,
+		"category": AssetType.category,
+		"description": AssetType.description,
+	},
+	searchable=[
+		AssetType.asset_type_id,
+		AssetType.name,
+		AssetType.category,
+		AssetType.description,
+	],
+)
+
 # Define main page
 @asset_type_bp.route("/asset_type", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def asset_types():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE asset_types AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# Check for existing asset type by name to avoid duplicates
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
-					asset_type = (
-						AssetType.query.filter_by(name=row.get("name").strip()).first()
-						if row.get("name") else None
-					)
-
-					# Only add asset type if it does not already exist
-					if not asset_type:
-						asset_type = AssetType(
-							name=row.get("name").strip(),
-							category=row.get("category")
-							if row.get("category") in ["Tangible", "Intangible"] else None,
-							description=row.get("description"),
-						)
-						db.session.add(asset_type)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} asset types from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			import_or_queue(import_asset_types_csv, file, "asset types")
 			return redirect("/asset_type")
 
 		# Manual form entry
@@ -68,10 +52,13 @@ def asset_types():
 			return redirect("/asset_type")
 
 		try:
+			depreciation_method, useful_life_years = depreciation_settings(request.form)
 			new_asset = AssetType(
 				name=name,
 				category=category,
-				description=description
+				description=description,
+				depreciation_method=depreciation_method,
+				useful_life_years=useful_life_years
 			)
 
 			db.session.add(new_asset)
@@ -86,34 +73,15 @@ def asset_types():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Handle sorting
-	sort = request.args.get("sort", "asset_type_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"asset_type_id": AssetType.asset_type_id,
-		"name": AssetType.name,
-		"category": AssetType.category,
-		"description": AssetType.description,
-	}
-
-	sort_column = valid_columns.get(sort, AssetType.asset_type_id)
-
-	# Apply search if necessary
-	asset_types = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		asset_types = asset_types.order_by(sort_column.desc())
-	else:
-		asset_types = asset_types.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = asset_type_list.page(request.args)
 
 	return render_template(
 		"asset_type.html",
-		asset_types=asset_types,
-		sort=sort,
-		direction=direction
+		asset_types=page.items,
+		page=page,
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -146,6 +114,7 @@ def edit_asset_type(asset_type_id):
 		record.name = new_name
 		record.category = new_category
 		record.description = new_description
+		record.depreciation_method, record.useful_life_years = depreciation_settings(request.form)
 
 		# Update table
 		db.session.commit()
@@ -157,17 +126,55 @@ def edit_asset_type(asset_type_id):
 	return redirect("/asset_type")
 
 
-# Search function
-def search_for(search):
-	query = AssetType.query
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(AssetType.asset_type_id.ilike(search_pattern)) |
-			(AssetType.name.ilike(search_pattern)) |
-			(AssetType.category.ilike(search_pattern)) |
-			(AssetType.description.ilike(search_pattern))
-		)
-	return query
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@asset_type_bp.route("/asset_type/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_asset_types():
+	return csv_response(
+		select(AssetType.asset_type_id, AssetType.name, AssetType.category, AssetType.description, AssetType.depreciation_method, AssetType.useful_life_years)
+		.order_by(AssetType.asset_type_id),
+		"asset_types.csv"
+	)
+
+
+# Depreciation method and useful life from a form or CSV row (a blank life uses the default)
+def depreciation_settings(values):
+	method = (values.get("depreciation_method") or "").strip() or DEFAULT_METHOD
+	if method not in METHODS:
+		raise RowError(f"invalid depreciation_method '{method}'")
+	life = parse_int((values.get("useful_life_years") or "").strip(), "useful_life_years")
+	if life is not None and life <= 0:
+		raise RowError(f"invalid useful_life_years '{life}'")
+	return method, life
+
+
+# Look up the existing asset types referenced by a batch of CSV rows
+def asset_type_lookups(rows):
+	return {
+		"asset_types": lookup_map(AssetType.name, AssetType.asset_type_id, ((row.get("name") or "").strip() for row in rows)),
+	}
 
 
+# Import asset types from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
+def import_asset_types_csv(file, progress=None):
+	seen = set()
+
+	def convert(row, lookups):
+		name = (row.get("name") or "").strip()
+		if not name or match_key(name) in lookups["asset_types"] or match_key(name) in seen:
+			return None
+		if row.get("category") not in ["Tangible", "Intangible"]:
+			raise RowError(f"invalid category '{row.get('category')}'")
+		depreciation_method, useful_life_years = depreciation_settings(row)
+		seen.add(match_key(name))
+
+		return {
+			"name": name,
+			"category": row.get("category"),
+			"description": row.get("description"),
+			"depreciation_method": depreciation_method,
+			"useful_life_years": useful_life_years,
+		}
+
+	return import_csv(file, AssetType.__table__, convert, "asset types", prepare=asset_type_lookups, progress=progress)
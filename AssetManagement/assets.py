@@ -1,75 +1,65 @@
-import csv
-from datetime import datetime
-from io import TextIOWrapper, StringIO
-from flask import Blueprint, render_template, redirect, request, flash, Response
-from sqlalchemy import text
+from datetime import date, datetime
+from flask import Blueprint, render_template, redirect, request, flash, jsonify
+from sqlalchemy import select
 from models import db, Asset, AssetType, AssetStatus, Location, Vendor, Employee, AssetAssignment
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from lookups import asset_type_options, status_options, location_options, vendor_options, employee_options, asset_matches
+from search_index import index_assets, remove_assets, search_assets
+from csv_import import import_csv, file_columns, lookup_map, match_key, resolve_name, parse_date, parse_decimal, parse_int, RowError
+from jobs import import_or_queue
+from custody import holder_on
+from reconciliation import reassign
 
 # Create Blueprint
 assets_bp = Blueprint("assets", __name__)
 
+# Register the assets table with the shared list engine
+asset_list = ListQuery(
+	Asset,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"asset_id": Asset.asset_id,
+		"asset_tag": Asset.asset_tag,
+		"name": Asset.name,
+		"description": Asset.description,
+		"asset_type_id": Asset.asset_type_id,
+		"status_id": Asset.status_id,
+		"location_id": Asset.location_id,
+		"assigned_to": Asset.assigned_to,
+		"purchase_date": Asset.purchase_date,
+		"purchase_cost": Asset.purchase_cost,
+		"vendor_id": Asset.vendor_id,
+		"warranty_expiry": Asset.warranty_expiry,
+		"serial_number": Asset.serial_number,
+		"created_at": Asset.created_at,  # TODO Maybe add to sort and table?
+		"updated_at": Asset.updated_at,  # TODO Maybe add to sort and table?
+	},
+	# Search uses the asset search index instead of matching every column
+	search=search_assets,
+	# Load the related rows shown in the table with one query per relationship
+	load_options=[
+		db.selectinload(Asset.asset_type),
+		db.selectinload(Asset.status),
+		db.selectinload(Asset.location),
+		db.selectinload(Asset.vendor),
+		db.selectinload(Asset.assigned_employee),
+	],
+)
+
 # Define main page
 @assets_bp.route("/assets", methods=["GET", "POST"])
 @role_required("admin", "manager", "user")
 def assets():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE assets AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# Parse dates and numbers
-					purchase_date = (
-						datetime.strptime(row.get("purchase_date"), "%Y-%m-%d").date()
-						if row.get("purchase_date") else None
-					)
-					warranty_expiry = (
-						datetime.strptime(row.get("warranty_expiry"), "%Y-%m-%d").date()
-						if row.get("warranty_expiry") else None
-					)
-					purchase_cost = (
-						float(row.get("purchase_cost")) if row.get("purchase_cost") else None
-					)
-
-					# Build asset DB entry and queue for commit
-					asset = Asset(
-						asset_tag=row.get("asset_tag", "").strip(),
-						name=row.get("name", "").strip(),
-						description=row.get("description"),
-						purchase_date=purchase_date,
-						purchase_cost=purchase_cost,
-						serial_number=row.get("serial_number"),
-						warranty_expiry=warranty_expiry,
-						asset_type_id=int(row.get("asset_type_id")) if row.get("asset_type_id") else None,
-						status_id=int(row.get("status_id")) if row.get("status_id") else None,
-						location_id=int(row.get("location_id")) if row.get("location_id") else None,
-						vendor_id=int(row.get("vendor_id")) if row.get("vendor_id") else None,
-						assigned_to=int(row.get("assigned_to")) if row.get("assigned_to") else None,
-					)
-					db.session.add(asset)
-					count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} assets from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			upsert = request.form.get("import_mode") == "upsert"
+			import_or_queue(import_assets_csv, file, "assets", upsert=upsert)
 			return redirect("/assets")
 
 		# For manual form submission
@@ -119,11 +109,16 @@ def assets():
 				status_id=int(status_id) if status_id else None,
 				location_id=int(location_id) if location_id else None,
 				vendor_id=int(vendor_id) if vendor_id else None,
-				assigned_to=int(assigned_to) if assigned_to else None,
 			)
 
-			# Update table
+			# Update table and search index
 			db.session.add(new_asset)
+			db.session.flush()
+			index_assets([new_asset.asset_id])
+
+			# The holder is recorded as an assignment from today, which sets assigned_to
+			if assigned_to:
+				reassign({new_asset.asset_id: int(assigned_to)})
 
 			# commit entry and alert user
 			db.session.commit()
@@ -137,59 +132,28 @@ def assets():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Query related tables for dropdowns
-	asset_types = AssetType.query.order_by(AssetType.name).all()
-	statuses = AssetStatus.query.order_by(AssetStatus.status_name).all()
-	locations = Location.query.order_by(Location.name).all()
-	vendors = Vendor.query.order_by(Vendor.name).all()
-	employees = Employee.query.order_by(Employee.last_name, Employee.first_name).all()
-
-	# Get arguments for sorting & searching
-	sort = request.args.get("sort", "asset_id")  # Default sort column
-	direction = request.args.get("direction", "asc")  # Default sort direction
-	search = request.args.get("search", None)
-
-	# Define valid columns to avoid SQL injection attacks
-	valid_columns = {
-		"asset_id": Asset.asset_id,
-		"asset_tag": Asset.asset_tag,
-		"name": Asset.name,
-		"description": Asset.description,
-		"asset_type_id": Asset.asset_type_id,
-		"status_id": Asset.status_id,
-		"location_id": Asset.location_id,
-		"assigned_to": Asset.assigned_to,
-		"purchase_date": Asset.purchase_date,
-		"purchase_cost": Asset.purchase_cost,
-		"vendor_id": Asset.vendor_id,
-		"warranty_expiry": Asset.warranty_expiry,
-		"serial_number": Asset.serial_number,
-		"created_at": Asset.created_at,  # TODO Maybe add to sort and table?
-		"updated_at": Asset.updated_at,  # TODO Maybe add to sort and table?
-	}
-
-	sort_column = valid_columns.get(sort, Asset.asset_id)
+	# Cached option lists for dropdowns (see lookups.py)
+	asset_types = asset_type_options()
+	statuses = status_options()
+	locations = location_options()
+	vendors = vendor_options()
+	employees = employee_options()
 
-	# Apply search if necessary
-	assets = search_for(search)
+	# Fetch one page of the table using the shared list engine
+	page = asset_list.page(request.args)
 
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		assets = assets.order_by(sort_column.desc())
-	else:
-		assets = assets.order_by(sort_column.asc())
-
-	# Display table of all assets and data entry forms
+	# Display one page of assets and data entry forms
 	return render_template(
 		"assets.html",
-		assets=assets,
+		assets=page.items,
+		page=page,
 		asset_types=asset_types,
 		statuses=statuses,
 		locations=locations,
 		vendors=vendors,
 		employees=employees,
-		sort=sort,
-		direction=direction
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -198,6 +162,7 @@ def assets():
 def delete_asset(asset_id):
 	asset = Asset.query.get(asset_id)
 	if asset:
+		remove_assets([asset_id])
 		db.session.delete(asset)
 		db.session.commit()
 	return redirect("/assets")
@@ -234,14 +199,18 @@ def edit_asset(asset_id):
 		record.asset_type_id = asset_type_id or None
 		record.status_id = status_id or None
 		record.location_id = location_id or None
-		record.assigned_to = assigned_to or None
 		record.purchase_date = purchase_date or None
 		record.purchase_cost = purchase_cost or None
 		record.vendor_id = vendor_id or None
 		record.warranty_expiry = warranty_expiry or None
 		record.serial_number = serial_number or None
 
-		# Update table
+		# A new holder returns the open assignment and starts one from today, which sets assigned_to
+		reassign({asset_id: int(assigned_to) if assigned_to else None})
+
+		# Update table and search index
+		db.session.flush()
+		index_assets([asset_id])
 		db.session.commit()
 		flash("Asset updated successfully!", "success")
 	except Exception as e:
@@ -250,67 +219,144 @@ def edit_asset(asset_id):
 
 	return redirect("/assets")
 
+# Edit form for a single asset, loaded on demand by the assets page
+@assets_bp.route("/assets/edit_form/<int:asset_id>", methods=["GET"])
+@role_required("admin", "manager")
+def edit_asset_form(asset_id):
+	asset = Asset.query.get_or_404(asset_id)
+	holder = holder_on(asset_id, date.today())
+
+	return render_template(
+		"asset_edit_form.html",
+		asset=asset,
+		holder_id=holder["employee_id"] if holder else None,
+		asset_types=asset_type_options(),
+		statuses=status_options(),
+		locations=location_options(),
+		vendors=vendor_options(),
+		employees=employee_options(),
+	)
+
+# Assets whose tag or name starts with ?q=, for the asset pickers on other pages (see asset_picker.html)
+@assets_bp.route("/assets/lookup", methods=["GET"])
+@role_required("admin", "manager", "user")
+def asset_lookup():
+	query = request.args.get("q", "").strip()
+	if not query:
+		return jsonify([])
+	return jsonify(asset_matches(query))
+
 
 
 
-# Export CSV
+# Export CSV, streamed in batches from a single joined query
 @assets_bp.route("/assets/export", methods=["GET", "POST"])
 @role_required("admin")
 def export_assets():
-	assets = Asset.query.all()
-	output = StringIO()
-	# Create writer and define field names for output file
-	writer = csv.DictWriter(output, fieldnames=[
-		"asset_tag", "name", "description", "asset_type", "status",
-		"location", "assigned_to", "purchase_date", "purchase_cost",
-		"vendor", "warranty_expiry", "serial_number"
-	])
-	writer.writeheader()
-
-	# Loop through all entries and add them to the output file
-	for a in assets:
-		writer.writerow({
-			"asset_tag": a.asset_tag,
-			"name": a.name,
-			"description": a.description or "",
-			"asset_type": a.asset_type.name if a.asset_type else "",
-			"status": a.status.status_name if a.status else "",
-			"location": a.location.name if a.location else "",
-			"assigned_to": a.assigned_to if a.assigned_to else "",
-			"purchase_date": a.purchase_date.strftime("%Y-%m-%d") if a.purchase_date else "",
-			"purchase_cost": str(a.purchase_cost) if a.purchase_cost else "",
-			"vendor": a.vendor.name if a.vendor else "",
-			"warranty_expiry": a.warranty_expiry.strftime("%Y-%m-%d") if a.warranty_expiry else "",
-			"serial_number": a.serial_number or "",
-		})
-
-	# Reset output pointer to read whole output
-	output.seek(0)
-	return Response(
-		output.getvalue(),
-		mimetype="text/csv",
-		headers={"Content-Disposition": "attachment;filename=assets.csv"}
+	return csv_response(
+		select(
+			Asset.asset_tag,
+			Asset.name,
+			Asset.description,
+			AssetType.name.label("asset_type"),
+			AssetStatus.status_name.label("status"),
+			Location.name.label("location"),
+			Asset.assigned_to,
+			Asset.purchase_date,
+			Asset.purchase_cost,
+			Vendor.name.label("vendor"),
+			Asset.warranty_expiry,
+			Asset.serial_number,
+		)
+		.outerjoin(AssetType, Asset.asset_type_id == AssetType.asset_type_id)
+		.outerjoin(AssetStatus, Asset.status_id == AssetStatus.status_id)
+		.outerjoin(Location, Asset.location_id == Location.location_id)
+		.outerjoin(Vendor, Asset.vendor_id == Vendor.vendor_id)
+		.order_by(Asset.asset_id),
+		"assets.csv"
 	)
 
 
-# Search function
-def search_for(search):
-	# Create a join to query Assets, Vendor, Location, AssetType, and AssetStatus tables
-	query = Asset.query.join(Vendor, isouter=True).join(Location, isouter=True).join(AssetType, isouter=True).join(AssetStatus, isouter=True)
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(Asset.asset_tag.ilike(search_pattern)) |
-			(Asset.name.ilike(search_pattern)) |
-			(Asset.description.ilike(search_pattern)) |
-			(Asset.serial_number.ilike(search_pattern)) |
-			(Asset.purchase_date.ilike(search_pattern)) |
-			(Asset.purchase_cost.ilike(search_pattern)) |
-			(Asset.warranty_expiry.ilike(search_pattern)) |
-			(AssetStatus.status_name.ilike(search_pattern)) |
-			(Vendor.name.ilike(search_pattern)) |
-			(Location.name.ilike(search_pattern)) |
-			(AssetType.name.ilike(search_pattern))
+# Foreign keys an asset CSV can give as an ID or, as the export writes them, by name:
+# (column, name column in the CSV, lookup name)
+NAMED_COLUMNS = [
+	("asset_type_id", "asset_type", "asset_types"),
+	("status_id", "status", "statuses"),
+	("location_id", "location", "locations"),
+	("vendor_id", "vendor", "vendors"),
+]
 
-		)
-	return query
\ No newline at end of file
+
+# Look up the names and existing holders referenced by a batch of CSV rows
+def asset_lookups(rows):
+	def names(field):
+		return ((row.get(field) or "").strip() for row in rows)
+
+	return {
+		"asset_types": lookup_map(AssetType.name, AssetType.asset_type_id, names("asset_type")),
+		"statuses": lookup_map(AssetStatus.status_name, AssetStatus.status_id, names("status")),
+		"locations": lookup_map(Location.name, Location.location_id, names("location")),
+		"vendors": lookup_map(Vendor.name, Vendor.vendor_id, names("vendor")),
+		"holders": lookup_map(Asset.asset_tag, Asset.assigned_to, names("asset_tag")),
+	}
+
+
+# Convert one CSV row into asset column values
+def asset_from_csv(row, lookups=None):
+	asset_tag = (row.get("asset_tag") or "").strip()
+	name = (row.get("name") or "").strip()
+	if not asset_tag or not name:
+		raise RowError("asset_tag and name are required")
+
+	record = {
+		"asset_tag": asset_tag,
+		"name": name,
+		"description": row.get("description") or None,
+		"purchase_date": parse_date(row.get("purchase_date"), "purchase_date"),
+		"purchase_cost": parse_decimal(row.get("purchase_cost"), "purchase_cost"),
+		"serial_number": row.get("serial_number") or None,
+		"warranty_expiry": parse_date(row.get("warranty_expiry"), "warranty_expiry"),
+		"assigned_to": parse_int(row.get("assigned_to"), "assigned_to"),
+	}
+	for column, name_column, lookup in NAMED_COLUMNS:
+		if column in row or not lookups:
+			record[column] = parse_int(row.get(column), column)
+		else:
+			record[column] = resolve_name(lookups[lookup], row.get(name_column), name_column)
+	return record
+
+
+# Import assets from an uploaded CSV file using batched inserts.
+# With upsert, assets whose asset_tag already exists are updated from the file instead, and only in the
+# columns the file has. A blank assigned_to keeps the asset's holder; a new one is recorded as an assignment.
+def import_assets_csv(file, progress=None, upsert=False):
+	seen = set()
+	given_holders = {}
+	sources = {column: (column, name_column) for column, name_column, _ in NAMED_COLUMNS}
+
+	# A tag repeated within the file would be inserted twice in upsert mode, so only its first row is used
+	def convert(row, lookups):
+		record = asset_from_csv(row, lookups)
+		if record["assigned_to"] is not None:
+			given_holders[record["asset_tag"]] = record["assigned_to"]
+		if upsert:
+			if match_key(record["asset_tag"]) in seen:
+				raise RowError(f"duplicate asset_tag '{record['asset_tag']}'")
+			seen.add(match_key(record["asset_tag"]))
+			record = file_columns(row, record, sources)
+			if "assigned_to" in record and record["assigned_to"] is None:
+				record["assigned_to"] = lookups["holders"].get(match_key(record["asset_tag"]))
+		return record
+
+	# Look up the new and updated asset IDs by tag, (re)index them for search and record the holders given
+	# in the file as assignments (see reassign in reconciliation.py)
+	def index_batch(records):
+		tags = [record["asset_tag"] for record in records]
+		asset_ids = {match_key(tag): asset_id for tag, asset_id in db.session.execute(select(Asset.asset_tag, Asset.asset_id).where(Asset.asset_tag.in_(tags)))}
+		index_assets(list(asset_ids.values()))
+		reassign({
+			asset_ids[match_key(tag)]: given_holders.pop(tag)
+			for tag in tags if tag in given_holders and match_key(tag) in asset_ids
+		})
+
+	return import_csv(file, Asset.__table__, convert, "assets", prepare=asset_lookups, after_write=index_batch, progress=progress, upsert_key="asset_tag" if upsert else None)
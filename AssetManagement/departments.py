@@ -1,63 +1,49 @@
-import csv
-from io import TextIOWrapper
-
 from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from sqlalchemy import select
 from models import db, Department, Employee
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from lookups import employee_options
+from csv_import import import_csv, file_columns, lookup_map, match_key, resolve_name, RowError
+from jobs import import_or_queue
 
 # Create Blueprint
 department_bp = Blueprint("department", __name__)
 
+# Register the departments table with the shared list engine
+department_list = ListQuery(
+	Department,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"department_id": Department.department_id,
+		"name": Department.name,
+		"manager_id": Department.manager_id,
+	},
+	searchable=[
+		Department.department_id,
+		Department.name,
+		Department.manager_id,
+		Employee.first_name,
+		Employee.last_name,
+	],
+	# Create a join to query Department and Employee tables
+	base_query=lambda: Department.query.join(Employee, Department.manager_id == Employee.employee_id, isouter=True),
+	# Fill each department's manager from the joined row
+	load_options=[db.contains_eager(Department.manager)],
+)
+
 # Define main page
 @department_bp.route("/departments", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def departments():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE departments AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# Look up manager by email if provided
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
-					manager = (
-						Employee.query.filter_by(email=row.get("manager_email")).first()
-						if row.get("manager_email") else None
-					)
-
-					existing_department = (
-						Department.query.filter_by(name=row.get("name")).first()
-						if row.get("name") else None
-					)
-
-					# Only add department if it does not exist already
-					if not existing_department and row.get("name"):
-						department = Department(
-							name=row.get("name").strip(),
-							manager_id=manager.employee_id if manager else None,
-						)
-						db.session.add(department)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} departments from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			upsert = request.form.get("import_mode") == "upsert"
+			import_or_queue(import_departments_csv, file, "departments", upsert=upsert)
 			return redirect("/departments")
 
 		# Manual form entry
@@ -91,38 +77,20 @@ def departments():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Handle sorting
-	sort = request.args.get("sort", "department_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"department_id": Department.department_id,
-		"name": Department.name,
-		"manager_id": Department.manager_id,
-	}
-
-	sort_column = valid_columns.get(sort, Department.department_id)
-
-	# Apply search if necessary
-	departments = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		departments = departments.order_by(sort_column.desc())
-	else:
-		departments = departments.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = department_list.page(request.args)
 
-	# Preload employees for dropdowns and manager display
-	employees = Employee.query.order_by(Employee.first_name, Employee.last_name).all()
+	# Cached employee list for the add form's manager dropdown (see lookups.py)
+	employees = employee_options()
 
 	# Display table
 	return render_template(
 		"departments.html",
-		departments=departments,
+		departments=page.items,
+		page=page,
 		employees=employees,
-		sort=sort,
-		direction=direction
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -164,22 +132,63 @@ def edit_department(department_id):
 
 	return redirect("/departments")
 
+# Edit form for a single department, loaded on demand by the departments page
+@department_bp.route("/departments/edit_form/<int:department_id>", methods=["GET"])
+@role_required("admin", "manager")
+def edit_department_form(department_id):
+	department = Department.query.get_or_404(department_id)
 
+	return render_template(
+		"department_edit_form.html",
+		department=department,
+		employees=employee_options(),
+	)
+
+
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@department_bp.route("/departments/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_departments():
+	return csv_response(
+		select(Department.department_id, Department.name, Department.manager_id, Employee.email.label("manager_email"))
+		.outerjoin(Employee, Department.manager_id == Employee.employee_id)
+		.order_by(Department.department_id),
+		"departments.csv"
+	)
 
-# Search function
-def search_for(search):
-	# Create a join to query Department and Employee tables
-	query = Department.query.join(Employee, Department.manager_id == Employee.employee_id, isouter=True)
 
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(Department.department_id.cast(db.String).ilike(search_pattern)) |
-			(Department.name.ilike(search_pattern)) |
-			(Department.manager_id.cast(db.String).ilike(search_pattern)) |
-			(Employee.first_name.ilike(search_pattern)) |
-			(Employee.last_name.ilike(search_pattern))
-		)
+# Look up the managers and existing departments referenced by a batch of CSV rows
+def department_lookups(rows):
+	return {
+		"managers": lookup_map(Employee.email, Employee.employee_id, ((row.get("manager_email") or "").strip() for row in rows)),
+		"departments": lookup_map(Department.name, Department.department_id, ((row.get("name") or "").strip() for row in rows)),
+	}
 
-	return query
 
+# Import departments from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST, unless upsert is set: then existing departments
+# (matched by name) are updated from the file, in the columns the file has
+def import_departments_csv(file, progress=None, upsert=False):
+	seen = set()
+
+	def convert(row, lookups):
+		name = (row.get("name") or "").strip()
+		if not name or (match_key(name) in lookups["departments"] and not upsert):
+			return None
+		if match_key(name) in seen:
+			raise RowError(f"duplicate name '{name}'")
+		seen.add(match_key(name))
+
+		# An upsert rejects unknown manager emails rather than clearing the department's manager
+		if upsert:
+			manager_id = resolve_name(lookups["managers"], row.get("manager_email"), "manager_email")
+		else:
+			manager_id = lookups["managers"].get(match_key((row.get("manager_email") or "").strip()))
+
+		record = {
+			"name": name,
+			"manager_id": manager_id,
+		}
+		return file_columns(row, record, {"manager_id": ("manager_email",)}) if upsert else record
+
+	return import_csv(file, Department.__table__, convert, "departments", prepare=department_lookups, progress=progress, upsert_key="name" if upsert else None)
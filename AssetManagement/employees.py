@@ -1,68 +1,56 @@
-import csv
-from io import TextIOWrapper, StringIO
-from flask import Blueprint, render_template, redirect, request, flash, Response
-from sqlalchemy import text
+from flask import Blueprint, render_template, redirect, request, flash
+from sqlalchemy import select
 from models import db, Employee, Department
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from lookups import department_options
+from csv_import import import_csv, file_columns, lookup_map, match_key, resolve_name, parse_int, RowError
+from jobs import import_or_queue
 
 # Create Blueprint
 employee_bp = Blueprint("employee", __name__)
 
+# Register the employees table with the shared list engine
+employee_list = ListQuery(
+	Employee,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"employee_id": Employee.employee_id,
+		"first_name": Employee.first_name,
+		"last_name": Employee.last_name,
+		"email": Employee.email,
+		"phone": Employee.phone,
+		"role": Employee.role,
+		"status": Employee.status,
+		"department_id": Employee.department_id,
+	},
+	searchable=[
+		Employee.employee_id,
+		Employee.first_name,
+		Employee.last_name,
+		Employee.email,
+		Employee.phone,
+		Employee.role,
+		Employee.status,
+		Employee.department_id,
+	],
+	# Load the departments shown in the table with one query
+	load_options=[db.selectinload(Employee.department)],
+)
+
 # Define main page
 @employee_bp.route("/employees", methods=["GET", "POST"])
 @role_required("admin", "manager", "user")
 def employees():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE employees AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# Look up related foreign keys by name if given
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
-					department = (
-						Department.query.filter_by(name=row.get("department")).first()
-						if row.get("department") else None
-					)
-
-					existing_employee = (
-						Employee.query.filter_by(email=row.get("email")).first()
-						if row.get("email") else None
-					)
-
-					# Only add employees if they do not already exist
-					if not existing_employee and row.get("email"):
-						employee = Employee(
-							first_name=row.get("first_name", "").strip(),
-							last_name=row.get("last_name", "").strip(),
-							email=row.get("email", "").strip(),
-							phone=row.get("phone"),
-							role=row.get("role"),
-							status=row.get("status") if row.get("status") else "Active",
-							department_id=department.department_id if department else None,
-						)
-						db.session.add(employee)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} employees from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			upsert = request.form.get("import_mode") == "upsert"
+			import_or_queue(import_employees_csv, file, "employees", upsert=upsert)
 			return redirect("/employees")
 
 		# Manual form entry
@@ -107,44 +95,20 @@ def employees():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Query related tables for dropdowns
-	departments = Department.query.order_by(Department.name).all()
-
-	# Handle sorting
-	sort = request.args.get("sort", "employee_id")  # Default sort column
-	direction = request.args.get("direction", "asc")  # Default sort direction
-	search = request.args.get("search", None)
-
-	# Define valid columns to avoid SQL injection attacks
-	valid_columns = {
-		"employee_id": Employee.employee_id,
-		"first_name": Employee.first_name,
-		"last_name": Employee.last_name,
-		"email": Employee.email,
-		"phone": Employee.phone,
-		"role": Employee.role,
-		"status": Employee.status,
-		"department_id": Employee.department_id,
-	}
-
-	sort_column = valid_columns.get(sort, Employee.employee_id)
+	# Cached option lists for dropdowns (see lookups.py)
+	departments = department_options()
 
-	# Apply search if necessary
-	employees = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		employees = employees.order_by(sort_column.desc())
-	else:
-		employees = employees.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = employee_list.page(request.args)
 
 	# Display table
 	return render_template(
 		"employees.html",
-		employees=employees,
+		employees=page.items,
+		page=page,
 		departments=departments,
-		sort=sort,
-		direction=direction
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -195,52 +159,73 @@ def edit_employee(employee_id):
 
 	return redirect("/employees")
 
-# Export CSV
+# Export CSV, streamed in batches from a single joined query
 @employee_bp.route("/employees/export", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def export_employees():
-	employees = Employee.query.all()
-	output = StringIO()
-	# Create writer and define field names for output file
-	writer = csv.DictWriter(output, fieldnames=[
-		"employee_id", "first_name", "last_name", "email", "phone", "department_id", "role", "status"])
-	writer.writeheader()
-
-	# Loop through all entries and add them to the output file
-	for e in employees:
-		writer.writerow({
-			"employee_id": e.employee_id,
-			"first_name": e.first_name,
-			"last_name": e.last_name,
-			"email": e.email,
-			"phone": e.phone or "",
-			"department_id": e.department or "",
-			"role": e.role,
-			"status": e.status or "",
-		})
-
-	# Reset output pointer to read whole output
-	output.seek(0)
-	return Response(
-		output.getvalue(),
-		mimetype="text/csv",
-		headers={"Content-Disposition": "attachment;filename=employees.csv"}
+	return csv_response(
+		select(
+			Employee.employee_id,
+			Employee.first_name,
+			Employee.last_name,
+			Employee.email,
+			Employee.phone,
+			Employee.department_id,
+			Department.name.label("department"),
+			Employee.role,
+			Employee.status,
+		)
+		.outerjoin(Department, Employee.department_id == Department.department_id)
+		.order_by(Employee.employee_id),
+		"employees.csv"
 	)
 
-# Search function
-def search_for(search):
-	query = Employee.query
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(Employee.employee_id.ilike(search_pattern)) |
-			(Employee.first_name.ilike(search_pattern)) |
-			(Employee.last_name.ilike(search_pattern)) |
-			(Employee.email.ilike(search_pattern)) |
-			(Employee.phone.ilike(search_pattern)) |
-			(Employee.role.ilike(search_pattern)) |
-			(Employee.status.ilike(search_pattern)) |
-			(Employee.department_id.ilike(search_pattern))
-		)
 
-	return query
\ No newline at end of file
+# Look up the departments and existing employees referenced by a batch of CSV rows
+def employee_lookups(rows):
+	return {
+		"departments": lookup_map(Department.name, Department.department_id, ((row.get("department") or "").strip() for row in rows)),
+		"employees": lookup_map(Employee.email, Employee.employee_id, ((row.get("email") or "").strip() for row in rows)),
+	}
+
+
+# Import employees from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST, unless upsert is set: then existing employees
+# (matched by email) are updated from the file, in the columns the file has
+def import_employees_csv(file, progress=None, upsert=False):
+	seen = set()
+
+	def convert(row, lookups):
+		email = (row.get("email") or "").strip()
+		if not email or (match_key(email) in lookups["employees"] and not upsert):
+			return None
+		if match_key(email) in seen:
+			raise RowError(f"duplicate email '{email}'")
+		status = row.get("status") or "Active"
+		if status not in ("Active", "Inactive"):
+			raise RowError(f"invalid status '{status}'")
+		seen.add(match_key(email))
+
+		# The department is given by ID or, as the export also writes it, by name. An upsert rejects
+		# unknown names rather than clearing the employee's department.
+		if "department_id" in row:
+			department_id = parse_int(row.get("department_id"), "department_id")
+		elif upsert:
+			department_id = resolve_name(lookups["departments"], row.get("department"), "department")
+		else:
+			department_id = lookups["departments"].get(match_key((row.get("department") or "").strip()))
+
+		record = {
+			"first_name": (row.get("first_name") or "").strip(),
+			"last_name": (row.get("last_name") or "").strip(),
+			"email": email,
+			"phone": row.get("phone"),
+			"role": row.get("role"),
+			"status": status,
+			"department_id": department_id,
+		}
+		if upsert:
+			record = file_columns(row, record, {"department_id": ("department_id", "department")})
+		return record
+
+	return import_csv(file, Employee.__table__, convert, "employees", prepare=employee_lookups, progress=progress, upsert_key="email" if upsert else None)
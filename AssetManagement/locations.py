@@ -1,59 +1,46 @@
-import csv
-from io import TextIOWrapper
-
 from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from sqlalchemy import select
 from models import db, Location
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from csv_import import import_csv, file_columns, lookup_map, match_key, RowError
+from jobs import import_or_queue
 
 # Create Blueprint
 location_bp = Blueprint("location", __name__)
 
+# Register the locations table with the shared list engine
+location_list = ListQuery(
+	Location,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"location_id": Location.location_id,
+		"name": Location.name,
+		"address": Location.address,
+		"city": Location.city,
+		"country": Location.country,
+	},
+	searchable=[
+		Location.location_id,
+		Location.name,
+		Location.address,
+		Location.city,
+		Location.country,
+	],
+)
+
 # Define main page
 @location_bp.route("/locations", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def locations():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE locations AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
-					existing_location = (
-						Location.query.filter_by(name=row.get("name")).first()
-						if row.get("name") else None
-					)
-
-					# Only add locations if they do not already exist
-					if not existing_location and row.get("name"):
-						location = Location(
-							name=row.get("name", "").strip(),
-							address=row.get("address"),
-							city=row.get("city"),
-							country=row.get("country"),
-						)
-						db.session.add(location)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} locations from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			upsert = request.form.get("import_mode") == "upsert"
+			import_or_queue(import_locations_csv, file, "locations", upsert=upsert)
 			return redirect("/locations")
 
 
@@ -91,36 +78,16 @@ def locations():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Handle sorting
-	sort = request.args.get("sort", "location_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"location_id": Location.location_id,
-		"name": Location.name,
-		"address": Location.address,
-		"city": Location.city,
-		"country": Location.country,
-	}
-
-	sort_column = valid_columns.get(sort, Location.location_id)
-
-	# Apply search if necessary
-	locations = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		locations = locations.order_by(sort_column.desc())
-	else:
-		locations = locations.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = location_list.page(request.args)
 
 	# Display table
 	return render_template(
 		"locations.html",
-		locations=locations,
-		sort=sort,
-		direction=direction
+		locations=page.items,
+		page=page,
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -166,17 +133,44 @@ def edit_location(location_id):
 	return redirect("/locations")
 
 
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@location_bp.route("/locations/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_locations():
+	return csv_response(
+		select(Location.location_id, Location.name, Location.address, Location.city, Location.country)
+		.order_by(Location.location_id),
+		"locations.csv"
+	)
+
+
+# Look up the existing locations referenced by a batch of CSV rows
+def location_lookups(rows):
+	return {
+		"locations": lookup_map(Location.name, Location.location_id, ((row.get("name") or "").strip() for row in rows)),
+	}
+
 
-# Search function
-def search_for(search):
-	query = Location.query
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(Location.location_id.ilike(search_pattern)) |
-			(Location.name.ilike(search_pattern)) |
-			(Location.address.ilike(search_pattern)) |
-			(Location.city.ilike(search_pattern)) |
-			(Location.country.ilike(search_pattern))
-		)
-	return query
+# Import locations from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST, unless upsert is set: then existing locations
+# (matched by name) are updated from the file, in the columns the file has
+def import_locations_csv(file, progress=None, upsert=False):
+	seen = set()
+
+	def convert(row, lookups):
+		name = (row.get("name") or "").strip()
+		if not name or (match_key(name) in lookups["locations"] and not upsert):
+			return None
+		if match_key(name) in seen:
+			raise RowError(f"duplicate name '{name}'")
+		seen.add(match_key(name))
+
+		record = {
+			"name": name,
+			"address": row.get("address"),
+			"city": row.get("city"),
+			"country": row.get("country"),
+		}
+		return file_columns(row, record) if upsert else record
+
+	return import_csv(file, Location.__table__, convert, "locations", prepare=location_lookups, progress=progress, upsert_key="name" if upsert else None)
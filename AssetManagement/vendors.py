@@ -1,60 +1,47 @@
-import csv
-from io import TextIOWrapper
-
 from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
+from sqlalchemy import select
 from models import db, Vendor
 from route_decorators import role_required
+from pagination import ListQuery
+from misc_functions import csv_response
+from csv_import import import_csv, file_columns, lookup_map, match_key, RowError
+from jobs import import_or_queue
 
 # Create Blueprint
 vendor_bp = Blueprint("vendor", __name__)
 
+# Register the vendors table with the shared list engine
+vendor_list = ListQuery(
+	Vendor,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"vendor_id": Vendor.vendor_id,
+		"name": Vendor.name,
+		"contact_name": Vendor.contact_name,
+		"phone": Vendor.phone,
+		"email": Vendor.email,
+		"address": Vendor.address,
+	},
+	searchable=[
+		Vendor.vendor_id,
+		Vendor.name,
+		Vendor.email,
+		Vendor.phone,
+		Vendor.address,
+	],
+)
+
 # Define main page
 @vendor_bp.route("/vendors", methods=["GET", "POST"])
 @role_required("admin", "manager")
 def vendors():
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE vendors AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# ADD / UPDATE ------------------------------------------------------------------------
 		# For uploading CSV
 		if "csv_file" in request.files and request.files["csv_file"].filename:
 			file = request.files["csv_file"]
-			try:
-				stream = TextIOWrapper(file.stream, encoding="utf-8")
-				csv_reader = csv.DictReader(stream)
-				count = 0
-
-				for row in csv_reader:
-					# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST
-					existing_vendor = (
-						Vendor.query.filter_by(name=row.get("name")).first()
-						if row.get("name") else None
-					)
-
-					# Only add vendors if they do not already exist
-					if not existing_vendor and row.get("name"):
-						vendor = Vendor(
-							name=row.get("name", "").strip(),
-							contact_name=row.get("contact_name"),
-							phone=row.get("phone"),
-							email=row.get("email"),
-							address=row.get("address"),
-						)
-						db.session.add(vendor)
-						count += 1
-
-				# Commit additions to DB
-				db.session.commit()
-				flash(f"Successfully imported {count} vendors from CSV!", "success")
-
-			# Handle errors and exceptions
-			except Exception as e:
-				db.session.rollback()
-				flash(f"Error importing CSV: {e}", "danger")
-
+			upsert = request.form.get("import_mode") == "upsert"
+			import_or_queue(import_vendors_csv, file, "vendors", upsert=upsert)
 			return redirect("/vendors")
 
 
@@ -94,37 +81,16 @@ def vendors():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Handle sorting
-	sort = request.args.get("sort", "vendor_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"vendor_id": Vendor.vendor_id,
-		"name": Vendor.name,
-		"contact_name": Vendor.contact_name,
-		"phone": Vendor.phone,
-		"email": Vendor.email,
-		"address": Vendor.address,
-	}
-
-	sort_column = valid_columns.get(sort, Vendor.vendor_id)
-
-	# Apply search if necessary
-	vendors = search_for(search)
-
-	# Apply sorting and ordering from input
-	if direction == "desc":
-		vendors = vendors.order_by(sort_column.desc())
-	else:
-		vendors = vendors.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = vendor_list.page(request.args)
 
 	# Display table
 	return render_template(
 		"vendors.html",
-		vendors=vendors,
-		sort=sort,
-		direction=direction
+		vendors=page.items,
+		page=page,
+		sort=page.sort,
+		direction=page.direction
 	)
 
 # Define deletion page
@@ -173,17 +139,45 @@ def edit_vendor(vendor_id):
 	return redirect("/vendors")
 
 
+# Export CSV, streamed in batches (the file can be uploaded again through the CSV form)
+@vendor_bp.route("/vendors/export", methods=["GET", "POST"])
+@role_required("admin", "manager")
+def export_vendors():
+	return csv_response(
+		select(Vendor.vendor_id, Vendor.name, Vendor.contact_name, Vendor.phone, Vendor.email, Vendor.address)
+		.order_by(Vendor.vendor_id),
+		"vendors.csv"
+	)
+
+
+# Look up the existing vendors referenced by a batch of CSV rows
+def vendor_lookups(rows):
+	return {
+		"vendors": lookup_map(Vendor.name, Vendor.vendor_id, ((row.get("name") or "").strip() for row in rows)),
+	}
+
 
-# Search function
-def search_for(search):
-	query = Vendor.query
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(Vendor.vendor_id.cast(db.String).ilike(search_pattern)) |
-			(Vendor.name.ilike(search_pattern)) |
-			(Vendor.email.ilike(search_pattern)) |
-			(Vendor.phone.ilike(search_pattern)) |
-			(Vendor.address.ilike(search_pattern))
-		)
-	return query
+# Import vendors from an uploaded CSV file
+# THESE ITEMS WILL ONLY BE ADDED IF THEY DO NOT ALREADY EXIST, unless upsert is set: then existing vendors
+# (matched by name) are updated from the file, in the columns the file has
+def import_vendors_csv(file, progress=None, upsert=False):
+	seen = set()
+
+	def convert(row, lookups):
+		name = (row.get("name") or "").strip()
+		if not name or (match_key(name) in lookups["vendors"] and not upsert):
+			return None
+		if match_key(name) in seen:
+			raise RowError(f"duplicate name '{name}'")
+		seen.add(match_key(name))
+
+		record = {
+			"name": name,
+			"contact_name": row.get("contact_name"),
+			"phone": row.get("phone"),
+			"email": row.get("email"),
+			"address": row.get("address"),
+		}
+		return file_columns(row, record) if upsert else record
+
+	return import_csv(file, Vendor.__table__, convert, "vendors", prepare=vendor_lookups, progress=progress, upsert_key="name" if upsert else None)
@@ -0,0 +1,49 @@
+import os
+
+from flask import Blueprint, render_template, jsonify, redirect, flash, send_file, abort
+from sqlalchemy import select
+
+from models import db, Job
+from route_decorators import role_required
+from misc_functions import generate_export, EXPORT_TABLES
+from jobs import start_export, job_status
+
+jobs_bp = Blueprint("jobs", __name__)
+
+# Jobs shown on the jobs page, newest first
+RECENT_JOBS = 50
+
+# Recent background imports and exports with their progress
+@jobs_bp.route("/jobs", methods=["GET"])
+@role_required("admin", "manager")
+def jobs():
+	recent = db.session.execute(
+		select(Job).order_by(Job.created_at.desc()).limit(RECENT_JOBS)
+	).scalars().all()
+	running = any(job.status in ("queued", "running") for job in recent)
+	return render_template("jobs.html", jobs=recent, running=running)
+
+# Status of one job, polled by the jobs page while it runs
+@jobs_bp.route("/jobs/<job_id>", methods=["GET"])
+@role_required("admin", "manager")
+def job(job_id):
+	job = db.get_or_404(Job, job_id)
+	return jsonify(job_status(job))
+
+# Download the file written by a finished export job. Export jobs hold the full database (users
+# included), so downloading one is admin only, like /export and /jobs/export that create them.
+@jobs_bp.route("/jobs/<job_id>/download", methods=["GET"])
+@role_required("admin")
+def download_job(job_id):
+	job = db.get_or_404(Job, job_id)
+	if job.kind != "export" or job.status != "finished" or not job.file_path or not os.path.exists(job.file_path):
+		abort(404)
+	return send_file(job.file_path, as_attachment=True, download_name=job.file_name)
+
+# Build the full database export in the background instead of streaming it to the browser
+@jobs_bp.route("/jobs/export", methods=["POST"])
+@role_required("admin")
+def export_job():
+	job_id = start_export(generate_export, "full database", "full_database_export.zip", total=len(EXPORT_TABLES))
+	flash(f"Exporting the database in the background (job {job_id[:8]}). Download it here once it finishes.", "info")
+	return redirect("/jobs")
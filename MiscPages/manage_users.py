@@ -1,22 +1,43 @@
 from flask import Blueprint, render_template, redirect, request, flash
-from sqlalchemy import text
 from werkzeug.security import generate_password_hash
 
 from models import db, User, Employee
 from route_decorators import role_required
+from pagination import ListQuery
+from lookups import employee_options
 
 users_bp = Blueprint("users", __name__)
 
+# Register the users table with the shared list engine
+user_list = ListQuery(
+	User,
+	# Define valid columns to avoid SQL injection attacks
+	sortable={
+		"user_id": User.user_id,
+		"username": User.username,
+		"email": User.email,
+		"full_name": User.full_name,
+		"role": User.role,
+		"created_at": User.created_at,
+	},
+	searchable=[
+		User.user_id,
+		User.username,
+		User.email,
+		User.full_name,
+		User.role,
+		User.created_at,
+	],
+	# Load the linked employees shown in the table with one query
+	load_options=[db.selectinload(User.employee)],
+)
+
 
 @users_bp.route("/users", methods=["GET", "POST"])
 @role_required("admin")
 def users():
 	# ADD / UPDATE ------------------------------------------------------------------------
 	if request.method == "POST":
-		# Reset auto increment
-		db.session.execute(text("ALTER TABLE users AUTO_INCREMENT = 1;"))
-		db.session.commit()
-
 		# Get form data
 		username = request.form.get("username", "").strip()
 		email = request.form.get("email", "").strip()
@@ -53,39 +74,18 @@ def users():
 
 	# DISPLAY TABLE ------------------------------------------------------------------------
 
-	# Get data from employees table
-	employees = Employee.query.all()
-
-	# Handle sorting
-	sort = request.args.get("sort", "user_id")
-	direction = request.args.get("direction", "asc")
-	search = request.args.get("search", None)
-
-	valid_columns = {
-		"user_id": User.user_id,
-		"username": User.username,
-		"email": User.email,
-		"full_name": User.full_name,
-		"role": User.role,
-		"created_at": User.created_at,
-	}
+	# Cached employee list for the dropdown (see lookups.py)
+	employees = employee_options()
 
-	sort_column = valid_columns.get(sort, User.user_id)
-
-	# Apply search
-	users = search_for(search)
-
-	# Apply sorting and ordering
-	if direction == "desc":
-		users = users.order_by(sort_column.desc())
-	else:
-		users = users.order_by(sort_column.asc())
+	# Fetch one page of the table using the shared list engine
+	page = user_list.page(request.args)
 
 	return render_template(
 		"users.html",
-		users=users,
-		sort=sort,
-		direction=direction,
+		users=page.items,
+		page=page,
+		sort=page.sort,
+		direction=page.direction,
 		employees=employees
 	)
 
@@ -134,20 +134,3 @@ def edit_user(user_id):
 		flash(f"Error updating user: {e}", "danger")
 
 	return redirect("/users")
-
-
-
-# Search function
-def search_for(search):
-	query = User.query
-	if search:
-		search_pattern = f"%{search}%"
-		query = query.filter(
-			(User.user_id.ilike(search_pattern)) |
-			(User.username.ilike(search_pattern)) |
-			(User.email.ilike(search_pattern)) |
-			(User.full_name.ilike(search_pattern)) |
-			(User.role.ilike(search_pattern)) |
-			(User.created_at.ilike(search_pattern))
-		)
-	return query
@@ -0,0 +1,22 @@
+from flask import Blueprint, jsonify
+
+from models import db
+from route_decorators import role_required
+from config import pool_status
+from instrumentation import endpoint_metrics, reset_metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+# Query counts and timings per endpoint since the process started (see instrumentation.py),
+# plus the state of this worker's connection pool
+@metrics_bp.route("/metrics", methods=["GET"])
+@role_required("admin")
+def metrics():
+	return jsonify({"endpoints": endpoint_metrics(), "pool": pool_status(db.engine)})
+
+# Start the totals again, e.g. before measuring a change
+@metrics_bp.route("/metrics/reset", methods=["POST"])
+@role_required("admin")
+def metrics_reset():
+	reset_metrics()
+	return jsonify({"endpoints": {}})
@@ -0,0 +1,148 @@
+from datetime import date, timedelta
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy import exists, func, select
+
+import cache
+from models import db, Asset, AssetDisposal, AssetType, Vendor
+from depreciation import GROUPS, MAX_SCHEDULE_YEARS, cached_totals, cached_schedule, asset_depreciation
+from route_decorators import role_required
+
+reports_bp = Blueprint("reports", __name__)
+
+# Default and largest warranty horizon, in days
+WARRANTY_DAYS = 90
+MAX_WARRANTY_DAYS = 3650
+
+# Assets listed with the warranty report, soonest expiry first
+WARRANTY_ASSET_LIMIT = 50
+
+# Tables the warranty report is built from; editing or importing assets rebuilds the cached report
+WARRANTY_TABLES = ["assets", "vendors", "asset_types", "asset_disposals"]
+
+
+# Grouping for the warranty report other than by month: (model, name column, join condition)
+WARRANTY_GROUPS = {
+	"vendor": (Vendor, Vendor.name, Asset.vendor_id == Vendor.vendor_id),
+	"type": (AssetType, AssetType.name, Asset.asset_type_id == AssetType.asset_type_id),
+}
+
+
+# Disposed assets are left out of the reports
+def _not_disposed():
+	return ~exists().where(AssetDisposal.asset_id == Asset.asset_id)
+
+
+# Group the expiring warranties by month, vendor or type.
+# Every query is a range read on ix_assets_warranty_expiry; months are bucketed in Python from
+# the per day counts so the grouping works the same on MySQL and SQLite.
+def warranty_groups(start, end, group):
+	in_range = (Asset.warranty_expiry >= start, Asset.warranty_expiry <= end, _not_disposed())
+	count = func.count(Asset.asset_id)
+	cost = func.coalesce(func.sum(Asset.purchase_cost), 0)
+
+	if group == "month":
+		groups = {}
+		rows = db.session.execute(
+			select(Asset.warranty_expiry, count, cost).where(*in_range).group_by(Asset.warranty_expiry)
+		).all()
+		for expiry, day_count, day_cost in rows:
+			bucket = groups.setdefault(expiry.strftime("%Y-%m"), [0, 0])
+			bucket[0] += day_count
+			bucket[1] += day_cost
+		rows = sorted((month, values[0], values[1]) for month, values in groups.items())
+	else:
+		model, name, join = WARRANTY_GROUPS[group]
+		rows = db.session.execute(
+			select(name, count, cost)
+			.select_from(Asset)
+			.outerjoin(model, join)
+			.where(*in_range)
+			.group_by(name)
+			.order_by(count.desc(), name)
+		).all()
+
+	return [{"group": key or "None", "count": row_count, "cost": float(row_cost)} for key, row_count, row_cost in rows]
+
+
+def warranty_assets(start, end, limit=WARRANTY_ASSET_LIMIT):
+	rows = db.session.execute(
+		select(Asset.asset_id, Asset.asset_tag, Asset.name, Asset.warranty_expiry, Vendor.name.label("vendor"))
+		.outerjoin(Vendor, Asset.vendor_id == Vendor.vendor_id)
+		.where(Asset.warranty_expiry >= start, Asset.warranty_expiry <= end, _not_disposed())
+		.order_by(Asset.warranty_expiry, Asset.asset_id)
+		.limit(limit)
+	).all()
+	return [
+		{
+			"asset_id": row.asset_id,
+			"asset_tag": row.asset_tag,
+			"name": row.name,
+			"vendor": row.vendor,
+			"warranty_expiry": row.warranty_expiry.isoformat(),
+		}
+		for row in rows
+	]
+
+
+# Warranties expiring from today through today + days, cached per day until assets change
+def warranty_report(days=WARRANTY_DAYS, group="month"):
+	today = date.today()
+	end = today + timedelta(days=days)
+
+	def build():
+		groups = warranty_groups(today, end, group)
+		return {
+			"start": today.isoformat(),
+			"end": end.isoformat(),
+			"days": days,
+			"group": group,
+			"total": sum(row["count"] for row in groups),
+			"total_cost": round(sum(row["cost"] for row in groups), 2),
+			"groups": groups,
+			"assets": warranty_assets(today, end),
+		}
+
+	return cache.get_or_set(f"warranty:{today.isoformat()}:{days}:{group}", WARRANTY_TABLES, build)
+
+
+# Warranties expiring in the next ?days= (default 90), grouped by ?group=month|vendor|type
+@reports_bp.route("/reports/warranty", methods=["GET"])
+@role_required("admin", "manager")
+def warranty():
+	days = min(max(request.args.get("days", WARRANTY_DAYS, type=int), 0), MAX_WARRANTY_DAYS)
+	group = request.args.get("group", "month")
+	if group != "month" and group not in WARRANTY_GROUPS:
+		return jsonify({"error": "group must be month, vendor or type"}), 400
+	return jsonify(warranty_report(days, group))
+
+
+# Cost, book value and accumulated depreciation today, by ?group=type|location|department (see depreciation.py)
+@reports_bp.route("/reports/depreciation", methods=["GET"])
+@role_required("admin", "manager")
+def depreciation():
+	group = request.args.get("group", "type")
+	if group not in GROUPS:
+		return jsonify({"error": "group must be type, location or department"}), 400
+	groups = cached_totals(group)
+	return jsonify({
+		"group": group,
+		"assets": sum(row["assets"] for row in groups),
+		"cost": round(sum(row["cost"] for row in groups), 2),
+		"book_value": round(sum(row["book_value"] for row in groups), 2),
+		"groups": groups,
+	})
+
+# Fleet book value today and at each of the next ?years= (default 5) anniversaries
+@reports_bp.route("/reports/depreciation/schedule", methods=["GET"])
+@role_required("admin", "manager")
+def depreciation_schedule():
+	years = min(max(request.args.get("years", 5, type=int), 1), MAX_SCHEDULE_YEARS)
+	return jsonify(cached_schedule(years))
+
+# One asset's schedule over its useful life
+@reports_bp.route("/reports/depreciation/asset/<int:asset_id>", methods=["GET"])
+@role_required("admin", "manager")
+def asset_depreciation_schedule(asset_id):
+	asset = db.get_or_404(Asset, asset_id)
+	return jsonify(asset_depreciation(asset))
@@ -0,0 +1,230 @@
+import argparse
+import csv
+import os
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+# Generate a synthetic dataset shaped like the files in "Sample Data/", scaled to a number of assets.
+#
+#     python benchmarks/generate_data.py --assets 10000 --out benchmarks/data/10k
+#
+# The output directory holds one CSV per table in the sample data layout (with IDs, for bulk loading)
+# plus an imports/ directory of smaller files in the format each CSV upload form expects.
+# Reference tables (types, statuses, locations, vendors, departments) are copied from the sample data;
+# employees, assignments, maintenance and disposals keep the sample's ratio to assets.
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Sample Data")
+
+# Rows in each upload file under imports/
+IMPORT_ROWS = 1000
+
+REFERENCE_TABLES = ["asset_types", "asset_statuses", "locations", "vendors", "departments"]
+
+FIRST_DAY = date(2018, 1, 1)
+LAST_DAY = date(2025, 12, 31)
+
+
+def read_sample(name):
+	with open(os.path.join(SAMPLE_DIR, f"{name}.csv"), newline="", encoding="utf-8-sig") as file:
+		return list(csv.DictReader(file))
+
+
+def write_csv(path, fieldnames, rows):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, "w", newline="", encoding="utf-8") as file:
+		writer = csv.DictWriter(file, fieldnames=fieldnames)
+		writer.writeheader()
+		writer.writerows(rows)
+
+
+def random_day(rng, start=FIRST_DAY, end=LAST_DAY):
+	return start + timedelta(days=rng.randint(0, (end - start).days))
+
+
+def scaled_cost(rng, value):
+	if not value:
+		return ""
+	return str((Decimal(value) * Decimal(rng.uniform(0.8, 1.2))).quantize(Decimal("0.01")))
+
+
+def generate_employees(rng, count, samples, department_ids):
+	first_names = sorted({row["first_name"] for row in samples})
+	last_names = sorted({row["last_name"] for row in samples})
+	for employee_id in range(1, count + 1):
+		template = rng.choice(samples)
+		first_name = rng.choice(first_names)
+		last_name = rng.choice(last_names)
+		yield {
+			"employee_id": employee_id,
+			"first_name": first_name,
+			"last_name": last_name,
+			"email": f"{first_name[0]}{last_name}{employee_id}@email.com".lower(),
+			"phone": f"(305) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+			"department_id": rng.choice(department_ids),
+			"role": template["role"],
+			"status": template["status"],
+		}
+
+
+def generate_assets(rng, count, samples, employee_count, start_id=1, tag_prefix=""):
+	for asset_id in range(start_id, start_id + count):
+		template = rng.choice(samples)
+		purchase_date = random_day(rng)
+		prefix = template["asset_tag"].split("-")[0]
+		yield {
+			"asset_id": asset_id,
+			"asset_tag": f"{tag_prefix}{prefix}-{asset_id:07d}",
+			"name": template["name"],
+			"description": template["description"],
+			"asset_type_id": template["asset_type_id"],
+			"status_id": template["status_id"],
+			"location_id": template["location_id"],
+			"assigned_to": rng.randint(1, employee_count) if template["assigned_to"] else "",
+			"purchase_date": purchase_date.isoformat(),
+			"purchase_cost": scaled_cost(rng, template["purchase_cost"]),
+			"vendor_id": template["vendor_id"],
+			"warranty_expiry": (purchase_date + timedelta(days=365 * rng.choice([1, 2, 3, 5]))).isoformat(),
+			"serial_number": f"SN-{tag_prefix}{asset_id:09d}",
+		}
+
+
+def generate_assignments(rng, count, asset_count, employee_count):
+	for assignment_id in range(1, count + 1):
+		assigned_date = random_day(rng)
+		returned = rng.random() < 0.5
+		yield {
+			"assignment_id": assignment_id,
+			"asset_id": rng.randint(1, asset_count),
+			"employee_id": rng.randint(1, employee_count),
+			"assigned_date": assigned_date.isoformat(),
+			"returned_date": random_day(rng, assigned_date, assigned_date + timedelta(days=700)).isoformat() if returned else "",
+		}
+
+
+def generate_maintenance(rng, count, samples, asset_count):
+	for maintenance_id in range(1, count + 1):
+		template = rng.choice(samples)
+		maintenance_date = random_day(rng)
+		yield {
+			"maintenance_id": maintenance_id,
+			"asset_id": rng.randint(1, asset_count),
+			"maintenance_date": maintenance_date.isoformat(),
+			"description": template["description"],
+			"performed_by": template["performed_by"],
+			"cost": scaled_cost(rng, template["cost"]),
+			"next_due_date": (maintenance_date + timedelta(days=365)).isoformat() if template["next_due_date"] else "",
+		}
+
+
+def generate_disposals(rng, count, samples, asset_count):
+	asset_ids = rng.sample(range(1, asset_count + 1), min(count, asset_count))
+	for disposal_id, asset_id in enumerate(asset_ids, start=1):
+		template = rng.choice(samples)
+		yield {
+			"disposal_id": disposal_id,
+			"asset_id": asset_id,
+			"disposal_date": random_day(rng).isoformat(),
+			"method": template["method"],
+			"sale_value": scaled_cost(rng, template["sale_value"]),
+			"notes": template["notes"],
+		}
+
+
+# Upload files in the format of each CSV form. Name keyed tables get new names so every row is imported.
+def generate_imports(rng, out, samples, asset_count, employee_count, department_names):
+	imports = os.path.join(out, "imports")
+	n = IMPORT_ROWS
+
+	assets = list(generate_assets(rng, n, samples["assets"], employee_count, start_id=asset_count + 1, tag_prefix="IMP"))
+	write_csv(os.path.join(imports, "assets.csv"), [key for key in assets[0] if key != "asset_id"],
+	          [{key: value for key, value in row.items() if key != "asset_id"} for row in assets])
+
+	employees = list(generate_employees(rng, n, samples["employees"], [1]))
+	write_csv(os.path.join(imports, "employees.csv"),
+	          ["first_name", "last_name", "email", "phone", "department", "role", "status"],
+	          [{
+		          "first_name": row["first_name"],
+		          "last_name": row["last_name"],
+		          "email": f"import.{row['email']}",
+		          "phone": row["phone"],
+		          "department": rng.choice(department_names),
+		          "role": row["role"],
+		          "status": row["status"],
+	          } for row in employees])
+
+	write_csv(os.path.join(imports, "departments.csv"), ["name", "manager_email"],
+	          [{"name": f"Import Department {i}", "manager_email": ""} for i in range(n)])
+	write_csv(os.path.join(imports, "locations.csv"), ["name", "address", "city", "country"],
+	          [{"name": f"Import Location {i}", "address": f"{i} Main St", "city": "Miami", "country": "USA"} for i in range(n)])
+	write_csv(os.path.join(imports, "vendors.csv"), ["name", "contact_name", "phone", "email", "address"],
+	          [{"name": f"Import Vendor {i}", "contact_name": "", "phone": "", "email": "", "address": ""} for i in range(n)])
+	write_csv(os.path.join(imports, "asset_types.csv"), ["name", "category", "description"],
+	          [{"name": f"Import Type {i}", "category": rng.choice(["Tangible", "Intangible"]), "description": ""} for i in range(n)])
+	write_csv(os.path.join(imports, "asset_statuses.csv"), ["status_name"],
+	          [{"status_name": f"Import Status {i}"} for i in range(n)])
+
+	assignments = list(generate_assignments(rng, n, asset_count, employee_count))
+	write_csv(os.path.join(imports, "asset_assignments.csv"), ["asset_id", "employee_id", "assigned_date", "returned_date"],
+	          [{key: value for key, value in row.items() if key != "assignment_id"} for row in assignments])
+	maintenance = list(generate_maintenance(rng, n, samples["asset_maintenances"], asset_count))
+	write_csv(os.path.join(imports, "asset_maintenance.csv"), ["asset_id", "maintenance_date", "description", "performed_by", "cost", "next_due_date"],
+	          [{key: value for key, value in row.items() if key != "maintenance_id"} for row in maintenance])
+	disposals = list(generate_disposals(rng, n, samples["asset_disposals"], asset_count))
+	write_csv(os.path.join(imports, "asset_disposals.csv"), ["asset_id", "disposal_date", "method", "sale_value", "notes"],
+	          [{key: value for key, value in row.items() if key != "disposal_id"} for row in disposals])
+
+
+def generate(asset_count, out, seed=0):
+	rng = random.Random(seed)
+	samples = {name: read_sample(name) for name in REFERENCE_TABLES + [
+		"assets", "employees", "asset_assignments", "asset_maintenances", "asset_disposals"
+	]}
+
+	# Keep the sample data's ratio of each table to assets
+	sample_assets = len(samples["assets"])
+	employee_count = max(len(samples["employees"]), asset_count * len(samples["employees"]) // sample_assets)
+	assignment_count = asset_count * len(samples["asset_assignments"]) // sample_assets
+	maintenance_count = asset_count * len(samples["asset_maintenances"]) // sample_assets
+	disposal_count = asset_count * len(samples["asset_disposals"]) // sample_assets
+
+	for name in REFERENCE_TABLES:
+		write_csv(os.path.join(out, f"{name}.csv"), list(samples[name][0].keys()), samples[name])
+
+	department_ids = [int(row["department_id"]) for row in samples["departments"]]
+	write_csv(os.path.join(out, "employees.csv"), list(samples["employees"][0].keys()),
+	          generate_employees(rng, employee_count, samples["employees"], department_ids))
+	write_csv(os.path.join(out, "assets.csv"), list(samples["assets"][0].keys()),
+	          generate_assets(rng, asset_count, samples["assets"], employee_count))
+	write_csv(os.path.join(out, "asset_assignments.csv"), list(samples["asset_assignments"][0].keys()),
+	          generate_assignments(rng, assignment_count, asset_count, employee_count))
+	write_csv(os.path.join(out, "asset_maintenances.csv"), list(samples["asset_maintenances"][0].keys()),
+	          generate_maintenance(rng, maintenance_count, samples["asset_maintenances"], asset_count))
+	write_csv(os.path.join(out, "asset_disposals.csv"), list(samples["asset_disposals"][0].keys()),
+	          generate_disposals(rng, disposal_count, samples["asset_disposals"], asset_count))
+
+	generate_imports(rng, out, samples, asset_count, employee_count, [row["name"] for row in samples["departments"]])
+
+	return {
+		"assets": asset_count,
+		"employees": employee_count,
+		"asset_assignments": assignment_count,
+		"asset_maintenances": maintenance_count,
+		"asset_disposals": min(disposal_count, asset_count),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Generate a benchmark dataset scaled from the sample data.")
+	parser.add_argument("--assets", type=int, default=10000, help="number of assets (e.g. 10000, 100000, 1000000)")
+	parser.add_argument("--out", required=True, help="output directory")
+	parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed always gives the same data")
+	args = parser.parse_args()
+
+	counts = generate(args.assets, args.out, args.seed)
+	for table, count in counts.items():
+		print(f"{table}: {count:,}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,277 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+# Time the key pages against a generated dataset (see generate_data.py) and write a report
+# that can be compared release to release.
+#
+#     python benchmarks/run_benchmarks.py --data benchmarks/data/10k --output bench-10k.json
+#     python benchmarks/run_benchmarks.py --data benchmarks/data/10k --compare bench-10k.json
+#
+# The database defaults to a local SQLite file. Pass --database (or set DATABASE_URL) to use a
+# local MySQL instead. The database is emptied and reloaded unless --skip-load is given.
+# With --skip-load the uploads repeat rows that were already imported, so only compare import timings
+# between runs that both loaded the data.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATABASE = "sqlite:///" + os.path.join(ROOT, "benchmarks", "bench.db")
+
+# Rows per INSERT while loading the dataset
+LOAD_BATCH_SIZE = 5000
+
+# Pages timed with GET, repeated --repeat times each: (name, path)
+PAGES = [
+	("dashboard", "/"),
+	("dashboard charts", "/chart-data/dashboard"),
+	("assets", "/assets"),
+	("assets sorted by name desc", "/assets?sort=name&direction=desc"),
+	("assets sorted by cost, 500 rows", "/assets?sort=purchase_cost&page_size=500"),
+	("assets search word", "/assets?search=laptop"),
+	("assets search typed filter", "/assets?search=cost%3E1000"),
+	("asset edit form", "/assets/edit_form/1"),
+	("asset lookup", "/assets/lookup?q=lap"),
+	("asset assignments", "/asset_assignments"),
+	("assignment edit form", "/asset_assignments/edit_form/1"),
+	("custody on a date, all assets", "/asset_assignments/custody/export?date=2022-06-30"),
+	("custody of one asset", "/asset_assignments/custody/1?date=2022-06-30"),
+	("assignment discrepancies", "/asset_assignments/reconcile"),
+	("asset maintenance", "/asset_maintenance"),
+	("maintenance due", "/asset_maintenance/due?days=30"),
+	("warranty report by month", "/reports/warranty?days=365&group=month"),
+	("warranty report by vendor", "/reports/warranty?days=365&group=vendor"),
+	("depreciation by department", "/reports/depreciation?group=department"),
+	("depreciation schedule 10 years", "/reports/depreciation/schedule?years=10"),
+	("asset disposals", "/asset_disposals"),
+	("employees", "/employees"),
+	("departments", "/departments"),
+	("export assets csv", "/assets/export"),
+	("export database zip", "/export"),
+]
+
+# CSV uploads, run once each after the pages since they add rows: (name, path, file under imports/)
+IMPORTS = [
+	("import asset types", "/asset_type", "asset_types.csv"),
+	("import asset statuses", "/asset_status", "asset_statuses.csv"),
+	("import locations", "/locations", "locations.csv"),
+	("import vendors", "/vendors", "vendors.csv"),
+	("import departments", "/departments", "departments.csv"),
+	("import employees", "/employees", "employees.csv"),
+	("import assets", "/assets", "assets.csv"),
+	("import asset assignments", "/asset_assignments", "asset_assignments.csv"),
+	("import asset maintenance", "/asset_maintenance", "asset_maintenance.csv"),
+	("import asset disposals", "/asset_disposals", "asset_disposals.csv"),
+]
+
+# Tables in load order: (CSV file, table name)
+LOAD_ORDER = [
+	("asset_types.csv", "asset_types"),
+	("asset_statuses.csv", "asset_statuses"),
+	("locations.csv", "locations"),
+	("vendors.csv", "vendors"),
+	("departments.csv", "departments"),
+	("employees.csv", "employees"),
+	("assets.csv", "assets"),
+	("asset_assignments.csv", "asset_assignments"),
+	("asset_maintenances.csv", "asset_maintenance"),
+	("asset_disposals.csv", "asset_disposals"),
+]
+
+SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def convert(column, value):
+	if value == "":
+		return None
+	python_type = column.type.python_type
+	if python_type is date:
+		return date.fromisoformat(value)
+	if python_type is datetime:
+		return datetime.fromisoformat(value)
+	if python_type is Decimal:
+		return Decimal(value)
+	if python_type is int:
+		return int(value)
+	return value
+
+
+# Empty the database and bulk load the generated CSVs, keeping their IDs
+def load_dataset(data_dir):
+	from sqlalchemy import insert, update
+	from werkzeug.security import generate_password_hash
+	from models import db, Department, User
+	from search_index import rebuild_index
+	from maintenance_schedule import rebuild_next_due
+
+	db.drop_all()
+	db.create_all()
+
+	counts = {}
+	managers = {}
+	for filename, table_name in LOAD_ORDER:
+		table = db.metadata.tables[table_name]
+		count = 0
+		with open(os.path.join(data_dir, filename), newline="", encoding="utf-8") as file:
+			batch = []
+			for row in csv.DictReader(file):
+				record = {key: convert(table.c[key], value) for key, value in row.items()}
+				# Departments and employees reference each other, so managers are set once employees exist
+				if table_name == "departments":
+					managers[record["department_id"]] = record.pop("manager_id")
+				batch.append(record)
+				if len(batch) >= LOAD_BATCH_SIZE:
+					db.session.execute(insert(table), batch)
+					count += len(batch)
+					batch = []
+			if batch:
+				db.session.execute(insert(table), batch)
+				count += len(batch)
+		db.session.commit()
+		counts[table_name] = count
+
+		if table_name == "employees":
+			for department_id, manager_id in managers.items():
+				db.session.execute(update(Department).where(Department.department_id == department_id).values(manager_id=manager_id))
+			db.session.commit()
+
+	db.session.add(User(
+		username="benchmark",
+		email="benchmark@example.com",
+		password_hash=generate_password_hash("benchmark"),
+		full_name="Benchmark Admin",
+		role="admin",
+		employee_id=1,
+	))
+	db.session.commit()
+
+	started = time.perf_counter()
+	rebuild_index()
+	counts["search index seconds"] = round(time.perf_counter() - started, 2)
+
+	started = time.perf_counter()
+	rebuild_next_due()
+	counts["maintenance due seconds"] = round(time.perf_counter() - started, 2)
+	return counts
+
+
+# Run one request, reading the whole body so streamed responses are fully timed
+def timed_request(client, method, path, **kwargs):
+	started = time.perf_counter()
+	response = client.open(path, method=method, **kwargs)
+	size = len(response.get_data())
+	elapsed = (time.perf_counter() - started) * 1000
+
+	queries = None
+	db_ms = None
+	match = SERVER_TIMING_DB.search(response.headers.get("Server-Timing", ""))
+	if match:
+		db_ms = float(match.group(1))
+		queries = int(match.group(2))
+	return {"ms": elapsed, "status": response.status_code, "bytes": size, "queries": queries, "db_ms": db_ms}
+
+
+def summarize(samples):
+	times = sorted(sample["ms"] for sample in samples)
+	last = samples[-1]
+	return {
+		"first_ms": round(samples[0]["ms"], 1),
+		"median_ms": round(statistics.median(times), 1),
+		"p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 1),
+		"min_ms": round(times[0], 1),
+		"queries": last["queries"],
+		"db_ms": last["db_ms"],
+		"bytes": last["bytes"],
+		"status": last["status"],
+	}
+
+
+def run(client, data_dir, repeat):
+	results = {}
+	for name, path in PAGES:
+		samples = [timed_request(client, "GET", path) for _ in range(repeat)]
+		results[name] = summarize(samples)
+		print_result(name, results[name])
+
+	for name, path, filename in IMPORTS:
+		with open(os.path.join(data_dir, "imports", filename), "rb") as file:
+			sample = timed_request(client, "POST", path, data={"csv_file": (file, filename)}, content_type="multipart/form-data")
+		results[name] = summarize([sample])
+		print_result(name, results[name])
+	return results
+
+
+def print_result(name, result, baseline=None):
+	line = f"{name:<34} {result['median_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  {result['queries'] if result['queries'] is not None else '-':>5} queries  {result['bytes']:>11,} bytes"
+	if result["status"] >= 400:
+		line += f"  HTTP {result['status']}"
+	if baseline:
+		change = (result["median_ms"] - baseline["median_ms"]) / baseline["median_ms"] * 100 if baseline["median_ms"] else 0
+		line += f"  {change:+.0f}% vs {baseline['median_ms']:.1f} ms"
+	print(line)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the key pages against a generated dataset.")
+	parser.add_argument("--data", required=True, help="dataset directory written by generate_data.py")
+	parser.add_argument("--database", default=os.environ.get("DATABASE_URL", DEFAULT_DATABASE), help="database URL (emptied and reloaded)")
+	parser.add_argument("--repeat", type=int, default=5, help="times each page is requested")
+	parser.add_argument("--skip-load", action="store_true", help="reuse the data already in the database")
+	parser.add_argument("--output", help="write the report to this JSON file")
+	parser.add_argument("--compare", help="print the change against an earlier report")
+	args = parser.parse_args()
+
+	# The app reads DATABASE_URL when it is imported
+	os.environ["DATABASE_URL"] = args.database
+	sys.path.insert(0, ROOT)
+	from app import app
+	from models import db
+
+	with app.app_context():
+		counts = None
+		if not args.skip_load:
+			started = time.perf_counter()
+			counts = load_dataset(args.data)
+			counts["load seconds"] = round(time.perf_counter() - started, 2)
+			print(", ".join(f"{key}: {value:,}" for key, value in counts.items()))
+		dialect = db.engine.dialect.name
+
+	client = app.test_client()
+	with client.session_transaction() as session:
+		session["user_id"] = 1
+		session["username"] = "benchmark"
+		session["role"] = "admin"
+
+	results = run(client, args.data, max(1, args.repeat))
+
+	report = {
+		"created": datetime.now().isoformat(timespec="seconds"),
+		"database": dialect,
+		"data": os.path.abspath(args.data),
+		"counts": counts,
+		"repeat": args.repeat,
+		"python": platform.python_version(),
+		"results": results,
+	}
+
+	if args.compare:
+		with open(args.compare, encoding="utf-8") as file:
+			baseline = json.load(file)["results"]
+		print(f"\nCompared with {args.compare}:")
+		for name, result in results.items():
+			print_result(name, result, baseline.get(name))
+
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as file:
+			json.dump(report, file, indent=2)
+		print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from sqlalchemy import event
+
+from models import db
+
+# Default lifetime of a cached value in seconds
+DEFAULT_TTL = 30
+
+# Process-wide cache of query results, keyed by name.
+# Each entry remembers the version of every table it was built from. Committing a write to one of
+# those tables bumps its version, so the entry is rebuilt on next use even before its TTL runs out.
+# Versions are per process, so with several workers the TTL bounds how stale another worker can be.
+_lock = threading.Lock()
+_entries = {}
+_versions = {}
+
+
+def table_versions(tables):
+	return tuple(_versions.get(table, 0) for table in tables)
+
+
+# Return the cached value for key, calling loader() to rebuild it when expired or when any table changed.
+# Cache plain data (tuples, dicts, lists), never ORM objects, since entries outlive the request's session.
+def get_or_set(key, tables, loader, ttl=DEFAULT_TTL):
+	versions = table_versions(tables)
+	now = time.monotonic()
+	entry = _entries.get(key)
+	if entry and entry[0] > now and entry[1] == versions:
+		return entry[2]
+
+	value = loader()
+	with _lock:
+		_entries[key] = (now + ttl, versions, value)
+	return value
+
+
+# Mark tables as changed so every entry built from them is rebuilt
+def invalidate(*tables):
+	with _lock:
+		for table in tables:
+			_versions[table] = _versions.get(table, 0) + 1
+
+
+def clear():
+	with _lock:
+		_entries.clear()
+
+
+# Drop one entry so the next get_or_set rebuilds it
+def discard(key):
+	with _lock:
+		_entries.pop(key, None)
+
+
+# Track the tables written by each session and invalidate them once the transaction commits.
+# This covers ORM changes (flush) as well as insert()/update()/delete() statements run through the session.
+def _changed_tables(session):
+	return session.info.setdefault("changed_tables", set())
+
+
+@event.listens_for(db.session, "after_flush")
+def _record_flush(session, flush_context):
+	changed = _changed_tables(session)
+	for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+		table = getattr(obj, "__table__", None)
+		if table is not None:
+			changed.add(table.name)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _record_statement(orm_execute_state):
+	if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+		table = getattr(orm_execute_state.statement, "table", None)
+		if table is not None:
+			_changed_tables(orm_execute_state.session).add(table.name)
+
+
+# Record a write the events above can't see, e.g. a text() UPDATE, so it invalidates on commit too
+def mark_changed(session, *tables):
+	_changed_tables(session).update(tables)
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_committed(session):
+	changed = session.info.pop("changed_tables", None)
+	if changed:
+		invalidate(*changed)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_rolled_back(session):
+	session.info.pop("changed_tables", None)
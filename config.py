@@ -0,0 +1,95 @@
+import os
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+# Connection pool settings, read from the environment so each deployment can size them without code changes.
+#
+# Sizing: every worker process has its own pool, so the most connections the app can open is
+#     workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# and that has to stay below MySQL's max_connections (151 by default) with room left for admin tools
+# and maintenance commands. For example 4 workers x (10 + 10) = 80 connections. Threaded workers
+# need a pool at least as large as their thread count or requests queue for up to DB_POOL_TIMEOUT.
+#
+# DB_POOL_RECYCLE must be lower than the server's wait_timeout so MySQL never closes a pooled
+# connection first; DB_POOL_PRE_PING also checks each connection before handing it out.
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT = 10
+DB_POOL_RECYCLE = 1800
+DB_POOL_PRE_PING = True
+DB_CONNECT_TIMEOUT = 10
+DB_READ_TIMEOUT = 60
+DB_WRITE_TIMEOUT = 60
+
+# Migrations, full reconciliation runs and the search index rebuild (see long_running.py) can wait on
+# one statement far longer than a request should, e.g. an online index build on a large table. They
+# use their own unpooled connections with no read timeout, unless DB_LONG_READ_TIMEOUT (seconds) is set.
+DB_LONG_READ_TIMEOUT = None
+
+
+def _env_int(name, default):
+	value = os.environ.get(name)
+	if value in (None, ""):
+		return default
+	try:
+		return int(value)
+	except ValueError:
+		raise ValueError(f"{name} must be a whole number, got '{value}'")
+
+
+def _env_bool(name, default):
+	value = os.environ.get(name)
+	if value in (None, ""):
+		return default
+	return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Build SQLALCHEMY_ENGINE_OPTIONS for a database URL
+def engine_options(database_url):
+	url = make_url(database_url)
+	options = {
+		"pool_pre_ping": _env_bool("DB_POOL_PRE_PING", DB_POOL_PRE_PING),
+		"pool_recycle": _env_int("DB_POOL_RECYCLE", DB_POOL_RECYCLE),
+	}
+
+	# SQLite (used for local benchmarks) has no server to size a pool against
+	if url.get_backend_name() == "sqlite":
+		return options
+
+	options.update({
+		"pool_size": _env_int("DB_POOL_SIZE", DB_POOL_SIZE),
+		"max_overflow": _env_int("DB_MAX_OVERFLOW", DB_MAX_OVERFLOW),
+		"pool_timeout": _env_int("DB_POOL_TIMEOUT", DB_POOL_TIMEOUT),
+	})
+	if url.get_backend_name() == "mysql":
+		options["connect_args"] = {
+			"connect_timeout": _env_int("DB_CONNECT_TIMEOUT", DB_CONNECT_TIMEOUT),
+			"read_timeout": _env_int("DB_READ_TIMEOUT", DB_READ_TIMEOUT),
+			"write_timeout": _env_int("DB_WRITE_TIMEOUT", DB_WRITE_TIMEOUT),
+		}
+	return options
+
+
+# Engine options for long-running maintenance work: no pool to size, and no read timeout by default
+def long_running_engine_options(database_url):
+	url = make_url(database_url)
+	options = {"poolclass": NullPool}
+	if url.get_backend_name() == "mysql":
+		options["connect_args"] = {
+			"connect_timeout": _env_int("DB_CONNECT_TIMEOUT", DB_CONNECT_TIMEOUT),
+			"read_timeout": _env_int("DB_LONG_READ_TIMEOUT", DB_LONG_READ_TIMEOUT),
+			"write_timeout": _env_int("DB_WRITE_TIMEOUT", DB_WRITE_TIMEOUT),
+		}
+	return options
+
+
+# Current state of an engine's connection pool, for /metrics
+def pool_status(engine):
+	pool = engine.pool
+	status = {"class": type(pool).__name__}
+	for name in ("size", "checkedin", "checkedout", "overflow"):
+		method = getattr(pool, name, None)
+		if callable(method):
+			status[name] = method()
+	return status
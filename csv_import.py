@@ -0,0 +1,283 @@
+import csv
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from io import TextIOWrapper
+
+from flask import flash
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from models import db
+
+# Rows parsed and written per transaction
+BATCH_SIZE = 1000
+
+# Only the first few errors are shown to the user
+MAX_REPORTED_ERRORS = 5
+
+# Keys per IN (...) list when resolving lookups
+LOOKUP_CHUNK_SIZE = 1000
+
+
+# Raised by row converters for values that can't be imported
+class RowError(ValueError):
+	pass
+
+
+# Running totals and errors for one CSV import
+class ImportReport:
+	def __init__(self, label):
+		self.label = label
+		self.rows = 0
+		self.imported = 0
+		self.updated = 0
+		self.unchanged = 0
+		self.skipped = 0
+		self.upsert = False
+		self.errors = []
+		self.started = time.perf_counter()
+		self.finished = None
+
+	def error(self, message):
+		self.errors.append(message)
+
+	def finish(self):
+		self.finished = time.perf_counter()
+		return self
+
+	@property
+	def seconds(self):
+		return (self.finished or time.perf_counter()) - self.started
+
+	@property
+	def rows_per_second(self):
+		return self.rows / self.seconds if self.seconds > 0 else 0
+
+	# Flash-ready summary, e.g. "Imported 1,000 assets from CSV (1,000 rows in 0.4s, 2,500 rows/sec)."
+	def summary(self):
+		message = (
+			f"Imported {self.imported:,} {self.label} from CSV "
+			f"({self.rows:,} rows in {self.seconds:.1f}s, {self.rows_per_second:,.0f} rows/sec)."
+		)
+		if self.upsert:
+			message += f" Updated {self.updated:,} existing {self.label}, {self.unchanged:,} unchanged."
+		if self.skipped:
+			message += f" Skipped {self.skipped:,} rows."
+		return message
+
+
+# Parsing helpers shared by the import converters. Blank values become None.
+def parse_date(value, field):
+	if not value:
+		return None
+	try:
+		return datetime.strptime(value.strip(), "%Y-%m-%d").date()
+	except ValueError:
+		raise RowError(f"invalid {field} '{value}'")
+
+
+def parse_decimal(value, field):
+	if not value:
+		return None
+	try:
+		return Decimal(value.strip())
+	except InvalidOperation:
+		raise RowError(f"invalid {field} '{value}'")
+
+
+def parse_int(value, field):
+	if not value:
+		return None
+	try:
+		return int(value)
+	except ValueError:
+		raise RowError(f"invalid {field} '{value}'")
+
+
+# Lookup and upsert keys are matched ignoring case, the way MySQL's default collation compares them in IN (...)
+def match_key(key):
+	return key.casefold() if isinstance(key, str) else key
+
+
+# Resolve a name column through a lookup_map result. Blank names are None; unknown names can't be imported.
+def resolve_name(lookup, value, field):
+	value = (value or "").strip()
+	if not value:
+		return None
+	if match_key(value) not in lookup:
+		raise RowError(f"unknown {field} '{value}'")
+	return lookup[match_key(value)]
+
+
+# The values of record whose CSV column is in the file (every row dict has a key per header column), so an
+# upsert leaves the columns the file doesn't have as they are instead of clearing them.
+# sources names the CSV columns a value can be read from when they differ, e.g. {"department_id": ("department_id", "department")}
+def file_columns(row, record, sources=None):
+	sources = sources or {}
+	return {column: value for column, value in record.items() if any(field in row for field in sources.get(column, (column,)))}
+
+
+# Parse the integer keys out of a set of CSV values, ignoring blanks and junk
+def parse_keys(values):
+	keys = set()
+	for value in values:
+		try:
+			keys.add(int(value))
+		except (TypeError, ValueError):
+			pass
+	return keys
+
+
+# Resolve many keys at once with IN (...) queries instead of one query per row.
+# Returns {match_key(key): value}, e.g. lookup_map(Employee.email, Employee.employee_id, emails) -> {email: employee_id}
+def lookup_map(key_column, value_column, keys):
+	keys = list({key for key in keys if key not in (None, "")})
+	result = {}
+	for i in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+		chunk = keys[i:i + LOOKUP_CHUNK_SIZE]
+		for key, value in db.session.execute(select(key_column, value_column).where(key_column.in_(chunk))):
+			result[match_key(key)] = value
+	return result
+
+
+# Stream an uploaded file as batches of (line number, row dict) without reading it all into memory
+def read_batches(file, size=BATCH_SIZE):
+	stream = TextIOWrapper(file.stream if hasattr(file, "stream") else file, encoding="utf-8-sig")
+	csv_reader = csv.DictReader(stream)
+	batch = []
+	for row in csv_reader:
+		batch.append((csv_reader.line_num, row))
+		if len(batch) >= size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+
+# Column values for the rows of table whose key column matches one of keys, as {match_key(key): row mapping}
+def existing_rows(table, key, keys):
+	key_column = table.c[key]
+	keys = list({key for key in keys if key not in (None, "")})
+	result = {}
+	for i in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+		chunk = keys[i:i + LOOKUP_CHUNK_SIZE]
+		for row in db.session.execute(select(table).where(key_column.in_(chunk))).mappings():
+			result.setdefault(match_key(row[key]), row)
+	return result
+
+
+# Split a batch into new rows, changed rows and unchanged rows by comparing it with the rows already stored.
+# Only the columns in the records are compared and written (see file_columns).
+# Changed rows get the existing primary key so they can be updated by it.
+def classify_batch(table, key, records):
+	primary_key = table.primary_key.columns[0].name
+	existing = existing_rows(table, key, (record[key] for record in records))
+	new, changed, unchanged = [], [], 0
+	for record in records:
+		row = existing.get(match_key(record[key]))
+		if row is None:
+			new.append(record)
+		elif all(row[column] == value for column, value in record.items()):
+			unchanged += 1
+		else:
+			changed.append({**record, primary_key: row[primary_key]})
+	return new, changed, unchanged
+
+
+# Update changed rows by primary key in one statement per batch.
+# On MySQL this is a multi-row INSERT ... ON DUPLICATE KEY UPDATE on the primary key (the rows always
+# exist, so it only ever updates); elsewhere an executemany UPDATE ... WHERE primary key = ?.
+# Strict mode rejects that INSERT when a NOT NULL column without a default is missing, even though the row
+# exists, so files with only some columns are written with the UPDATE on MySQL too.
+def update_batch(table, records):
+	primary_key = table.primary_key.columns[0].name
+	columns = [column for column in records[0] if column != primary_key]
+
+	# Python side onupdate values (e.g. updated_at) aren't applied by ON DUPLICATE KEY UPDATE, so set them here
+	for column in table.columns:
+		if column.onupdate is not None and column.onupdate.is_callable and column.name not in columns:
+			now = column.onupdate.arg(None)
+			records = [{**record, column.name: now} for record in records]
+			columns.append(column.name)
+
+	required = {
+		column.name for column in table.columns
+		if not column.nullable and not column.primary_key and column.default is None and column.server_default is None
+	}
+	if db.engine.dialect.name == "mysql" and required <= set(columns):
+		statement = mysql_insert(table)
+		statement = statement.on_duplicate_key_update({column: statement.inserted[column] for column in columns})
+		db.session.execute(statement, records)
+	else:
+		statement = (
+			update(table)
+			.where(table.c[primary_key] == bindparam("_key"))
+			.values({column: bindparam(column) for column in columns})
+		)
+		db.session.execute(statement, [{**record, "_key": record[primary_key]} for record in records])
+
+
+# Import a CSV file in bounded transactions.
+#   prepare(rows) resolves the batch's foreign keys up front (see lookup_map) and returns them as lookups
+#   convert(row, lookups) turns a CSV row into a dict of column values (return None or raise RowError to skip it)
+#   after_write(records) runs inside each batch's transaction with the rows written, e.g. to update the search index
+#   progress(report) is called after every batch, e.g. to update a background job (see jobs.py)
+#   upsert_key, e.g. "asset_tag", updates the rows whose key is already stored instead of inserting them
+#   (converters should then keep rows with existing keys rather than skipping them, report repeated keys
+#   with RowError, and only return the columns the file has, see file_columns)
+# Each batch is written with a single executemany INSERT (and in upsert mode one UPDATE for the changed rows)
+# and committed on its own, so a failing batch is rolled back and reported without losing the batches before it.
+def import_csv(file, table, convert, label, prepare=None, after_write=None, report=None, progress=None, upsert_key=None):
+	report = report or ImportReport(label)
+	report.upsert = upsert_key is not None
+
+	for batch in read_batches(file):
+		lookups = prepare([row for _, row in batch]) if prepare else None
+		records = []
+		for line, row in batch:
+			report.rows += 1
+			try:
+				record = convert(row, lookups)
+			except RowError as e:
+				report.skipped += 1
+				report.error(f"Line {line}: {e}")
+				continue
+			if record is None:
+				report.skipped += 1
+				continue
+			records.append(record)
+
+		if records:
+			try:
+				new, changed, unchanged = records, [], 0
+				if upsert_key:
+					new, changed, unchanged = classify_batch(table, upsert_key, records)
+				if new:
+					db.session.execute(insert(table), new)
+				if changed:
+					update_batch(table, changed)
+				if after_write and (new or changed):
+					after_write(new + changed)
+				db.session.commit()
+				report.imported += len(new)
+				report.updated += len(changed)
+				report.unchanged += unchanged
+			except Exception as e:
+				db.session.rollback()
+				report.skipped += len(records)
+				report.error(f"Lines {batch[0][0]}-{batch[-1][0]}: batch not imported ({e.__class__.__name__}: {e.orig if hasattr(e, 'orig') else e})")
+
+		if progress:
+			progress(report)
+
+	return report.finish()
+
+
+# Flash the summary and the first few errors of an import
+def flash_report(report):
+	flash(report.summary(), "success" if report.imported or report.updated or not report.errors else "danger")
+	for message in report.errors[:MAX_REPORTED_ERRORS]:
+		flash(message, "warning")
+	if len(report.errors) > MAX_REPORTED_ERRORS:
+		flash(f"...and {len(report.errors) - MAX_REPORTED_ERRORS} more errors.", "warning")
@@ -0,0 +1,171 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select
+
+import cache
+from models import db, AssetAssignment, Asset, Employee
+
+# Who held an asset on a given day, reconstructed from the assignment history rather than from
+# assets.assigned_to (which only says who holds it now).
+#
+# An assignment covers the days from assigned_date up to, but not including, returned_date, so an
+# asset returned and handed to someone else on the same day belongs to the new holder that day.
+# When assignments overlap, the one that started last wins.
+
+# Assignment rows fetched per round trip while building the index
+BATCH_SIZE = 10000
+
+# Lifetime of the cached index in seconds; it is also rebuilt whenever assignments change
+INDEX_TTL = 300
+
+# DATETIME columns on MySQL keep whole seconds, so two changes in the same second share an updated_at
+CHANGE_RESOLUTION = timedelta(seconds=1)
+
+
+# Columns of one assignment, in the order the index reads them
+ASSIGNMENT_COLUMNS = (
+	AssetAssignment.assignment_id,
+	AssetAssignment.asset_id,
+	AssetAssignment.employee_id,
+	AssetAssignment.assigned_date,
+	AssetAssignment.returned_date,
+)
+
+
+# An assignment covering day: started on or before it and not returned by then
+def covers(day):
+	return (
+		AssetAssignment.assigned_date <= day,
+		or_(AssetAssignment.returned_date.is_(None), AssetAssignment.returned_date > day),
+	)
+
+
+def _custody(row):
+	return {
+		"assignment_id": row.assignment_id,
+		"asset_id": row.asset_id,
+		"employee_id": row.employee_id,
+		"assigned_date": row.assigned_date.isoformat(),
+		"returned_date": row.returned_date.isoformat() if row.returned_date else None,
+	}
+
+
+# Holder of one asset on day, read from ix_asset_assignments_asset_id_assigned_date
+def holder_on(asset_id, day):
+	row = db.session.execute(
+		select(*ASSIGNMENT_COLUMNS)
+		.where(AssetAssignment.asset_id == asset_id, *covers(day))
+		.order_by(AssetAssignment.assigned_date.desc(), AssetAssignment.assignment_id.desc())
+		.limit(1)
+	).first()
+	return _custody(row) if row else None
+
+
+# Assignments an employee held at any point from start to end (inclusive), read from
+# ix_asset_assignments_employee_id_assigned_date
+def holdings(employee_id, start, end):
+	rows = db.session.execute(
+		select(*ASSIGNMENT_COLUMNS, Asset.asset_tag, Asset.name)
+		.outerjoin(Asset, AssetAssignment.asset_id == Asset.asset_id)
+		.where(
+			AssetAssignment.employee_id == employee_id,
+			AssetAssignment.assigned_date <= end,
+			or_(AssetAssignment.returned_date.is_(None), AssetAssignment.returned_date > start),
+		)
+		.order_by(AssetAssignment.assigned_date, AssetAssignment.assignment_id)
+	).all()
+	return [{**_custody(row), "asset_tag": row.asset_tag, "name": row.name} for row in rows]
+
+
+# In-memory interval index over the whole assignment history, for audits that ask about many
+# assets or many dates. Each asset's assignments are kept sorted by assigned_date, so a lookup is
+# a bisection to the last assignment that started on or before the day.
+class CustodyIndex:
+	def __init__(self):
+		self.starts = {}
+		self.assignments = {}
+
+	# Build the index with one pass over the assignments, in asset and date order
+	@classmethod
+	def load(cls):
+		index = cls()
+		result = db.session.execute(
+			select(*ASSIGNMENT_COLUMNS)
+			.where(AssetAssignment.asset_id.isnot(None))
+			.order_by(AssetAssignment.asset_id, AssetAssignment.assigned_date, AssetAssignment.assignment_id)
+			.execution_options(yield_per=BATCH_SIZE)
+		)
+		for rows in result.partitions():
+			for assignment_id, asset_id, employee_id, assigned_date, returned_date in rows:
+				index.starts.setdefault(asset_id, []).append(assigned_date)
+				index.assignments.setdefault(asset_id, []).append((assigned_date, returned_date, employee_id, assignment_id))
+		return index
+
+	# (employee_id, assignment_id) of whoever held the asset on day, or None.
+	# Assignments normally follow one another, so the walk back past returned ones ends almost at once.
+	def holder(self, asset_id, day):
+		starts = self.starts.get(asset_id)
+		if not starts:
+			return None
+		assignments = self.assignments[asset_id]
+		for i in range(bisect_right(starts, day) - 1, -1, -1):
+			assigned_date, returned_date, employee_id, assignment_id = assignments[i]
+			if returned_date is None or returned_date > day:
+				return employee_id, assignment_id
+		return None
+
+	# Holder of every asset that has assignment history, on day: {asset_id: (employee_id, assignment_id)}
+	def snapshot(self, day):
+		holders = {}
+		for asset_id in sorted(self.starts):
+			holder = self.holder(asset_id, day)
+			if holder:
+				holders[asset_id] = holder
+		return holders
+
+
+# Changes to asset_assignments as the database sees them: (row count, highest ID, latest updated_at).
+# Inserts raise the ID, deletes lower the count and edits move updated_at, whichever worker made them.
+# All three are read from indexes (the count from the smallest one).
+def assignment_signal():
+	return tuple(db.session.execute(
+		select(func.count(AssetAssignment.assignment_id), func.max(AssetAssignment.assignment_id), func.max(AssetAssignment.updated_at))
+	).one())
+
+
+def _load_index(signal):
+	return signal, datetime.utcnow(), CustodyIndex.load()
+
+
+# The index for this process. Writes made by this process rebuild it through the cache's table versions;
+# writes made by other workers are caught by checking assignment_signal() on every call, so the index is
+# never older than the last committed change. An index built less than CHANGE_RESOLUTION after the latest
+# updated_at could miss an edit later in that same second, so it is not reused.
+def custody_index():
+	signal = assignment_signal()
+	built_signal, built_at, index = cache.get_or_set("custody_index", ["asset_assignments"], lambda: _load_index(signal), ttl=INDEX_TTL)
+	latest_change = signal[2]
+	if built_signal != signal or (latest_change is not None and built_at < latest_change + CHANGE_RESOLUTION):
+		cache.discard("custody_index")
+		built_signal, built_at, index = cache.get_or_set("custody_index", ["asset_assignments"], lambda: _load_index(signal), ttl=INDEX_TTL)
+	return index
+
+
+# Rows of the custody snapshot on day, for the audit export: (asset_id, asset_tag, employee_id, employee_email, assignment_id)
+def snapshot_rows(day):
+	holders = custody_index().snapshot(day)
+	asset_tags = {}
+	emails = {}
+	asset_ids = list(holders)
+	employee_ids = list({employee_id for employee_id, _ in holders.values()})
+	for i in range(0, len(asset_ids), BATCH_SIZE):
+		asset_tags.update(db.session.execute(
+			select(Asset.asset_id, Asset.asset_tag).where(Asset.asset_id.in_(asset_ids[i:i + BATCH_SIZE]))
+		).all())
+	for i in range(0, len(employee_ids), BATCH_SIZE):
+		emails.update(db.session.execute(
+			select(Employee.employee_id, Employee.email).where(Employee.employee_id.in_(employee_ids[i:i + BATCH_SIZE]))
+		).all())
+	for asset_id, (employee_id, assignment_id) in holders.items():
+		yield asset_id, asset_tags.get(asset_id), employee_id, emails.get(employee_id), assignment_id
@@ -0,0 +1,234 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import exists, func, select
+
+import cache
+from models import db, Asset, AssetDisposal, AssetType, Department, Employee, Location
+
+# Book values for the asset register. The columns needed are streamed from one query in batches and
+# each batch is depreciated with NumPy array arithmetic, so the cost of a report is one pass over
+# the assets table rather than a Python loop over ORM objects.
+#
+# Each asset type picks its method and useful life (asset_types.depreciation_method, useful_life_years):
+#   straight_line       cost falls evenly to zero over the useful life
+#   declining_balance   cost falls by DECLINING_FACTOR / life each year, compounding, and whatever is
+#                       left is written off at the end of the useful life
+# Assets without a purchase cost or purchase date are not depreciated; disposed assets are left out.
+
+METHODS = ["straight_line", "declining_balance"]
+DEFAULT_METHOD = "straight_line"
+DEFAULT_LIFE_YEARS = 5
+
+# 2 is double declining balance
+DECLINING_FACTOR = 2.0
+
+DAYS_PER_YEAR = 365.25
+
+# Assets per NumPy batch
+BATCH_SIZE = 10000
+
+# Most years in a schedule
+MAX_SCHEDULE_YEARS = 50
+
+# Groupings for the totals: (label column, joins from assets)
+GROUPS = {
+	"type": (AssetType.name, []),
+	"location": (Location.name, [(Location, Asset.location_id == Location.location_id)]),
+	"department": (Department.name, [
+		(Employee, Asset.assigned_to == Employee.employee_id),
+		(Department, Employee.department_id == Department.department_id),
+	]),
+}
+
+# Tables the totals are built from; writing to any of them rebuilds the cached reports
+DEPRECIATION_TABLES = ["assets", "asset_types", "asset_disposals", "locations", "employees", "departments"]
+
+# Tables the fleet book value is built from; the others above only label the groups
+BOOK_VALUE_TABLES = ["assets", "asset_types", "asset_disposals"]
+
+
+# Book value of each asset after age_years, for arrays of the same shape (or broadcastable)
+def book_values(cost, age_years, life_years, declining):
+	straight = cost * np.clip(1 - age_years / life_years, 0, 1)
+	rate = np.minimum(DECLINING_FACTOR / life_years, 1)
+	declining_value = np.where(age_years < life_years, cost * (1 - rate) ** age_years, 0)
+	return np.where(declining, declining_value, straight)
+
+
+# The depreciable assets, with their type's method and life, and an optional label column to group by
+def _fleet_statement(group=None):
+	columns = [Asset.purchase_cost, Asset.purchase_date, AssetType.depreciation_method, AssetType.useful_life_years]
+	statement = select(*columns).outerjoin(AssetType, Asset.asset_type_id == AssetType.asset_type_id)
+	if group:
+		label, joins = GROUPS[group]
+		statement = statement.add_columns(label)
+		for model, condition in joins:
+			statement = statement.outerjoin(model, condition)
+	return _depreciable(statement)
+
+
+def _depreciable(statement):
+	return statement.where(
+		Asset.purchase_cost.isnot(None),
+		Asset.purchase_date.isnot(None),
+		~exists().where(AssetDisposal.asset_id == Asset.asset_id),
+	)
+
+
+# Arrays for rows of (cost, purchase date, method, life)
+def _batch(columns, as_of):
+	purchased = np.array(columns[1], dtype="datetime64[D]")
+	return {
+		"cost": np.array(columns[0], dtype=float),
+		"age": np.maximum((as_of - purchased).astype(float) / DAYS_PER_YEAR, 0),
+		"declining": np.array([method == "declining_balance" for method in columns[2]]),
+		"life": np.array([life or DEFAULT_LIFE_YEARS for life in columns[3]], dtype=float),
+	}
+
+
+# Stream the fleet as dicts of arrays, BATCH_SIZE assets at a time
+def fleet_batches(as_of, group=None):
+	as_of = np.datetime64(as_of, "D")
+	result = db.session.execute(_fleet_statement(group).execution_options(yield_per=BATCH_SIZE))
+	for rows in result.partitions():
+		columns = list(zip(*rows))
+		batch = _batch(columns, as_of)
+		if group:
+			batch["group"] = np.array([label or "None" for label in columns[4]], dtype=object)
+		yield batch
+
+
+# Book value of the whole fleet as of a date. Book value is proportional to cost for a given purchase
+# date, method and life, so the database sums the costs per (purchase date, method, life) and only
+# those sums are depreciated, instead of streaming every asset as the grouped totals do.
+def fleet_book_value(as_of=None):
+	as_of = as_of or date.today()
+	grouping = [Asset.purchase_date, AssetType.depreciation_method, AssetType.useful_life_years]
+	statement = _depreciable(
+		select(func.sum(Asset.purchase_cost), *grouping)
+		.outerjoin(AssetType, Asset.asset_type_id == AssetType.asset_type_id)
+		.group_by(*grouping)
+	)
+	rows = db.session.execute(statement).all()
+	if not rows:
+		return 0.0
+	batch = _batch(list(zip(*rows)), np.datetime64(as_of, "D"))
+	return round(float(book_values(batch["cost"], batch["age"], batch["life"], batch["declining"]).sum()), 2)
+
+
+# Cost, book value and accumulated depreciation as of a date, per group (type, location or department)
+def depreciation_totals(group, as_of=None):
+	as_of = as_of or date.today()
+	totals = {}
+	for batch in fleet_batches(as_of, group):
+		book = book_values(batch["cost"], batch["age"], batch["life"], batch["declining"])
+		labels, index = np.unique(batch["group"], return_inverse=True)
+		counts = np.bincount(index, minlength=len(labels))
+		costs = np.bincount(index, weights=batch["cost"], minlength=len(labels))
+		books = np.bincount(index, weights=book, minlength=len(labels))
+		for label, count, cost, book_value in zip(labels, counts, costs, books):
+			total = totals.setdefault(label, [0, 0.0, 0.0])
+			total[0] += int(count)
+			total[1] += cost
+			total[2] += book_value
+
+	return sorted(
+		(
+			{
+				"group": label,
+				"assets": count,
+				"cost": round(cost, 2),
+				"book_value": round(book_value, 2),
+				"accumulated_depreciation": round(cost - book_value, 2),
+			}
+			for label, (count, cost, book_value) in totals.items()
+		),
+		key=lambda row: (-row["book_value"], row["group"]),
+	)
+
+
+# Fleet book value at as_of and at each of the next years anniversaries, with the depreciation in each year.
+# Every batch is depreciated for all years at once as an (assets x years) array.
+def depreciation_schedule(years, as_of=None):
+	as_of = as_of or date.today()
+	offsets = np.arange(years + 1, dtype=float)
+	book = np.zeros(years + 1)
+	cost = 0.0
+	for batch in fleet_batches(as_of):
+		book += book_values(
+			batch["cost"][:, None],
+			batch["age"][:, None] + offsets,
+			batch["life"][:, None],
+			batch["declining"][:, None],
+		).sum(axis=0)
+		cost += batch["cost"].sum()
+
+	return {
+		"as_of": as_of.isoformat(),
+		"cost": round(cost, 2),
+		"periods": [
+			{
+				"year": int(year),
+				"date": _add_years(as_of, int(year)).isoformat(),
+				"book_value": round(float(book[year]), 2),
+				"depreciation": round(float(book[year - 1] - book[year]), 2) if year else 0.0,
+			}
+			for year in range(years + 1)
+		],
+	}
+
+
+def _add_years(day, years):
+	try:
+		return day.replace(year=day.year + years)
+	except ValueError:
+		# 29 February in a non leap year
+		return day.replace(year=day.year + years, day=28)
+
+
+# Schedule for one asset, year by year from its purchase date to the end of its useful life
+def asset_depreciation(asset):
+	asset_type = asset.asset_type
+	method = (asset_type.depreciation_method if asset_type else None) or DEFAULT_METHOD
+	life = (asset_type.useful_life_years if asset_type else None) or DEFAULT_LIFE_YEARS
+	result = {"asset_id": asset.asset_id, "asset_tag": asset.asset_tag, "method": method, "useful_life_years": life}
+	if asset.purchase_cost is None or asset.purchase_date is None:
+		return {**result, "book_value": None, "periods": []}
+
+	cost = float(asset.purchase_cost)
+	declining = method == "declining_balance"
+	age = max((date.today() - asset.purchase_date).days / DAYS_PER_YEAR, 0)
+	years = np.arange(life + 1, dtype=float)
+	book = book_values(cost, years, float(life), declining)
+
+	return {
+		**result,
+		"cost": round(cost, 2),
+		"book_value": round(float(book_values(cost, age, float(life), declining)), 2),
+		"periods": [
+			{
+				"year": int(year),
+				"date": _add_years(asset.purchase_date, int(year)).isoformat(),
+				"book_value": round(float(book[year]), 2),
+				"depreciation": round(float(book[year - 1] - book[year]), 2) if year else 0.0,
+			}
+			for year in range(life + 1)
+		],
+	}
+
+
+# Cached per day, since book values move with the date, and rebuilt when the register changes
+def cached_totals(group):
+	today = date.today()
+	return cache.get_or_set(f"depreciation:{group}:{today.isoformat()}", DEPRECIATION_TABLES, lambda: depreciation_totals(group, today))
+
+
+def cached_book_value():
+	today = date.today()
+	return cache.get_or_set(f"book_value:{today.isoformat()}", BOOK_VALUE_TABLES, lambda: fleet_book_value(today))
+
+
+def cached_schedule(years):
+	today = date.today()
+	return cache.get_or_set(f"depreciation_schedule:{years}:{today.isoformat()}", DEPRECIATION_TABLES, lambda: depreciation_schedule(years, today))
@@ -0,0 +1,179 @@
+import threading
+import time
+
+from flask import g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Requests slower than this many milliseconds are logged (override with app.config["SLOW_REQUEST_MS"])
+SLOW_REQUEST_MS = 500
+
+# Statements are shortened to this many characters in logs and metrics
+STATEMENT_PREVIEW = 200
+
+# Running totals per endpoint, e.g. "assets.assets", since the process started
+_lock = threading.Lock()
+_endpoints = {}
+
+
+# Per-request counters live on flask.g; statements run outside a request (CLI commands, startup) are not counted
+def _request_stats():
+	if not has_app_context():
+		return None
+	return g.get("sql_stats")
+
+
+# Start times are kept per connection as (statement, start) pairs, so a statement that fails can be matched
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+	conn.info.setdefault("query_started", []).append((statement, time.perf_counter()))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+	_, started = conn.info["query_started"].pop()
+	_count_statement(statement, time.perf_counter() - started)
+
+
+# A statement that raises never reaches after_cursor_execute, so its start time is dropped (and the
+# statement counted) here. Errors raised outside a statement, e.g. while fetching rows, have no entry.
+@event.listens_for(Engine, "handle_error")
+def _fail_statement(exception_context):
+	connection = exception_context.connection
+	statement = exception_context.statement
+	if connection is None or statement is None:
+		return
+	pending = connection.info.get("query_started")
+	if pending and pending[-1][0] is statement:
+		_, started = pending.pop()
+		_count_statement(statement, time.perf_counter() - started)
+
+
+def _count_statement(statement, elapsed):
+	stats = _request_stats()
+	if stats is None:
+		return
+	stats["queries"] += 1
+	stats["db_time"] += elapsed
+	if elapsed > stats["slowest_time"]:
+		stats["slowest_time"] = elapsed
+		stats["slowest_statement"] = " ".join(statement.split())[:STATEMENT_PREVIEW]
+
+
+def _start_render(sender, template, context, **extra):
+	if has_app_context():
+		g.render_started = time.perf_counter()
+
+
+def _finish_render(sender, template, context, **extra):
+	stats = _request_stats()
+	started = g.pop("render_started", None)
+	if stats is not None and started is not None:
+		stats["render_time"] += time.perf_counter() - started
+
+
+def _start_request():
+	g.request_started = time.perf_counter()
+	g.sql_stats = {
+		"queries": 0,
+		"db_time": 0.0,
+		"slowest_time": 0.0,
+		"slowest_statement": None,
+		"render_time": 0.0,
+	}
+
+
+# Add the Server-Timing header, update the endpoint totals and log slow requests.
+# A streamed response (CSV and ZIP exports) runs most of its queries in the generator, after this hook,
+# so its header only covers the work done before streaming started; the totals and the slow request log
+# wait until the stream is closed, when the same stats dict has counted the generator's statements too.
+def _finish_request(response, app):
+	stats = g.get("sql_stats")
+	started = g.get("request_started")
+	if stats is None or started is None:
+		return response
+
+	total = time.perf_counter() - started
+	endpoint = request.endpoint or "<unmatched>"
+
+	response.headers["Server-Timing"] = ", ".join([
+		f'db;dur={stats["db_time"] * 1000:.1f};desc="{stats["queries"]} queries"',
+		f'render;dur={stats["render_time"] * 1000:.1f}',
+		f'total;dur={total * 1000:.1f}',
+	])
+
+	method, path = request.method, request.path
+	if response.is_streamed:
+		response.call_on_close(lambda: _record_request(app, stats, time.perf_counter() - started, endpoint, method, path))
+	else:
+		_record_request(app, stats, total, endpoint, method, path)
+	return response
+
+
+def _record_request(app, stats, total, endpoint, method, path):
+	with _lock:
+		totals = _endpoints.setdefault(endpoint, {
+			"requests": 0,
+			"queries": 0,
+			"db_time": 0.0,
+			"render_time": 0.0,
+			"total_time": 0.0,
+			"max_time": 0.0,
+			"max_queries": 0,
+			"slowest_time": 0.0,
+			"slowest_statement": None,
+		})
+		totals["requests"] += 1
+		totals["queries"] += stats["queries"]
+		totals["db_time"] += stats["db_time"]
+		totals["render_time"] += stats["render_time"]
+		totals["total_time"] += total
+		totals["max_time"] = max(totals["max_time"], total)
+		totals["max_queries"] = max(totals["max_queries"], stats["queries"])
+		if stats["slowest_time"] > totals["slowest_time"]:
+			totals["slowest_time"] = stats["slowest_time"]
+			totals["slowest_statement"] = stats["slowest_statement"]
+
+	if total * 1000 >= app.config.get("SLOW_REQUEST_MS", SLOW_REQUEST_MS):
+		app.logger.warning(
+			"Slow request %s %s (%s): %.0f ms total, %d queries in %.0f ms, render %.0f ms, slowest statement %.0f ms: %s",
+			method, path, endpoint, total * 1000,
+			stats["queries"], stats["db_time"] * 1000, stats["render_time"] * 1000,
+			stats["slowest_time"] * 1000, stats["slowest_statement"],
+		)
+
+
+# Averages and maximums per endpoint, times in milliseconds
+def endpoint_metrics():
+	with _lock:
+		endpoints = {endpoint: dict(totals) for endpoint, totals in _endpoints.items()}
+
+	metrics = {}
+	for endpoint, totals in sorted(endpoints.items()):
+		requests = totals["requests"]
+		metrics[endpoint] = {
+			"requests": requests,
+			"avg_queries": round(totals["queries"] / requests, 1),
+			"max_queries": totals["max_queries"],
+			"avg_db_ms": round(totals["db_time"] * 1000 / requests, 1),
+			"avg_render_ms": round(totals["render_time"] * 1000 / requests, 1),
+			"avg_total_ms": round(totals["total_time"] * 1000 / requests, 1),
+			"max_total_ms": round(totals["max_time"] * 1000, 1),
+			"slowest_statement_ms": round(totals["slowest_time"] * 1000, 1),
+			"slowest_statement": totals["slowest_statement"],
+		}
+	return metrics
+
+
+def reset_metrics():
+	with _lock:
+		_endpoints.clear()
+
+
+# Hook the request lifecycle and template signals into the app.
+# The SQL statement listeners above are registered on every engine when this module is imported.
+def init_app(app):
+	app.before_request(_start_request)
+	app.after_request(lambda response: _finish_request(response, app))
+	before_render_template.connect(_start_render, app)
+	template_rendered.connect(_finish_render, app)
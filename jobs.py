@@ -0,0 +1,166 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app, flash, request, session
+from sqlalchemy import update
+
+from models import db, Job
+from csv_import import flash_report, MAX_REPORTED_ERRORS
+
+# Background jobs run on a small thread pool in each worker process so bulk imports and exports
+# don't hold a request open. The jobs table records their progress and result, so any worker can
+# report on them, but a job only runs in the process that accepted it: jobs still queued or running
+# when that process stops stay that way and have to be started again.
+
+# Threads per process running jobs (override with app.config["JOB_WORKERS"])
+JOB_WORKERS = 2
+
+# Uploads larger than this many bytes are imported in the background (override with app.config["BACKGROUND_IMPORT_BYTES"])
+BACKGROUND_IMPORT_BYTES = 2 * 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app):
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(
+				max_workers=app.config.get("JOB_WORKERS", JOB_WORKERS),
+				thread_name_prefix="jobs",
+			)
+	return _executor
+
+
+# Uploads and export results are kept here (override with app.config["JOB_DIR"])
+def job_dir(app):
+	path = app.config.get("JOB_DIR") or os.path.join(app.instance_path, "jobs")
+	os.makedirs(path, exist_ok=True)
+	return path
+
+
+def _update_job(job_id, **values):
+	db.session.execute(update(Job).where(Job.job_id == job_id).values(**values))
+	db.session.commit()
+
+
+def _create_job(kind, target, job_id=None, file_path=None, file_name=None, total=None):
+	job = Job(
+		job_id=job_id or uuid.uuid4().hex,
+		kind=kind,
+		target=target,
+		status="queued",
+		total=total,
+		file_path=file_path,
+		file_name=file_name,
+		created_by=session.get("username"),
+	)
+	db.session.add(job)
+	db.session.commit()
+	return job.job_id
+
+
+# Run a job function inside an app context, recording its start, end and any error
+def _run(app, job_id, work):
+	with app.app_context():
+		try:
+			_update_job(job_id, status="running", started_at=datetime.utcnow())
+			message = work()
+			_update_job(job_id, status="finished", message=message, finished_at=datetime.utcnow())
+		except Exception as e:
+			db.session.rollback()
+			app.logger.exception("Job %s failed", job_id)
+			_update_job(job_id, status="failed", message=f"{e.__class__.__name__}: {e}", finished_at=datetime.utcnow())
+
+
+# Save an uploaded CSV and import it in the background with import_function(file, progress, **options)
+def start_import(import_function, file, target, **options):
+	app = current_app._get_current_object()
+	job_id = uuid.uuid4().hex
+	path = os.path.join(job_dir(app), f"{job_id}.csv")
+	file.save(path)
+
+	# Data rows in the file, for progress reporting (quoted fields with line breaks make this an estimate)
+	with open(path, "rb") as saved:
+		total = max(sum(chunk.count(b"\n") for chunk in iter(lambda: saved.read(1 << 20), b"")) - 1, 0)
+
+	_create_job("import", target, job_id=job_id, file_path=path, file_name=file.filename, total=total)
+
+	def work():
+		def progress(report):
+			_update_job(job_id, processed=report.rows)
+
+		try:
+			with open(path, "rb") as upload:
+				report = import_function(upload, progress=progress, **options)
+		finally:
+			os.remove(path)
+		_update_job(job_id, processed=report.rows)
+
+		lines = [report.summary()] + report.errors[:MAX_REPORTED_ERRORS]
+		if len(report.errors) > MAX_REPORTED_ERRORS:
+			lines.append(f"...and {len(report.errors) - MAX_REPORTED_ERRORS} more errors.")
+		return "\n".join(lines)
+
+	_get_executor(app).submit(_run, app, job_id, work)
+	return job_id
+
+
+# Write the chunks produced by generate(progress) to a file in the background, for download once finished.
+# generate runs inside the job's app context and calls progress(done) between reads, out of total steps,
+# e.g. generate_export for the full database zip. Progress is only recorded there, never while a
+# server-side cursor is still open on the session.
+def start_export(generate, target, file_name, total=None):
+	app = current_app._get_current_object()
+	job_id = _create_job("export", target, file_name=file_name, total=total)
+	path = os.path.join(job_dir(app), f"{job_id}-{file_name}")
+
+	def work():
+		def progress(done):
+			_update_job(job_id, processed=done)
+
+		written = 0
+		with open(path, "wb") as output:
+			for chunk in generate(progress):
+				output.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+				written += len(chunk)
+		_update_job(job_id, file_path=path)
+		return f"Exported {written:,} bytes."
+
+	_get_executor(app).submit(_run, app, job_id, work)
+	return job_id
+
+
+# Import an upload right away, or queue it as a background job when it is large.
+# options are passed on to import_function, e.g. upsert=True.
+def import_or_queue(import_function, file, target, **options):
+	limit = current_app.config.get("BACKGROUND_IMPORT_BYTES", BACKGROUND_IMPORT_BYTES)
+	if (request.content_length or 0) > limit:
+		job_id = start_import(import_function, file, target, **options)
+		flash(f"Large file, importing {target} in the background (job {job_id[:8]}). Follow its progress on the Jobs page.", "info")
+		return job_id
+
+	flash_report(import_function(file, **options))
+	return None
+
+
+# Plain dict of a job for the status endpoint
+def job_status(job):
+	return {
+		"job_id": job.job_id,
+		"kind": job.kind,
+		"target": job.target,
+		"status": job.status,
+		"processed": job.processed,
+		"total": job.total,
+		"message": job.message,
+		"download": job.kind == "export" and job.status == "finished" and session.get("role") == "admin",
+		"created_by": job.created_by,
+		"created_at": job.created_at.isoformat() if job.created_at else None,
+		"started_at": job.started_at.isoformat() if job.started_at else None,
+		"finished_at": job.finished_at.isoformat() if job.finished_at else None,
+	}
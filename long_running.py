@@ -0,0 +1,44 @@
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+
+from config import long_running_engine_options
+from models import db
+
+# Connections for work that can run one statement for minutes: migrations (online index builds),
+# full reconciliation runs and the search index rebuild. The app's engine has a request-sized pool
+# and read timeout (see config.py); if a statement outlasts that timeout the driver drops the
+# connection while the server keeps working, and the work is never recorded as done.
+
+_lock = threading.Lock()
+_engines = {}
+
+
+# An unpooled engine for the app's database, without the read timeout
+def long_running_engine():
+	url = db.engine.url
+	with _lock:
+		engine = _engines.get(url)
+		if engine is None:
+			engine = _engines[url] = create_engine(url, **long_running_engine_options(url))
+	return engine
+
+
+# Run the block with db.session on a long-running connection, so code written against db.session
+# works unchanged; the previous session is put back afterwards. Objects stay readable after the
+# block, since the session does not expire them on commit.
+@contextmanager
+def long_running_session():
+	registry = db.session.registry
+	previous = registry() if registry.has() else None
+	session = db.session.session_factory(bind=long_running_engine(), expire_on_commit=False)
+	registry.set(session)
+	try:
+		yield session
+	finally:
+		session.close()
+		if previous is None:
+			registry.clear()
+		else:
+			registry.set(previous)
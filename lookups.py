@@ -0,0 +1,89 @@
+from collections import namedtuple
+
+from sqlalchemy import select
+
+import cache
+from models import db, Asset, AssetType, AssetStatus, Department, Employee, Location, Vendor
+
+# Lookup lists change rarely and are invalidated on every write to their table, so they can live longer than other cached data
+LOOKUP_TTL = 300
+
+# Dropdown options are plain tuples named like the model attributes the templates already use,
+# e.g. {{ emp.employee_id }} {{ emp.first_name }} works the same for an Employee or an EmployeeOption
+AssetTypeOption = namedtuple("AssetTypeOption", ["asset_type_id", "name"])
+StatusOption = namedtuple("StatusOption", ["status_id", "status_name"])
+LocationOption = namedtuple("LocationOption", ["location_id", "name"])
+VendorOption = namedtuple("VendorOption", ["vendor_id", "name"])
+DepartmentOption = namedtuple("DepartmentOption", ["department_id", "name"])
+EmployeeOption = namedtuple("EmployeeOption", ["employee_id", "first_name", "last_name"])
+
+
+# Load the option list for a model from the cache, selecting only the columns the dropdown needs.
+# Entries are keyed on the model's table, so any committed write to it rebuilds the list.
+def _options(option, model, order_by):
+	table = model.__table__.name
+
+	def load():
+		columns = [getattr(model, field) for field in option._fields]
+		rows = db.session.execute(select(*columns).order_by(*order_by)).all()
+		return [option(*row) for row in rows]
+
+	return cache.get_or_set(f"lookup:{table}", [table], load, ttl=LOOKUP_TTL)
+
+
+def asset_type_options():
+	return _options(AssetTypeOption, AssetType, [AssetType.name])
+
+
+def status_options():
+	return _options(StatusOption, AssetStatus, [AssetStatus.status_name])
+
+
+def location_options():
+	return _options(LocationOption, Location, [Location.name])
+
+
+def vendor_options():
+	return _options(VendorOption, Vendor, [Vendor.name])
+
+
+def department_options():
+	return _options(DepartmentOption, Department, [Department.name])
+
+
+def employee_options():
+	return _options(EmployeeOption, Employee, [Employee.last_name, Employee.first_name])
+
+
+# Assets are too many to cache or list in a dropdown, so forms look them up as the user types
+# (see asset_picker.html). Tags and names are matched by prefix, each read in order from its index.
+ASSET_MATCH_LIMIT = 20
+
+
+def _like_prefix(text):
+	return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def asset_label(asset_tag, name):
+	return f"{asset_tag} - {name}"
+
+
+def asset_matches(text, limit=ASSET_MATCH_LIMIT):
+	pattern = _like_prefix(text.strip())
+	by_tag = db.session.execute(
+		select(Asset.asset_id, Asset.asset_tag, Asset.name)
+		.where(Asset.asset_tag.like(pattern, escape="\\"))
+		.order_by(Asset.asset_tag)
+		.limit(limit)
+	).all()
+	by_name = db.session.execute(
+		select(Asset.asset_id, Asset.asset_tag, Asset.name)
+		.where(Asset.name.like(pattern, escape="\\"))
+		.order_by(Asset.name, Asset.asset_id)
+		.limit(limit)
+	).all()
+
+	matches = {}
+	for asset_id, asset_tag, name in by_tag + by_name:
+		matches.setdefault(asset_id, {"asset_id": asset_id, "label": asset_label(asset_tag, name)})
+	return list(matches.values())[:limit]
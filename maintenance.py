@@ -0,0 +1,60 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Integer, text
+
+from models import db
+from migrations import create_missing_indexes
+
+
+# Tables whose primary key is a single auto-increment integer
+def auto_increment_tables():
+	tables = []
+	for table in sorted(db.metadata.tables.values(), key=lambda table: table.name):
+		key = list(table.primary_key.columns)
+		if len(key) == 1 and isinstance(key[0].type, Integer) and key[0].autoincrement in (True, "auto"):
+			tables.append(table.name)
+	return tables
+
+
+# Move each table's AUTO_INCREMENT counter back down to MAX(id) + 1 so IDs freed by deletes are not skipped.
+# This is DDL: on MySQL it takes a metadata lock and blocks writers on the table, so it belongs in a
+# maintenance window and never on the request path. New rows simply take the next ID the database hands out.
+def reset_auto_increment(tables=None):
+	if db.engine.dialect.name != "mysql":
+		return []
+
+	tables = tables or auto_increment_tables()
+	with db.engine.connect() as connection:
+		for table in tables:
+			connection.execute(text(f"ALTER TABLE `{table}` AUTO_INCREMENT = 1"))
+	return tables
+
+
+@click.command("reset-auto-increment")
+@click.argument("tables", nargs=-1)
+@with_appcontext
+def reset_auto_increment_command(tables):
+	known = auto_increment_tables()
+	unknown = [table for table in tables if table not in known]
+	if unknown:
+		raise click.BadParameter(f"not an auto-increment table: {', '.join(unknown)}", param_hint="TABLES")
+
+	reset = reset_auto_increment(list(tables))
+	if not reset:
+		click.echo(f"Nothing to do, {db.engine.dialect.name} does not use AUTO_INCREMENT counters.")
+		return
+	for table in reset:
+		click.echo(f"Reset AUTO_INCREMENT on {table}.")
+
+
+# Add every model index the database is missing, without waiting for a migration (see migrations.py)
+@click.command("create-indexes")
+@with_appcontext
+def create_indexes_command():
+	created, skipped = create_missing_indexes()
+	if not created and not skipped:
+		click.echo("All indexes already exist.")
+	for name in created:
+		click.echo(f"Created index {name}.")
+	for name in skipped:
+		click.echo(f"Skipped index {name}, its columns don't exist yet (run db-upgrade).")
@@ -0,0 +1,138 @@
+from datetime import date, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, exists, func, select, update
+
+import cache
+from models import db, Asset, AssetMaintenance, AssetDisposal, Location
+
+# Each asset's next maintenance date is the latest next_due_date among its maintenance records.
+# It is stored on the asset (assets.next_maintenance_due, indexed) and refreshed whenever the asset's
+# maintenance records change, so the due queue is an index range read on assets instead of a
+# GROUP BY over the whole maintenance history.
+
+# Default and largest window for "due soon", in days
+DEFAULT_DAYS = 30
+MAX_DAYS = 3650
+
+# Most assets returned by the due queue
+QUEUE_LIMIT = 100
+
+# Assets shown in the dashboard panel
+DASHBOARD_ITEMS = 10
+
+BATCH_SIZE = 1000
+
+# Tables the due queue is built from; writing to any of them rebuilds the cached dashboard panel
+DUE_TABLES = ["assets", "asset_maintenance", "asset_disposals"]
+
+
+# Recompute next_maintenance_due for the given assets (call after their maintenance records are
+# added, edited or deleted, before committing). Each asset's MAX(next_due_date) is read from
+# ix_asset_maintenance_asset_id_next_due_date.
+def refresh_next_due(asset_ids):
+	asset_ids = list({asset_id for asset_id in asset_ids if asset_id is not None})
+	latest = (
+		select(func.max(AssetMaintenance.next_due_date))
+		.where(AssetMaintenance.asset_id == Asset.asset_id)
+		.scalar_subquery()
+	)
+	for i in range(0, len(asset_ids), BATCH_SIZE):
+		batch = asset_ids[i:i + BATCH_SIZE]
+		db.session.execute(
+			update(Asset)
+			.where(Asset.asset_id.in_(batch))
+			# A derived column, so the asset's updated_at is left as it was
+			.values(next_maintenance_due=latest, updated_at=Asset.updated_at)
+			.execution_options(synchronize_session=False)
+		)
+
+
+# Recompute every asset in batches, walking the assets table by primary key
+def rebuild_next_due():
+	last_id = 0
+	count = 0
+	while True:
+		batch = db.session.execute(
+			select(Asset.asset_id).where(Asset.asset_id > last_id).order_by(Asset.asset_id).limit(BATCH_SIZE)
+		).scalars().all()
+		if not batch:
+			break
+		refresh_next_due(batch)
+		db.session.commit()
+		last_id = batch[-1]
+		count += len(batch)
+	return count
+
+
+@click.command("rebuild-maintenance-due")
+@with_appcontext
+def rebuild_maintenance_due_command():
+	count = rebuild_next_due()
+	click.echo(f"Updated the next maintenance date of {count} assets.")
+
+
+# Disposed assets no longer need maintenance
+def _not_disposed():
+	return ~exists().where(AssetDisposal.asset_id == Asset.asset_id)
+
+
+# Assets due for maintenance on or before today + days, most overdue first
+def due_queue(days=DEFAULT_DAYS, limit=QUEUE_LIMIT, today=None):
+	today = today or date.today()
+	horizon = today + timedelta(days=days)
+	rows = db.session.execute(
+		select(
+			Asset.asset_id,
+			Asset.asset_tag,
+			Asset.name,
+			Location.name.label("location"),
+			Asset.next_maintenance_due,
+		)
+		.outerjoin(Location, Asset.location_id == Location.location_id)
+		.where(Asset.next_maintenance_due <= horizon, _not_disposed())
+		.order_by(Asset.next_maintenance_due, Asset.asset_id)
+		.limit(limit)
+	).all()
+	return [
+		{
+			"asset_id": row.asset_id,
+			"asset_tag": row.asset_tag,
+			"name": row.name,
+			"location": row.location,
+			"next_maintenance_due": row.next_maintenance_due.isoformat(),
+			"days_until_due": (row.next_maintenance_due - today).days,
+			"overdue": row.next_maintenance_due < today,
+		}
+		for row in rows
+	]
+
+
+# Number of assets overdue and due within the window, counted from the index in one query
+def due_counts(days=DEFAULT_DAYS, today=None):
+	today = today or date.today()
+	horizon = today + timedelta(days=days)
+	overdue, upcoming = db.session.execute(
+		select(
+			func.coalesce(func.sum(case((Asset.next_maintenance_due < today, 1), else_=0)), 0),
+			func.coalesce(func.sum(case((Asset.next_maintenance_due >= today, 1), else_=0)), 0),
+		)
+		.where(Asset.next_maintenance_due <= horizon, _not_disposed())
+	).one()
+	return {"overdue": int(overdue), "upcoming": int(upcoming)}
+
+
+# Counts and the first few assets for the dashboard panel, cached until maintenance, assets or
+# disposals change (and per day, since "overdue" moves with the date)
+def dashboard_summary(days=DEFAULT_DAYS):
+	today = date.today()
+	return cache.get_or_set(
+		f"maintenance_due:{today.isoformat()}:{days}",
+		DUE_TABLES,
+		lambda: {
+			"days": days,
+			**due_counts(days, today),
+			"assets": due_queue(days, DASHBOARD_ITEMS, today),
+		},
+	)
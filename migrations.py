@@ -0,0 +1,258 @@
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, select, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from long_running import long_running_engine, long_running_session
+from models import db, SchemaMigration, Job, Asset, AssetMaintenance, AssetType, AssetAssignment, ReconciliationRun, AssetSearchToken
+
+# Versioned schema changes for databases created before a change was added to models.py.
+# db.create_all() only creates missing tables, so every index or column added to an existing table
+# also gets a migration below. Each step checks the live schema first, which makes them safe to run
+# against a database created from the current models.py (they are just recorded as applied).
+#
+# On MySQL indexes and columns are added with online DDL (ALGORITHM=INPLACE, LOCK=NONE), so InnoDB
+# keeps accepting reads and writes on the table while it builds them. That can take far longer than a
+# request, so migrations run on a long-running connection without the app's read timeout (see long_running.py).
+#
+#     flask --app app db-status
+#     flask --app app db-upgrade
+
+# Name of the MySQL advisory lock held while migrating, so two deploys can't run migrations at once
+LOCK_NAME = "asset_management_schema_migrations"
+LOCK_TIMEOUT = 10
+
+
+def _is_mysql():
+	return db.engine.dialect.name == "mysql"
+
+
+def _online(statement):
+	return statement + " ALGORITHM=INPLACE LOCK=NONE" if _is_mysql() else statement
+
+
+def _index_names(table_name):
+	return {index["name"] for index in inspect(db.engine).get_indexes(table_name)}
+
+
+def _column_names(table_name):
+	return {column["name"] for column in inspect(db.engine).get_columns(table_name)}
+
+
+# An index declared in models.py, by name
+def model_index(model, name):
+	return next(index for index in model.__table__.indexes if index.name == name)
+
+
+# Create one index declared in models.py, if the database doesn't have it yet
+def create_index(index):
+	if index.name in _index_names(index.table.name):
+		return False
+	statement = str(CreateIndex(index).compile(dialect=db.engine.dialect))
+	with long_running_engine().begin() as connection:
+		connection.execute(text(_online(statement)))
+	return True
+
+
+# Create an index given by table, name and columns, if the database doesn't have it yet.
+# Migrations use this for indexes as they were at their version, so later edits to models.py can't change them.
+def create_named_index(table_name, name, columns):
+	if name in _index_names(table_name):
+		return False
+	with long_running_engine().begin() as connection:
+		connection.execute(text(_online(f"CREATE INDEX {name} ON {table_name} ({', '.join(columns)})")))
+	return True
+
+
+# Add one column declared in models.py to its existing table, if the database doesn't have it yet
+def add_column(column):
+	if column.name in _column_names(column.table.name):
+		return False
+	definition = str(CreateColumn(column).compile(dialect=db.engine.dialect))
+	statement = f"ALTER TABLE {column.table.name} ADD COLUMN {definition}"
+	if _is_mysql():
+		statement += ", ALGORITHM=INPLACE, LOCK=NONE"
+	with long_running_engine().begin() as connection:
+		connection.execute(text(statement))
+	return True
+
+
+# Create a table added to models.py after the database was created, along with its indexes
+def create_table(model):
+	model.__table__.create(bind=long_running_engine(), checkfirst=True)
+
+
+# Model indexes (see models.py) that the live database does not have yet, as (index, missing columns).
+# An index on a column that a pending migration adds lists that column as missing.
+def missing_indexes():
+	inspector = inspect(db.engine)
+	existing_tables = set(inspector.get_table_names())
+	missing = []
+	for table in sorted(db.metadata.tables.values(), key=lambda table: table.name):
+		if table.name not in existing_tables:
+			continue
+		existing = {index["name"] for index in inspector.get_indexes(table.name)}
+		columns = {column["name"] for column in inspector.get_columns(table.name)}
+		missing += [
+			(index, [column.name for column in index.columns if column.name not in columns])
+			for index in sorted(table.indexes, key=lambda index: index.name)
+			if index.name not in existing
+		]
+	return missing
+
+
+# Create the missing indexes whose columns exist; returns the names created and the names skipped
+def create_missing_indexes():
+	created = []
+	skipped = []
+	for index, missing_columns in missing_indexes():
+		name = f"{index.table.name}.{index.name}"
+		if missing_columns:
+			skipped.append(name)
+		elif create_index(index):
+			created.append(name)
+	return created, skipped
+
+
+# Migrations -------------------------------------------------------------------------------------------
+
+# The list page indexes as they were declared when 0001 was added: (table, index name, columns).
+# Indexes added to models.py since then belong to the migration that added them (and their columns).
+LIST_PAGE_INDEXES = [
+	("asset_types", "ix_asset_types_name", ["name"]),
+	("asset_statuses", "ix_asset_statuses_status_name", ["status_name"]),
+	("departments", "ix_departments_name", ["name"]),
+	("departments", "ix_departments_manager_id", ["manager_id"]),
+	("employees", "ix_employees_last_name_first_name", ["last_name", "first_name", "employee_id"]),
+	("employees", "ix_employees_first_name", ["first_name", "employee_id"]),
+	("employees", "ix_employees_department_id", ["department_id", "employee_id"]),
+	("locations", "ix_locations_name", ["name"]),
+	("vendors", "ix_vendors_name", ["name"]),
+	("assets", "ix_assets_assigned_to", ["assigned_to", "asset_id"]),
+	("assets", "ix_assets_name", ["name", "asset_id"]),
+	("assets", "ix_assets_serial_number", ["serial_number", "asset_id"]),
+	("assets", "ix_assets_purchase_date", ["purchase_date", "asset_id"]),
+	("assets", "ix_assets_purchase_cost", ["purchase_cost", "asset_id"]),
+	("assets", "ix_assets_warranty_expiry", ["warranty_expiry", "asset_id"]),
+	("assets", "ix_assets_asset_type_id", ["asset_type_id", "asset_id"]),
+	("assets", "ix_assets_status_id", ["status_id", "asset_id"]),
+	("assets", "ix_assets_location_id", ["location_id", "asset_id"]),
+	("assets", "ix_assets_vendor_id", ["vendor_id", "asset_id"]),
+	("asset_assignments", "ix_asset_assignments_asset_id", ["asset_id", "assignment_id"]),
+	("asset_assignments", "ix_asset_assignments_employee_id", ["employee_id", "assignment_id"]),
+	("asset_assignments", "ix_asset_assignments_assigned_date", ["assigned_date", "assignment_id"]),
+	("asset_assignments", "ix_asset_assignments_returned_date", ["returned_date", "assignment_id"]),
+	("asset_maintenance", "ix_asset_maintenance_asset_id", ["asset_id", "maintenance_id"]),
+	("asset_maintenance", "ix_asset_maintenance_maintenance_date", ["maintenance_date", "maintenance_id"]),
+	("asset_maintenance", "ix_asset_maintenance_next_due_date", ["next_due_date", "maintenance_id"]),
+	("asset_disposals", "ix_asset_disposals_asset_id", ["asset_id", "disposal_id"]),
+	("asset_disposals", "ix_asset_disposals_disposal_date", ["disposal_date", "disposal_id"]),
+]
+
+
+def _0001_list_page_indexes():
+	for table_name, name, columns in LIST_PAGE_INDEXES:
+		create_named_index(table_name, name, columns)
+
+
+def _0002_jobs_table():
+	create_table(Job)
+
+
+def _0003_next_maintenance_due():
+	from maintenance_schedule import rebuild_next_due
+
+	add_column(Asset.__table__.c.next_maintenance_due)
+	create_index(model_index(Asset, "ix_assets_next_maintenance_due"))
+	create_index(model_index(AssetMaintenance, "ix_asset_maintenance_asset_id_next_due_date"))
+	rebuild_next_due()
+
+
+def _0004_asset_type_depreciation():
+	add_column(AssetType.__table__.c.depreciation_method)
+	add_column(AssetType.__table__.c.useful_life_years)
+
+
+def _0005_custody_indexes():
+	create_index(model_index(AssetAssignment, "ix_asset_assignments_asset_id_assigned_date"))
+	create_index(model_index(AssetAssignment, "ix_asset_assignments_employee_id_assigned_date"))
+
+
+def _0006_assignment_reconciliation():
+	add_column(AssetAssignment.__table__.c.updated_at)
+	create_index(model_index(AssetAssignment, "ix_asset_assignments_updated_at"))
+	create_index(model_index(Asset, "ix_assets_updated_at"))
+	create_table(ReconciliationRun)
+
+
+def _0007_asset_search_tokens():
+	from search_index import rebuild_index
+
+	create_table(AssetSearchToken)
+	# A database that already had the table also has its index; a new, empty one is filled from the assets
+	if db.session.execute(select(AssetSearchToken.asset_id).limit(1)).first() is None:
+		rebuild_index()
+
+
+# (version, description, upgrade function), applied in order. Never edit or reorder an applied migration,
+# add a new one instead.
+MIGRATIONS = [
+	("0001", "Indexes for list page filters, joins and sorts", _0001_list_page_indexes),
+	("0002", "Background jobs table", _0002_jobs_table),
+	("0003", "Next maintenance due date on assets", _0003_next_maintenance_due),
+	("0004", "Depreciation method and useful life on asset types", _0004_asset_type_depreciation),
+	("0005", "Assignment indexes for custody lookups", _0005_custody_indexes),
+	("0006", "Assignment reconciliation runs and change tracking", _0006_assignment_reconciliation),
+	("0007", "Asset search index table", _0007_asset_search_tokens),
+]
+
+
+def applied_versions():
+	SchemaMigration.__table__.create(bind=db.engine, checkfirst=True)
+	return set(db.session.execute(select(SchemaMigration.version)).scalars())
+
+
+def pending_migrations():
+	applied = applied_versions()
+	return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+# Apply every pending migration in order, recording each one as soon as it succeeds
+def upgrade(echo=None):
+	echo = echo or (lambda message: None)
+	applied = []
+
+	with long_running_engine().connect() as lock, long_running_session():
+		if _is_mysql() and not lock.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT}).scalar():
+			raise click.ClickException("Another process is running migrations.")
+		try:
+			for version, name, migrate in pending_migrations():
+				echo(f"Applying {version}: {name}...")
+				started = time.perf_counter()
+				migrate()
+				db.session.add(SchemaMigration(version=version, name=name))
+				db.session.commit()
+				applied.append(version)
+				echo(f"Applied {version} in {time.perf_counter() - started:.1f}s.")
+		finally:
+			if _is_mysql():
+				lock.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+	return applied
+
+
+@click.command("db-upgrade")
+@with_appcontext
+def db_upgrade_command():
+	applied = upgrade(echo=click.echo)
+	if not applied:
+		click.echo("Database is up to date.")
+
+
+@click.command("db-status")
+@with_appcontext
+def db_status_command():
+	applied = applied_versions()
+	for version, name, _ in MIGRATIONS:
+		click.echo(f"{version}  {'applied' if version in applied else 'pending'}  {name}")
@@ -2,184 +2,133 @@ import csv
 import io
 import zipfile
 
-from flask import send_file
-
-from models import Asset, AssetStatus, Employee, AssetAssignment, AssetType, AssetMaintenance, AssetDisposal, Department, Vendor, Location
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from models import db, Asset, AssetStatus, Employee, AssetAssignment, AssetType, AssetMaintenance, AssetDisposal, Department, Vendor, Location
+
+# Rows fetched from the server-side cursor per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Bytes of CSV buffered before a chunk is sent, for rows streamed from Python (see generate_csv_rows)
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Files in the full database export: (file name, model, columns)
+EXPORT_TABLES = [
+    ("assets.csv", Asset, [
+        "asset_id", "asset_tag", "name", "description", "asset_type_id", "status_id",
+        "location_id", "assigned_to", "purchase_date", "purchase_cost",
+        "vendor_id", "warranty_expiry", "serial_number"
+    ]),
+    ("employees.csv", Employee, ["employee_id", "first_name", "last_name", "email", "phone", "department_id", "role", "status"]),
+    ("departments.csv", Department, ["department_id", "name", "manager_id"]),
+    ("asset_types.csv", AssetType, ["asset_type_id", "name", "category", "description"]),
+    ("asset_statuses.csv", AssetStatus, ["status_id", "status_name"]),
+    ("locations.csv", Location, ["location_id", "name", "address", "city", "country"]),
+    ("vendors.csv", Vendor, ["vendor_id", "name", "contact_name", "phone", "email", "address"]),
+    ("asset_assignments.csv", AssetAssignment, ["assignment_id", "asset_id", "employee_id", "assigned_date", "returned_date"]),
+    ("asset_maintenances.csv", AssetMaintenance, ["maintenance_id", "asset_id", "maintenance_date", "description", "performed_by", "cost", "next_due_date"]),
+    ("asset_disposals.csv", AssetDisposal, ["disposal_id", "asset_id", "disposal_date", "method", "sale_value", "notes"]),
+]
+
+
+# Write-only file object that hands whatever the zip writer produced to the response generator.
+# It has no seek/tell, so zipfile writes entries in streaming mode (sizes go in data descriptors).
+class ZipStream:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Stream rows from a server-side cursor straight into a CSV entry of the zip
+def write_table(zip_file, stream, filename, model, columns):
+    with zip_file.open(filename, "w", force_zip64=True) as entry:
+        output = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+        writer = csv.writer(output)
+        writer.writerow(columns)
+
+        table_columns = [model.__table__.c[column] for column in columns]
+        result = db.session.execute(
+            select(*table_columns).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        for rows in result.partitions():
+            writer.writerows(rows)
+            output.flush()
+            yield stream.pop()
+
+        output.flush()
+        output.detach()
+    yield stream.pop()
+
+
+# Stream the rows of a select() as a CSV file, one batch from the server-side cursor at a time.
+# The header comes from the selected column names, so label joined columns, e.g. Vendor.name.label("vendor").
+def generate_csv(statement):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(statement.selected_columns.keys())
+    yield output.getvalue()
+
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for rows in result.partitions():
+        output.seek(0)
+        output.truncate()
+        writer.writerows(rows)
+        yield output.getvalue()
+
+
+# Stream rows that were not read with a single select(), e.g. computed in Python, as a CSV file
+def generate_csv_rows(header, rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if output.tell() >= EXPORT_CHUNK_BYTES:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+
+def csv_response(statement, filename):
+    return csv_stream_response(generate_csv(statement), filename)
+
+
+def csv_stream_response(chunks, filename):
+    return Response(
+        stream_with_context(chunks),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
+
+
+# Generate the zip file chunk by chunk so memory use stays flat regardless of table size.
+# progress, if given, is called with the number of tables written after each one finishes.
+def generate_export(progress=None):
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for done, (filename, model, columns) in enumerate(EXPORT_TABLES, start=1):
+            yield from write_table(zip_file, stream, filename, model, columns)
+            if progress:
+                progress(done)
+    yield stream.pop()
 
 
 def export_db():
-    # Create a buffer for the zip
-    zip_buffer = io.BytesIO()
-
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        # --- ASSETS ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            "asset_id", "asset_tag", "name", "description", "asset_type_id", "status_id",
-            "location_id", "assigned_to", "purchase_date", "purchase_cost",
-            "vendor_id", "warranty_expiry", "serial_number"
-        ])
-        for a in Asset.query.all():
-            writer.writerow([
-                a.asset_id,
-                a.asset_tag,
-                a.name,
-                a.description,
-                a.asset_type_id,
-                a.status_id,
-                a.location_id,
-                a.assigned_to,
-                a.purchase_date,
-                a.purchase_cost,
-                a.vendor_id,
-                a.warranty_expiry,
-                a.serial_number
-            ])
-        zip_file.writestr("assets.csv", output.getvalue())
-        output.close()
-
-        # --- EMPLOYEES ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["employee_id", "first_name", "last_name", "email", "phone", "department_id", "role", "status"])
-        for e in Employee.query.all():
-            writer.writerow([
-                e.employee_id,
-                e.first_name,
-                e.last_name,
-                e.email,
-                e.phone,
-                e.department_id,
-                e.role,
-                e.status
-            ])
-        zip_file.writestr("employees.csv", output.getvalue())
-        output.close()
-
-        # --- DEPARTMENTS ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["department_id", "name", "manager_id"])
-        for d in Department.query.all():
-            writer.writerow([
-                d.department_id,
-                d.name,
-                d.manager_id
-            ])
-        zip_file.writestr("departments.csv", output.getvalue())
-        output.close()
-
-        # --- ASSET TYPES ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["asset_type_id", "name", "category", "description"])
-        for a in AssetType.query.all():
-            writer.writerow([
-                a.asset_type_id,
-                a.name,
-                a.category,
-                a.description
-            ])
-        zip_file.writestr("asset_types.csv", output.getvalue())
-        output.close()
-
-        # --- ASSET STATUSES ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["status_id", "status_name"])
-        for a in AssetStatus.query.all():
-            writer.writerow([
-                a.status_id,
-                a.status_name,
-            ])
-        zip_file.writestr("asset_statuses.csv", output.getvalue())
-        output.close()
-
-        # --- LOCATIONS ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["location_id", "name","address","city","country"])
-        for l in Location.query.all():
-            writer.writerow([
-                l.location_id,
-                l.name,
-                l.address,
-                l.city,
-                l.country
-            ])
-        zip_file.writestr("locations.csv", output.getvalue())
-        output.close()
-
-        # --- VENDORS ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["vendor_id","name","contact_name","phone","email","address"])
-        for v in Vendor.query.all():
-            writer.writerow([
-                v.vendor_id,
-                v.name,
-                v.contact_name,
-                v.phone,
-                v.email,
-                v.address
-            ])
-        zip_file.writestr("vendors.csv", output.getvalue())
-        output.close()
-
-        # --- ASSET ASSIGNMENTS ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["assignment_id","asset_id","employee_id","assigned_date","returned_date"])
-        for a in AssetAssignment.query.all():
-            writer.writerow([
-                a.assignment_id,
-                a.asset_id,
-                a.employee_id,
-                a.assigned_date,
-                a.returned_date,
-            ])
-        zip_file.writestr("asset_assignments.csv", output.getvalue())
-        output.close()
-
-        # --- ASSET MAINTENANCES ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["maintenance_id","asset_id","maintenance_date","description","performed_by","cost","next_due_date"])
-        for a in AssetMaintenance.query.all():
-            writer.writerow([
-                a.maintenance_id,
-                a.asset_id,
-                a.maintenance_date,
-                a.description,
-                a.performed_by,
-                a.cost,
-                a.next_due_date
-            ])
-        zip_file.writestr("asset_maintenances.csv", output.getvalue())
-        output.close()
-
-        # --- ASSET DISPOSALS ---
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["disposal_id","asset_id","disposal_date","method","sale_value","notes"])
-        for a in AssetDisposal.query.all():
-            writer.writerow([
-                a.disposal_id,
-                a.asset_id,
-                a.disposal_date,
-                a.method,
-                a.sale_value,
-                a.notes
-            ])
-        zip_file.writestr("asset_disposals.csv", output.getvalue())
-        output.close()
-
-    zip_buffer.seek(0)
-
-    return send_file(
-        zip_buffer,
+    return Response(
+        stream_with_context(generate_export()),
         mimetype="application/zip",
-        as_attachment=True,
-        download_name="full_database_export.zip"
-    )
\ No newline at end of file
+        headers={"Content-Disposition": "attachment; filename=full_database_export.zip"}
+    )
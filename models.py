@@ -1,20 +1,39 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from datetime import datetime
 
-db = SQLAlchemy()
+
+# Sessions use the app's engine, except one opened with its own bind (see long_running.py), which uses that
+class BindableSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.bind is not None:
+            return self.bind
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": BindableSession})
 
 class AssetType(db.Model):
     __tablename__ = "asset_types"
+    __table_args__ = (
+        db.Index("ix_asset_types_name", "name"),
+    )
     asset_type_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.Enum("Tangible", "Intangible"), nullable=False)
     description = db.Column(db.Text)
+    # Depreciation of assets of this type (see depreciation.py); blank uses the defaults there
+    depreciation_method = db.Column(db.Enum("straight_line", "declining_balance"), default="straight_line")
+    useful_life_years = db.Column(db.Integer)
 
     assets = db.relationship("Asset", back_populates="asset_type")
 
 
 class AssetStatus(db.Model):
     __tablename__ = "asset_statuses"
+    __table_args__ = (
+        db.Index("ix_asset_statuses_status_name", "status_name"),
+    )
     status_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     status_name = db.Column(db.String(50), nullable=False)
 
@@ -23,6 +42,10 @@ class AssetStatus(db.Model):
 
 class Department(db.Model):
     __tablename__ = "departments"
+    __table_args__ = (
+        db.Index("ix_departments_name", "name"),
+        db.Index("ix_departments_manager_id", "manager_id"),
+    )
     department_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
     manager_id = db.Column(db.Integer, db.ForeignKey("employees.employee_id", ondelete="SET NULL"), nullable=True)
@@ -33,6 +56,12 @@ class Department(db.Model):
 
 class Employee(db.Model):
     __tablename__ = "employees"
+    __table_args__ = (
+        # Dropdown order and list sorts (the primary key is the keyset tie-breaker)
+        db.Index("ix_employees_last_name_first_name", "last_name", "first_name", "employee_id"),
+        db.Index("ix_employees_first_name", "first_name", "employee_id"),
+        db.Index("ix_employees_department_id", "department_id", "employee_id"),
+    )
     employee_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
@@ -51,6 +80,9 @@ class Employee(db.Model):
 
 class Location(db.Model):
     __tablename__ = "locations"
+    __table_args__ = (
+        db.Index("ix_locations_name", "name"),
+    )
     location_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
     address = db.Column(db.String(255))
@@ -62,6 +94,9 @@ class Location(db.Model):
 
 class Vendor(db.Model):
     __tablename__ = "vendors"
+    __table_args__ = (
+        db.Index("ix_vendors_name", "name"),
+    )
     vendor_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(150), nullable=False)
     contact_name = db.Column(db.String(100))
@@ -74,6 +109,25 @@ class Vendor(db.Model):
 
 class Asset(db.Model):
     __tablename__ = "assets"
+    __table_args__ = (
+        # Each index is (column, primary key) so it serves filtering, and keyset paging sorted by the column reads
+        # a page straight from it: pages are ordered by (column, primary key) with NULLs where the database
+        # natively puts them, so there is no sort step (see pagination.py)
+        db.Index("ix_assets_assigned_to", "assigned_to", "asset_id"),
+        db.Index("ix_assets_name", "name", "asset_id"),
+        db.Index("ix_assets_serial_number", "serial_number", "asset_id"),
+        db.Index("ix_assets_purchase_date", "purchase_date", "asset_id"),
+        db.Index("ix_assets_purchase_cost", "purchase_cost", "asset_id"),
+        db.Index("ix_assets_warranty_expiry", "warranty_expiry", "asset_id"),
+        db.Index("ix_assets_asset_type_id", "asset_type_id", "asset_id"),
+        db.Index("ix_assets_status_id", "status_id", "asset_id"),
+        db.Index("ix_assets_location_id", "location_id", "asset_id"),
+        db.Index("ix_assets_vendor_id", "vendor_id", "asset_id"),
+        # Maintenance due queue, read in due date order (see maintenance_schedule.py)
+        db.Index("ix_assets_next_maintenance_due", "next_maintenance_due", "asset_id"),
+        # Assets changed since the last reconciliation run (see reconciliation.py)
+        db.Index("ix_assets_updated_at", "updated_at"),
+    )
     asset_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     asset_tag = db.Column(db.String(100), unique=True, nullable=False)
     name = db.Column(db.String(150), nullable=False)
@@ -87,6 +141,8 @@ class Asset(db.Model):
     vendor_id = db.Column(db.Integer, db.ForeignKey("vendors.vendor_id"))
     warranty_expiry = db.Column(db.Date)
     serial_number = db.Column(db.String(150))
+    # Latest next_due_date of the asset's maintenance records, kept up to date by maintenance_schedule.py
+    next_maintenance_due = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -101,13 +157,77 @@ class Asset(db.Model):
     disposals = db.relationship("AssetDisposal", back_populates="asset", cascade="all, delete-orphan")
 
 
+# Schema migrations applied to this database (see migrations.py)
+class SchemaMigration(db.Model):
+    __tablename__ = "schema_migrations"
+    version = db.Column(db.String(20), primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Runs of the assigned_to reconciliation (see reconciliation.py)
+class ReconciliationRun(db.Model):
+    __tablename__ = "reconciliation_runs"
+    __table_args__ = (
+        db.Index("ix_reconciliation_runs_started_at", "started_at"),
+    )
+    run_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    mode = db.Column(db.Enum("full", "incremental"), nullable=False)
+    dry_run = db.Column(db.Boolean, default=False, nullable=False)
+    checked = db.Column(db.Integer)
+    discrepancies = db.Column(db.Integer)
+    fixed = db.Column(db.Integer)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+
+# Background imports and exports (see jobs.py)
+class Job(db.Model):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index("ix_jobs_created_at", "created_at"),
+    )
+    job_id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.Enum("import", "export"), nullable=False)
+    target = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.Enum("queued", "running", "finished", "failed"), default="queued", nullable=False)
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Integer)
+    message = db.Column(db.Text)
+    file_path = db.Column(db.String(255))
+    file_name = db.Column(db.String(255))
+    created_by = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+# Inverted index of the words in each asset's text fields, used by asset search (see search_index.py)
+class AssetSearchToken(db.Model):
+    __tablename__ = "asset_search_tokens"
+    token = db.Column(db.String(64), primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey("assets.asset_id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
 class AssetAssignment(db.Model):
     __tablename__ = "asset_assignments"
+    __table_args__ = (
+        db.Index("ix_asset_assignments_asset_id", "asset_id", "assignment_id"),
+        db.Index("ix_asset_assignments_employee_id", "employee_id", "assignment_id"),
+        db.Index("ix_asset_assignments_assigned_date", "assigned_date", "assignment_id"),
+        db.Index("ix_asset_assignments_returned_date", "returned_date", "assignment_id"),
+        # As-of custody lookups per asset and holdings per employee (see custody.py)
+        db.Index("ix_asset_assignments_asset_id_assigned_date", "asset_id", "assigned_date", "assignment_id"),
+        db.Index("ix_asset_assignments_employee_id_assigned_date", "employee_id", "assigned_date", "assignment_id"),
+        # Assignments changed since the last reconciliation run (see reconciliation.py)
+        db.Index("ix_asset_assignments_updated_at", "updated_at"),
+    )
     assignment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     asset_id = db.Column(db.Integer, db.ForeignKey("assets.asset_id", ondelete="SET NULL"))
     employee_id = db.Column(db.Integer, db.ForeignKey("employees.employee_id", ondelete="CASCADE"))
     assigned_date = db.Column(db.Date, nullable=False)
     returned_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     asset = db.relationship("Asset", back_populates="assignments")
     employee = db.relationship("Employee", back_populates="assignments")
@@ -115,6 +235,13 @@ class AssetAssignment(db.Model):
 
 class AssetMaintenance(db.Model):
     __tablename__ = "asset_maintenance"
+    __table_args__ = (
+        db.Index("ix_asset_maintenance_asset_id", "asset_id", "maintenance_id"),
+        db.Index("ix_asset_maintenance_maintenance_date", "maintenance_date", "maintenance_id"),
+        db.Index("ix_asset_maintenance_next_due_date", "next_due_date", "maintenance_id"),
+        # MAX(next_due_date) per asset is read from this index alone
+        db.Index("ix_asset_maintenance_asset_id_next_due_date", "asset_id", "next_due_date"),
+    )
     maintenance_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     asset_id = db.Column(db.Integer, db.ForeignKey("assets.asset_id", ondelete="CASCADE"))
     maintenance_date = db.Column(db.Date, nullable=False)
@@ -128,6 +255,10 @@ class AssetMaintenance(db.Model):
 
 class AssetDisposal(db.Model):
     __tablename__ = "asset_disposals"
+    __table_args__ = (
+        db.Index("ix_asset_disposals_asset_id", "asset_id", "disposal_id"),
+        db.Index("ix_asset_disposals_disposal_date", "disposal_date", "disposal_id"),
+    )
     disposal_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     asset_id = db.Column(db.Integer, db.ForeignKey("assets.asset_id", ondelete="CASCADE"))
     disposal_date = db.Column(db.Date, nullable=False)
@@ -0,0 +1,240 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, or_, func, select, text, inspect, String
+
+from models import db
+
+# Page size limits for list pages
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Row totals are only counted exactly up to this many rows
+COUNT_LIMIT = 1000
+
+# One page of results, the cursors needed to move forwards and backwards, and the list state that produced it
+Page = namedtuple(
+	"Page",
+	["items", "page_size", "next_cursor", "prev_cursor", "sort", "direction", "search", "total", "total_is_exact"],
+	defaults=(None, "asc", None, None, True),
+)
+
+
+# Read the page size from the query string and keep it within bounds
+def get_page_size(args):
+	try:
+		page_size = int(args.get("page_size", DEFAULT_PAGE_SIZE))
+	except (TypeError, ValueError):
+		page_size = DEFAULT_PAGE_SIZE
+	return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+# Cursors are the sort column, sort value and primary key of a boundary row, packed into a URL safe token
+def encode_cursor(sort_column, value, key):
+	if isinstance(value, (date, datetime)):
+		value = value.isoformat()
+	elif isinstance(value, Decimal):
+		value = str(value)
+	payload = json.dumps([sort_column.key, value, key], separators=(",", ":"))
+	return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# Unpack a cursor token and convert its sort value back into the column's Python type.
+# Cursors made for a different sort column are ignored so the list restarts from the first page.
+def decode_cursor(token, sort_column):
+	try:
+		padded = token + "=" * (-len(token) % 4)
+		sort, value, key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+	except (ValueError, TypeError):
+		return None
+
+	if sort != sort_column.key:
+		return None
+
+	if value is None:
+		return None, key
+
+	try:
+		python_type = sort_column.type.python_type
+	except NotImplementedError:
+		return value, key
+
+	try:
+		if python_type is datetime:
+			value = datetime.fromisoformat(value)
+		elif python_type is date:
+			value = date.fromisoformat(value)
+		elif python_type is Decimal:
+			value = Decimal(value)
+		elif python_type is int:
+			value = int(value)
+	except (ValueError, TypeError, ArithmeticError):
+		return None
+	return value, key
+
+
+# Build the WHERE clause selecting rows that come after the cursor row, walking the list in ascending or
+# descending order. NULL sorts before every value, which is how MySQL and SQLite order it natively (first
+# when ascending, last when descending), so the ORDER BY is just (sort value, key) and every branch below
+# is a range on the (sort column, key) index: no IS NULL expression in the ORDER BY forcing a filesort.
+def _seek_condition(sort_column, key_column, value, key, descending, nullable):
+	def after(column, bound):
+		return column < bound if descending else column > bound
+
+	if value is None:
+		condition = and_(sort_column.is_(None), after(key_column, key))
+		# Walking up out of the NULL block reaches every non-NULL row
+		return condition if descending else or_(condition, sort_column.isnot(None))
+
+	condition = or_(
+		after(sort_column, value),
+		and_(sort_column == value, after(key_column, key)),
+	)
+	# Walking down past the smallest value reaches the NULL block
+	if nullable and descending:
+		condition = or_(condition, sort_column.is_(None))
+	return condition
+
+
+def _order_by(sort_column, key_column, descending):
+	if descending:
+		return [sort_column.desc(), key_column.desc()]
+	return [sort_column.asc(), key_column.asc()]
+
+
+# Page through a query using keyset (seek) pagination instead of OFFSET, so every page costs the same.
+#   after:  cursor of the last row on the previous page (move forwards)
+#   before: cursor of the first row on the next page (move backwards)
+def keyset_page(query, sort_column, key_column, direction="asc", page_size=DEFAULT_PAGE_SIZE, after=None, before=None):
+	descending = direction == "desc"
+	nullable = getattr(sort_column.expression, "nullable", True) and sort_column is not key_column
+
+	cursor = decode_cursor(before, sort_column) if before else None
+	backwards = cursor is not None
+	if not backwards and after:
+		cursor = decode_cursor(after, sort_column)
+
+	# Walking backwards is the same seek in the opposite order
+	walk_descending = descending != backwards
+
+	base_query = query
+	if cursor is not None:
+		value, key = cursor
+		query = query.filter(_seek_condition(sort_column, key_column, value, key, walk_descending, nullable))
+
+	# Fetch one extra row to find out whether another page exists
+	order = _order_by(sort_column, key_column, walk_descending)
+	rows = query.order_by(None).order_by(*order).limit(page_size + 1).all()
+	has_more = len(rows) > page_size
+	rows = rows[:page_size]
+
+	# Reached the start while walking backwards, so just show the first page
+	if backwards and not has_more:
+		return keyset_page(base_query, sort_column, key_column, direction, page_size)
+
+	if backwards:
+		rows.reverse()
+
+	def cursor_for(row):
+		return encode_cursor(sort_column, getattr(row, sort_column.key), getattr(row, key_column.key))
+
+	next_cursor = None
+	prev_cursor = None
+	if rows:
+		if has_more or backwards:
+			next_cursor = cursor_for(rows[-1])
+		if has_more if backwards else cursor is not None:
+			prev_cursor = cursor_for(rows[0])
+
+	return Page(rows, page_size, next_cursor, prev_cursor)
+
+
+# Cheap row total for a list page.
+# Unfiltered MySQL tables use the InnoDB row estimate once they are large; anything else is counted exactly up to COUNT_LIMIT.
+def approximate_total(query, table, filtered):
+	if not filtered and db.engine.dialect.name == "mysql":
+		estimate = db.session.execute(
+			text(
+				"SELECT TABLE_ROWS FROM information_schema.TABLES "
+				"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+			),
+			{"table": table.name},
+		).scalar()
+		if estimate and estimate > COUNT_LIMIT:
+			return estimate, False
+
+	limited = query.order_by(None).with_entities(table.primary_key.columns[0]).limit(COUNT_LIMIT + 1).subquery()
+	count = db.session.execute(select(func.count()).select_from(limited)).scalar()
+	if count > COUNT_LIMIT:
+		return COUNT_LIMIT, False
+	return count, True
+
+
+# Shared list engine used by every table page.
+# Each blueprint registers its model with the columns it can be sorted and searched by:
+#   model:        the model being listed
+#   sortable:     {"query string name": column} of allowed sort columns (avoids SQL injection)
+#   searchable:   columns matched against the search term
+#   base_query:   optional callable returning the starting query, e.g. with joins for searching related tables
+#   default_sort: sort column name used when none (or an invalid one) is given
+#   search:       optional callable (query, search) -> query replacing the column matching, e.g. to use an index
+#   load_options: relationship loading plan for the rows of a page, e.g. db.selectinload(Asset.status) or
+#                 db.contains_eager(AssetMaintenance.asset) when base_query already joins the table,
+#                 so rendering a page costs a fixed number of queries instead of one per row
+class ListQuery:
+	def __init__(self, model, sortable, searchable=(), base_query=None, default_sort=None, search=None, load_options=()):
+		self.model = model
+		self.sortable = sortable
+		self.searchable = searchable
+		self.base_query = base_query or (lambda: model.query)
+		self.search_function = search
+		self.load_options = load_options
+
+		primary_key = inspect(model).primary_key[0]
+		self.key_column = getattr(model, primary_key.key)
+		self.default_sort = default_sort or primary_key.key
+
+	# Filter the query by matching the search term against every searchable column
+	def search(self, query, search):
+		if not search:
+			return query
+		if self.search_function:
+			return self.search_function(query, search)
+		search_pattern = f"%{search}%"
+		conditions = []
+		for column in self.searchable:
+			if not isinstance(column.type, String):
+				column = column.cast(String)
+			conditions.append(column.ilike(search_pattern))
+		return query.filter(or_(*conditions))
+
+	# Build one page of the list from the request's query string
+	def page(self, args):
+		sort = args.get("sort", self.default_sort)
+		if sort not in self.sortable:
+			sort = self.default_sort
+		direction = "desc" if args.get("direction") == "desc" else "asc"
+		search = args.get("search", None)
+
+		query = self.search(self.base_query(), search)
+		page = keyset_page(
+			query.options(*self.load_options),
+			self.sortable[sort],
+			self.key_column,
+			direction=direction,
+			page_size=get_page_size(args),
+			after=args.get("after"),
+			before=args.get("before"),
+		)
+		total, total_is_exact = approximate_total(query, self.model.__table__, bool(search))
+
+		return page._replace(
+			sort=sort,
+			direction=direction,
+			search=search,
+			total=total,
+			total_is_exact=total_is_exact,
+		)
@@ -0,0 +1,238 @@
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, text, update
+
+import cache
+from long_running import long_running_session
+from custody import covers
+from models import db, Asset, AssetAssignment, ReconciliationRun
+
+# assets.assigned_to is a copy of "who holds this asset now". It should always match the most recent
+# open assignment (see custody.py for what open means on a given day), or be empty when there is none.
+# The assignments are the only source of truth: nothing writes assigned_to directly. The asset forms and
+# the asset CSV import record a new holder through reassign(), which closes and opens assignments.
+# Reconciliation recomputes it for many assets at once with a single UPDATE:
+#   MySQL      UPDATE assets LEFT JOIN (latest open assignment per asset) ... SET assigned_to = ...
+#   elsewhere  UPDATE assets SET assigned_to = (correlated subquery for the latest open assignment)
+# Only rows that differ are written.
+#
+# An incremental run only looks at assets touched since the last completed run: assets or assignments
+# updated since then, plus assets whose assignments started or ended between then and today.
+#
+#     flask --app app reconcile-assignments --incremental
+#     flask --app app reconcile-assignments --dry-run
+
+# Asset IDs per statement when working on a list of assets
+BATCH_SIZE = 1000
+
+# Discrepancies listed in reports; the count always covers all of them
+REPORT_LIMIT = 100
+
+
+# Latest open assignment per asset on today: (asset_id, employee_id)
+def _expected_select(today, asset_ids=None):
+	ranked = select(
+		AssetAssignment.asset_id,
+		AssetAssignment.employee_id,
+		func.row_number().over(
+			partition_by=AssetAssignment.asset_id,
+			order_by=(AssetAssignment.assigned_date.desc(), AssetAssignment.assignment_id.desc()),
+		).label("position"),
+	).where(AssetAssignment.asset_id.isnot(None), *covers(today))
+	if asset_ids is not None:
+		ranked = ranked.where(AssetAssignment.asset_id.in_(asset_ids))
+	ranked = ranked.subquery("ranked")
+	return select(ranked.c.asset_id, ranked.c.employee_id).where(ranked.c.position == 1)
+
+
+def _batches(asset_ids):
+	if asset_ids is None:
+		yield None
+		return
+	for i in range(0, len(asset_ids), BATCH_SIZE):
+		yield asset_ids[i:i + BATCH_SIZE]
+
+
+# Assets whose assigned_to differs from their latest open assignment
+def _discrepancy_select(today, asset_ids=None):
+	expected = _expected_select(today, asset_ids).subquery("expected")
+	statement = (
+		select(Asset.asset_id, Asset.asset_tag, Asset.assigned_to, expected.c.employee_id.label("expected"))
+		.outerjoin(expected, expected.c.asset_id == Asset.asset_id)
+		.where(~Asset.assigned_to.is_not_distinct_from(expected.c.employee_id))
+	)
+	if asset_ids is not None:
+		statement = statement.where(Asset.asset_id.in_(asset_ids))
+	return statement
+
+
+# Number of discrepancies and the first REPORT_LIMIT of them, for all assets or a list of asset IDs
+def discrepancies(asset_ids=None, today=None, limit=REPORT_LIMIT):
+	today = today or date.today()
+	count = 0
+	rows = []
+	for batch in _batches(asset_ids):
+		statement = _discrepancy_select(today, batch)
+		count += db.session.execute(select(func.count()).select_from(statement.subquery())).scalar()
+		if len(rows) < limit:
+			rows += [
+				{"asset_id": row.asset_id, "asset_tag": row.asset_tag, "assigned_to": row.assigned_to, "expected": row.expected}
+				for row in db.session.execute(statement.order_by(Asset.asset_id).limit(limit - len(rows)))
+			]
+	return count, rows
+
+
+# Set assigned_to from the latest open assignment for all assets or a list of asset IDs, in one
+# statement per batch. Call it before committing; returns the number of assets changed.
+def reconcile(asset_ids=None, today=None):
+	today = today or date.today()
+	if asset_ids is not None:
+		asset_ids = sorted({asset_id for asset_id in asset_ids if asset_id is not None})
+		if not asset_ids:
+			return 0
+
+	# The statements below read assignments from the database, so write out pending changes first
+	db.session.flush()
+	dialect = db.engine.dialect
+	changed = 0
+	for batch in _batches(asset_ids):
+		if dialect.name == "mysql":
+			expected = str(_expected_select(today, batch).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+			statement = (
+				f"UPDATE assets LEFT JOIN ({expected}) AS expected ON expected.asset_id = assets.asset_id "
+				"SET assets.assigned_to = expected.employee_id "
+				"WHERE NOT (assets.assigned_to <=> expected.employee_id)"
+			)
+			if batch is not None:
+				statement += f" AND assets.asset_id IN ({', '.join(str(int(asset_id)) for asset_id in batch)})"
+			changed += db.session.execute(text(statement)).rowcount
+			cache.mark_changed(db.session, "assets")
+		else:
+			latest = (
+				select(AssetAssignment.employee_id)
+				.where(AssetAssignment.asset_id == Asset.asset_id, *covers(today))
+				.order_by(AssetAssignment.assigned_date.desc(), AssetAssignment.assignment_id.desc())
+				.limit(1)
+				.scalar_subquery()
+			)
+			statement = (
+				update(Asset)
+				.where(~Asset.assigned_to.is_not_distinct_from(latest))
+				# A repair of derived data, so the asset's updated_at is left as it was (as on MySQL)
+				.values(assigned_to=latest, updated_at=Asset.updated_at)
+				.execution_options(synchronize_session=False)
+			)
+			if batch is not None:
+				statement = statement.where(Asset.asset_id.in_(batch))
+			changed += db.session.execute(statement).rowcount
+	return changed
+
+
+# Record new holders for assets, {asset_id: employee_id or None}, as assignment history: an asset whose
+# latest open assignment is for someone else has its open assignments returned today and, unless the new
+# holder is None, a new assignment from today. assigned_to is then reconciled. Call it before committing;
+# returns the number of assets that changed hands.
+def reassign(holders, today=None):
+	today = today or date.today()
+	holders = {asset_id: holder for asset_id, holder in holders.items() if asset_id is not None}
+	asset_ids = sorted(holders)
+
+	db.session.flush()
+	current = {}
+	for batch in _batches(asset_ids):
+		current.update(db.session.execute(_expected_select(today, batch)).all())
+	moved = [asset_id for asset_id in asset_ids if current.get(asset_id) != holders[asset_id]]
+
+	for batch in _batches(moved):
+		db.session.execute(
+			update(AssetAssignment)
+			.where(AssetAssignment.asset_id.in_(batch), *covers(today))
+			.values(returned_date=today)
+			.execution_options(synchronize_session=False)
+		)
+	db.session.add_all(
+		AssetAssignment(asset_id=asset_id, employee_id=holders[asset_id], assigned_date=today)
+		for asset_id in moved if holders[asset_id] is not None
+	)
+	reconcile(asset_ids, today)
+	return len(moved)
+
+
+# Assets that may have drifted since a run that started at since
+def touched_assets(since, today):
+	since_day = since.date()
+	statements = [
+		select(Asset.asset_id).where(Asset.updated_at >= since),
+		select(AssetAssignment.asset_id).where(AssetAssignment.updated_at >= since),
+		# Assignments that started or ended since then change the holder without any row changing
+		select(AssetAssignment.asset_id).where(AssetAssignment.assigned_date > since_day, AssetAssignment.assigned_date <= today),
+		select(AssetAssignment.asset_id).where(AssetAssignment.returned_date > since_day, AssetAssignment.returned_date <= today),
+	]
+	asset_ids = set()
+	for statement in statements:
+		asset_ids.update(db.session.execute(statement).scalars())
+	asset_ids.discard(None)
+	return sorted(asset_ids)
+
+
+# The last run that fixed what it found, which an incremental run starts from
+def last_run():
+	return db.session.execute(
+		select(ReconciliationRun)
+		.where(ReconciliationRun.finished_at.isnot(None), ReconciliationRun.dry_run.is_(False))
+		.order_by(ReconciliationRun.started_at.desc())
+		.limit(1)
+	).scalar()
+
+
+# Find and (unless dry_run) fix discrepancies, recording the run. Incremental runs fall back to a
+# full run when no earlier run exists. Returns the run and the first REPORT_LIMIT discrepancies.
+# A full run updates the whole assets table in one statement, so runs use a long-running connection
+# without the request read timeout (see long_running.py).
+def run_reconciliation(incremental=False, dry_run=False):
+	today = date.today()
+	run = ReconciliationRun(mode="full", dry_run=dry_run, started_at=datetime.utcnow())
+
+	with long_running_session():
+		asset_ids = None
+		previous = last_run() if incremental else None
+		if previous:
+			run.mode = "incremental"
+			asset_ids = touched_assets(previous.started_at, today)
+
+		run.checked = len(asset_ids) if asset_ids is not None else db.session.execute(select(func.count(Asset.asset_id))).scalar()
+		run.discrepancies, found = discrepancies(asset_ids, today)
+		run.fixed = 0 if dry_run or not run.discrepancies else reconcile(asset_ids, today)
+		run.finished_at = datetime.utcnow()
+		db.session.add(run)
+		db.session.commit()
+	return run, found
+
+
+def run_summary(run):
+	return {
+		"run_id": run.run_id,
+		"mode": run.mode,
+		"dry_run": run.dry_run,
+		"checked": run.checked,
+		"discrepancies": run.discrepancies,
+		"fixed": run.fixed,
+		"started_at": run.started_at.isoformat(),
+		"finished_at": run.finished_at.isoformat() if run.finished_at else None,
+	}
+
+
+@click.command("reconcile-assignments")
+@click.option("--incremental", is_flag=True, help="only check assets touched since the last run")
+@click.option("--dry-run", is_flag=True, help="report discrepancies without fixing them")
+@with_appcontext
+def reconcile_assignments_command(incremental, dry_run):
+	run, found = run_reconciliation(incremental=incremental, dry_run=dry_run)
+	for row in found:
+		click.echo(f"{row['asset_tag']}: assigned_to {row['assigned_to']}, latest open assignment {row['expected']}")
+	click.echo(
+		f"{run.mode.capitalize()} run checked {run.checked} assets: {run.discrepancies} discrepancies, "
+		f"{'none fixed (dry run)' if dry_run else f'{run.fixed} fixed'}."
+	)
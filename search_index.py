@@ -0,0 +1,209 @@
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, select, delete, insert
+
+from long_running import long_running_session
+from lookups import asset_type_options, status_options, location_options, vendor_options
+from models import db, Asset, AssetSearchToken
+
+# Asset columns whose words are stored in the search index
+INDEXED_COLUMNS = [Asset.asset_tag, Asset.name, Asset.description, Asset.serial_number]
+
+# Typed filters, e.g. cost>500, purchased:2024, warranty<2026-01-01
+FILTER_COLUMNS = {
+	"cost": Asset.purchase_cost,
+	"purchased": Asset.purchase_date,
+	"warranty": Asset.warranty_expiry,
+}
+FILTER_PATTERN = re.compile(r"^(cost|purchased|warranty)(<=|>=|<|>|=|:)(.+)$")
+DATE_PATTERN = re.compile(r"^(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?$")
+
+TOKEN_LENGTH = AssetSearchToken.token.type.length
+BATCH_SIZE = 1000
+
+
+# Split text into lowercase words
+def tokenize(text):
+	if not text:
+		return set()
+	return {token[:TOKEN_LENGTH] for token in re.findall(r"[a-z0-9]+", str(text).lower())}
+
+
+# Re-index the given assets (call after they are added or edited, before committing)
+def index_assets(asset_ids):
+	asset_ids = list(asset_ids)
+	for i in range(0, len(asset_ids), BATCH_SIZE):
+		batch = asset_ids[i:i + BATCH_SIZE]
+		db.session.execute(delete(AssetSearchToken).where(AssetSearchToken.asset_id.in_(batch)))
+
+		rows = db.session.execute(
+			select(Asset.asset_id, *INDEXED_COLUMNS).where(Asset.asset_id.in_(batch))
+		).all()
+		tokens = []
+		for asset_id, *values in rows:
+			words = set()
+			for value in values:
+				words |= tokenize(value)
+			tokens += [{"token": word, "asset_id": asset_id} for word in words]
+
+		if tokens:
+			db.session.execute(insert(AssetSearchToken), tokens)
+
+
+# Remove the given assets from the index (call before deleting them)
+def remove_assets(asset_ids):
+	db.session.execute(delete(AssetSearchToken).where(AssetSearchToken.asset_id.in_(list(asset_ids))))
+
+
+# Rebuild the whole index in batches, walking the assets table by primary key
+def rebuild_index():
+	db.session.execute(delete(AssetSearchToken))
+	db.session.commit()
+
+	last_id = 0
+	count = 0
+	while True:
+		batch = db.session.execute(
+			select(Asset.asset_id).where(Asset.asset_id > last_id).order_by(Asset.asset_id).limit(BATCH_SIZE)
+		).scalars().all()
+		if not batch:
+			break
+		index_assets(batch)
+		db.session.commit()
+		last_id = batch[-1]
+		count += len(batch)
+	return count
+
+
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+	with long_running_session():
+		count = rebuild_index()
+	click.echo(f"Indexed {count} assets.")
+
+
+# Turn a partial ISO date (2024, 2024-03, 2024-03-12) into the half open range it covers
+def _date_range(value):
+	match = DATE_PATTERN.match(value)
+	if not match:
+		return None
+	year, month, day = match.groups()
+	try:
+		if day:
+			start = date(int(year), int(month), int(day))
+			return start, date.fromordinal(start.toordinal() + 1)
+		if month:
+			start = date(int(year), int(month), 1)
+			end = date(int(year) + 1, 1, 1) if int(month) == 12 else date(int(year), int(month) + 1, 1)
+			return start, end
+		return date(int(year), 1, 1), date(int(year) + 1, 1, 1)
+	except ValueError:
+		return None
+
+
+# Build the condition for a typed filter like cost>500 or purchased:2024-03
+def _typed_filter(field, operator, value):
+	column = FILTER_COLUMNS[field]
+
+	if field == "cost":
+		try:
+			amount = Decimal(value)
+		except InvalidOperation:
+			return None
+		# Decimal also parses inf and nan, which no cost can be compared with
+		if not amount.is_finite():
+			return None
+		return {
+			"<": column < amount,
+			"<=": column <= amount,
+			">": column > amount,
+			">=": column >= amount,
+			"=": column == amount,
+			":": column == amount,
+		}[operator]
+
+	bounds = _date_range(value)
+	if not bounds:
+		return None
+	start, end = bounds
+	return {
+		"<": column < start,
+		"<=": column < end,
+		">": column >= end,
+		">=": column >= start,
+		"=": and_(column >= start, column < end),
+		":": and_(column >= start, column < end),
+	}[operator]
+
+
+# Related tables whose names are searched too: (asset column, cached option list, name field)
+RELATED_NAMES = [
+	(Asset.asset_type_id, asset_type_options, "name"),
+	(Asset.status_id, status_options, "status_name"),
+	(Asset.location_id, location_options, "name"),
+	(Asset.vendor_id, vendor_options, "name"),
+]
+
+
+# IDs of the related rows with a name word starting with word, from the cached lookup lists (see lookups.py).
+# Names are split with tokenize, so "Dell-Tech" matches "tech" here just as it does in asset text.
+def _related_ids(word, options, name_field):
+	ids = []
+	for option in options():
+		if any(token.startswith(word) for token in tokenize(getattr(option, name_field))):
+			ids.append(option[0])
+	return ids
+
+
+# Match one word as a prefix of an indexed asset word or of a related type/status/location/vendor name.
+# Related names are resolved to IDs first (their tables are small and cached), so a word that only
+# matches asset text is a single IN on asset_search_tokens, which the database runs as a semi-join
+# driven by the token index. Only a word that also names a related row adds ORs, on plain ID lists.
+def _word_filter(word):
+	conditions = [Asset.asset_id.in_(select(AssetSearchToken.asset_id).where(AssetSearchToken.token.like(f"{word}%")))]
+	for column, options, name_field in RELATED_NAMES:
+		ids = _related_ids(word, options, name_field)
+		if ids:
+			conditions.append(column.in_(ids))
+	return or_(*conditions) if len(conditions) > 1 else conditions[0]
+
+
+# Apply a search string to an asset query.
+# Every term must match: typed filters compare columns directly, full dates and amounts
+# also match the date and cost columns, and all other words use prefix matching.
+def search_assets(query, search):
+	if not search:
+		return query
+
+	conditions = []
+	for term in search.split():
+		term_lower = term.lower()
+
+		typed = FILTER_PATTERN.match(term_lower)
+		if typed:
+			condition = _typed_filter(*typed.groups())
+			if condition is not None:
+				conditions.append(condition)
+				continue
+
+		words = sorted(tokenize(term_lower))
+		if not words:
+			continue
+		condition = and_(*[_word_filter(word) for word in words])
+
+		bounds = _date_range(term_lower)
+		if bounds and term_lower.count("-") == 2:
+			condition = or_(condition, Asset.purchase_date == bounds[0], Asset.warranty_expiry == bounds[0])
+		elif re.match(r"^\d+\.\d{1,2}$", term_lower):
+			condition = or_(condition, Asset.purchase_cost == Decimal(term_lower))
+
+		conditions.append(condition)
+
+	if conditions:
+		query = query.filter(and_(*conditions))
+	return query
@@ -0,0 +1,117 @@
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+# Tests run against a throwaway SQLite database. The app reads DATABASE_URL when it is imported.
+# The database is created and seeded once, and every test starts from a fresh copy of it, so what one
+# test writes is never seen by another.
+#
+#     python -m pytest -q
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATABASE_DIR = tempfile.mkdtemp(prefix="asset-tests-")
+DATABASE_PATH = os.path.join(DATABASE_DIR, "test.db")
+SEEDED_PATH = os.path.join(DATABASE_DIR, "seeded.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DATABASE_PATH
+sys.path.insert(0, ROOT)
+
+from app import app as flask_app
+from depreciation import METHODS
+from models import (
+	db, AssetType, AssetStatus, Location, Vendor, Department, Employee, Asset,
+	AssetAssignment, AssetMaintenance, AssetDisposal, User,
+)
+import cache
+
+# Rows created in each table, more than the largest page the tests ask for
+ROW_COUNT = 60
+
+
+def _seed():
+	start = date(2022, 1, 1)
+	departments = [Department(name=f"Department {i}") for i in range(ROW_COUNT)]
+	types = [
+		AssetType(name=f"Type {i}", category="Tangible", depreciation_method=METHODS[i % 2], useful_life_years=3 + i % 5)
+		for i in range(ROW_COUNT)
+	]
+	statuses = [AssetStatus(status_name=f"Status {i}") for i in range(ROW_COUNT)]
+	locations = [Location(name=f"Location {i}", city="Tampa", country="USA") for i in range(ROW_COUNT)]
+	vendors = [Vendor(name=f"Vendor {i}") for i in range(ROW_COUNT)]
+	db.session.add_all(departments + types + statuses + locations + vendors)
+	db.session.flush()
+
+	employees = [
+		Employee(first_name=f"First{i}", last_name=f"Last{i}", email=f"employee{i}@example.com", department_id=departments[i].department_id)
+		for i in range(ROW_COUNT)
+	]
+	db.session.add_all(employees)
+	db.session.flush()
+	for i, department in enumerate(departments):
+		department.manager_id = employees[i].employee_id
+
+	assets = [
+		Asset(
+			asset_tag=f"TAG-{i:04d}",
+			name=f"Laptop {i}",
+			asset_type_id=types[i].asset_type_id,
+			status_id=statuses[i].status_id,
+			location_id=locations[i].location_id,
+			vendor_id=vendors[i].vendor_id,
+			assigned_to=employees[i].employee_id,
+			purchase_date=start + timedelta(days=i),
+			purchase_cost=Decimal(1000 + i),
+			warranty_expiry=start + timedelta(days=1000 + i),
+		)
+		for i in range(ROW_COUNT)
+	]
+	db.session.add_all(assets)
+	db.session.flush()
+
+	for i, asset in enumerate(assets):
+		db.session.add(AssetAssignment(asset_id=asset.asset_id, employee_id=employees[i].employee_id, assigned_date=start + timedelta(days=i)))
+		db.session.add(AssetMaintenance(asset_id=asset.asset_id, maintenance_date=start + timedelta(days=i), performed_by="Tech", cost=Decimal(50), next_due_date=start + timedelta(days=365 + i)))
+		if i % 10 == 0:
+			db.session.add(AssetDisposal(asset_id=asset.asset_id, disposal_date=start + timedelta(days=2000 + i), method="Recycled"))
+		db.session.add(User(username=f"user{i}", email=f"user{i}@example.com", password_hash="x", role="user", employee_id=employees[i].employee_id))
+	db.session.commit()
+
+
+# Close every connection so the database file can be replaced
+def _close_connections():
+	with flask_app.app_context():
+		db.session.remove()
+		db.engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def seeded_database():
+	with flask_app.app_context():
+		db.create_all()
+		_seed()
+	_close_connections()
+	shutil.copyfile(DATABASE_PATH, SEEDED_PATH)
+
+
+@pytest.fixture
+def app(seeded_database):
+	_close_connections()
+	shutil.copyfile(SEEDED_PATH, DATABASE_PATH)
+	# Cached query results belong to the previous test's database
+	cache.clear()
+	yield flask_app
+
+
+# Test client logged in as an admin, so every page is visible
+@pytest.fixture
+def client(app):
+	client = app.test_client()
+	with client.session_transaction() as session:
+		session["user_id"] = 1
+		session["username"] = "user0"
+		session["role"] = "admin"
+	return client
@@ -0,0 +1,67 @@
+import io
+from datetime import date
+
+from models import db, Asset, AssetAssignment
+from reconciliation import discrepancies
+
+
+def open_assignments(asset_id):
+	today = date.today()
+	return [
+		assignment.employee_id
+		for assignment in AssetAssignment.query.filter_by(asset_id=asset_id)
+		if assignment.assigned_date <= today and (assignment.returned_date is None or assignment.returned_date > today)
+	]
+
+
+def asset_form(asset, **fields):
+	form = {"asset_tag": asset.asset_tag, "name": asset.name, "assigned_to": ""}
+	form.update(fields)
+	return form
+
+
+# Changing the holder on the asset form hands the asset over through the assignments, so a
+# reconciliation run has nothing to undo
+def test_asset_form_records_new_holder_as_assignment(app, client):
+	with app.app_context():
+		asset = Asset.query.filter_by(asset_tag="TAG-0001").one()
+		previous = asset.assigned_to
+		client.post(f"/assets/edit/{asset.asset_id}", data=asset_form(asset, assigned_to="3"))
+
+		db.session.expire_all()
+		assert db.session.get(Asset, asset.asset_id).assigned_to == 3
+		assert open_assignments(asset.asset_id) == [3]
+		assert AssetAssignment.query.filter_by(asset_id=asset.asset_id, employee_id=previous, returned_date=date.today()).count() == 1
+		assert discrepancies([asset.asset_id])[0] == 0
+
+
+def test_asset_form_without_holder_returns_asset(app, client):
+	with app.app_context():
+		asset = Asset.query.filter_by(asset_tag="TAG-0002").one()
+		client.post(f"/assets/edit/{asset.asset_id}", data=asset_form(asset))
+
+		db.session.expire_all()
+		assert db.session.get(Asset, asset.asset_id).assigned_to is None
+		assert open_assignments(asset.asset_id) == []
+
+
+def test_unchanged_holder_adds_no_assignment(app, client):
+	with app.app_context():
+		asset = Asset.query.filter_by(asset_tag="TAG-0004").one()
+		count = AssetAssignment.query.count()
+		client.post(f"/assets/edit/{asset.asset_id}", data=asset_form(asset, assigned_to=str(asset.assigned_to)))
+		assert AssetAssignment.query.count() == count
+
+
+def test_csv_import_records_holders_as_assignments(app, client):
+	data = "asset_tag,name,assigned_to\nCSV-0001,Imported laptop,5\nCSV-0002,Imported phone,\n"
+	client.post("/assets", data={"csv_file": (io.BytesIO(data.encode()), "assets.csv")}, content_type="multipart/form-data")
+
+	with app.app_context():
+		laptop = Asset.query.filter_by(asset_tag="CSV-0001").one()
+		phone = Asset.query.filter_by(asset_tag="CSV-0002").one()
+		assert laptop.assigned_to == 5
+		assert open_assignments(laptop.asset_id) == [5]
+		assert phone.assigned_to is None
+		assert open_assignments(phone.asset_id) == []
+		assert discrepancies([laptop.asset_id, phone.asset_id])[0] == 0
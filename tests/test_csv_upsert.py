@@ -0,0 +1,104 @@
+import io
+from datetime import date
+
+from models import db, Asset, AssetAssignment, Employee, Vendor
+
+
+def upload(client, path, data, upsert=True):
+	form = {"csv_file": (io.BytesIO(data.encode()), "upload.csv")}
+	if upsert:
+		form["import_mode"] = "upsert"
+	return client.post(path, data=form, content_type="multipart/form-data", follow_redirects=True)
+
+
+def open_assignment_count():
+	today = date.today()
+	return AssetAssignment.query.filter(
+		AssetAssignment.assigned_date <= today,
+		db.or_(AssetAssignment.returned_date.is_(None), AssetAssignment.returned_date > today),
+	).count()
+
+
+def asset_columns(tag):
+	asset = Asset.query.filter_by(asset_tag=tag).one()
+	return (asset.asset_type_id, asset.status_id, asset.location_id, asset.vendor_id, asset.assigned_to, asset.purchase_date)
+
+
+# Re-uploading the export (which names the type, status, location and vendor) changes nothing
+def test_asset_export_round_trips_unchanged(app, client):
+	exported = client.get("/assets/export").get_data(as_text=True)
+	with app.app_context():
+		before = {tag: asset_columns(tag) for tag in ("TAG-0001", "TAG-0059")}
+		count = open_assignment_count()
+
+	response = upload(client, "/assets", exported)
+	assert "Updated 0 existing assets, 60 unchanged" in response.get_data(as_text=True)
+	with app.app_context():
+		assert {tag: asset_columns(tag) for tag in before} == before
+		assert open_assignment_count() == count
+
+
+# Columns missing from the file are left alone, including the holder
+def test_asset_upsert_only_writes_columns_in_file(app, client):
+	with app.app_context():
+		before = asset_columns("TAG-0001")
+		count = open_assignment_count()
+
+	upload(client, "/assets", "asset_tag,name,purchase_cost\nTAG-0001,Renamed laptop,1234.50\n")
+	with app.app_context():
+		asset = Asset.query.filter_by(asset_tag="TAG-0001").one()
+		assert (asset.name, float(asset.purchase_cost)) == ("Renamed laptop", 1234.50)
+		assert asset_columns("TAG-0001") == before
+		assert open_assignment_count() == count
+
+
+# A blank assigned_to keeps the holder instead of returning the asset
+def test_blank_assigned_to_keeps_holder(app, client):
+	with app.app_context():
+		before = asset_columns("TAG-0001")
+		count = open_assignment_count()
+
+	upload(client, "/assets", "asset_tag,name,assigned_to\nTAG-0001,Laptop 1,\n")
+	with app.app_context():
+		assert asset_columns("TAG-0001") == before
+		assert open_assignment_count() == count
+
+
+def test_unknown_asset_type_name_is_reported(app, client):
+	response = upload(client, "/assets", "asset_tag,name,asset_type\nTAG-0001,Laptop 1,No such type\n")
+	assert "unknown asset_type &#39;No such type&#39;" in response.get_data(as_text=True)
+	with app.app_context():
+		assert Asset.query.filter_by(asset_tag="TAG-0001").one().asset_type_id is not None
+
+
+def test_employee_upsert_keeps_status_and_department(app, client):
+	with app.app_context():
+		employee = Employee.query.filter_by(email="employee1@example.com").one()
+		employee.status = "Inactive"
+		db.session.commit()
+		department_id = employee.department_id
+
+	upload(client, "/employees", "email,phone\nemployee1@example.com,555-0101\n")
+	with app.app_context():
+		employee = Employee.query.filter_by(email="employee1@example.com").one()
+		assert (employee.phone, employee.status, employee.department_id) == ("555-0101", "Inactive", department_id)
+
+
+def test_employee_upsert_rejects_unknown_department(app, client):
+	response = upload(client, "/employees", "email,department\nemployee1@example.com,Nowhere\n")
+	assert "unknown department &#39;Nowhere&#39;" in response.get_data(as_text=True)
+	with app.app_context():
+		assert Employee.query.filter_by(email="employee1@example.com").one().department_id is not None
+
+
+# Repeated keys are reported, whatever their case, rather than dropped or inserted twice
+def test_repeated_keys_are_reported(app, client):
+	response = upload(client, "/vendors", "name,phone\nAcme,1\nACME,2\n")
+	text = response.get_data(as_text=True)
+	assert "duplicate name &#39;ACME&#39;" in text
+	assert "Skipped 1 rows" in text
+	with app.app_context():
+		assert Vendor.query.filter(db.func.lower(Vendor.name) == "acme").count() == 1
+
+	response = upload(client, "/employees", "email,phone\nemployee2@example.com,1\nEMPLOYEE2@example.com,2\n")
+	assert "duplicate email &#39;EMPLOYEE2@example.com&#39;" in response.get_data(as_text=True)
@@ -0,0 +1,30 @@
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+from models import db
+
+
+def export(client):
+	return client.get("/asset_assignments/custody/export?date=2030-01-01").get_data(as_text=True)
+
+
+# Another worker's writes don't bump this process's cache versions, so the export must notice them in the database
+def test_custody_export_sees_writes_from_other_workers(app, client):
+	# Old timestamps, so the index is reused on the strength of the signal alone
+	with app.app_context():
+		with db.engine.begin() as connection:
+			connection.execute(text("UPDATE asset_assignments SET updated_at = :old"), {"old": datetime(2020, 1, 1)})
+	assert "employee7@example.com" in export(client)
+
+	with app.app_context():
+		with db.engine.begin() as connection:
+			connection.execute(
+				text("INSERT INTO asset_assignments (asset_id, employee_id, assigned_date, updated_at) VALUES (1, 9, :day, :now)"),
+				{"day": date(2029, 1, 1), "now": datetime(2020, 1, 1)},
+			)
+			connection.execute(text("DELETE FROM asset_assignments WHERE asset_id = 8"))
+
+	rows = export(client).splitlines()
+	assert any(row.startswith("1,TAG-0000,9,") for row in rows)
+	assert "employee7@example.com" not in "\n".join(rows)
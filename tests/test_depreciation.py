@@ -0,0 +1,14 @@
+from datetime import date
+
+import pytest
+
+from depreciation import depreciation_totals, fleet_book_value
+
+
+# The dashboard figure comes from summed costs, and must agree with the per-asset report
+@pytest.mark.parametrize("as_of", [date(2022, 6, 30), date(2025, 1, 1), date(2030, 1, 1)])
+def test_fleet_book_value_matches_totals(app, as_of):
+	with app.app_context():
+		totals = depreciation_totals("type", as_of)
+		# The report rounds each group to the cent
+		assert fleet_book_value(as_of) == pytest.approx(sum(row["book_value"] for row in totals), abs=0.01 * len(totals))
@@ -0,0 +1,25 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import instrumentation
+from models import db
+
+
+# A statement that raises must not leave its start time behind on the connection
+def test_failed_statement_does_not_leak_start_time(app):
+	with app.app_context():
+		connection = db.session.connection()
+		with pytest.raises(OperationalError):
+			db.session.execute(text("SELECT * FROM no_such_table"))
+		assert connection.info.get("query_started") == []
+		db.session.rollback()
+
+
+# Streamed exports run their queries after the response is returned, and are counted once it closes
+def test_streamed_export_queries_are_counted(client):
+	instrumentation.reset_metrics()
+	response = client.get("/assets/export")
+	response.get_data()
+	response.close()
+	assert instrumentation.endpoint_metrics()["assets.export_assets"]["max_queries"] > 0
@@ -0,0 +1,13 @@
+from maintenance_schedule import MAX_DAYS
+
+
+# A huge window is clamped instead of overflowing the date arithmetic
+def test_due_window_is_clamped(client):
+	response = client.get("/asset_maintenance/due?days=99999999")
+	assert response.status_code == 200
+	assert response.get_json()["days"] == MAX_DAYS
+
+
+def test_negative_due_window_means_overdue_only(client):
+	response = client.get("/asset_maintenance/due?days=-5")
+	assert response.get_json()["days"] == 0
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event
+
+from models import db
+import cache
+
+# List pages load their related rows with a fixed plan (see load_options in pagination.py), so a page
+# runs the same number of statements whatever its size. These counts catch an N+1 creeping back in:
+# a relationship read per row adds page_size statements and fails both assertions.
+#
+# The counts include the page's own lookups (dropdown options, the row total), with the cache empty.
+LIST_PAGES = [
+	("/assets", 12),
+	("/asset_assignments", 3),
+	("/asset_maintenance", 2),
+	("/asset_disposals", 2),
+	("/employees", 4),
+	("/departments", 3),
+	("/vendors", 2),
+	("/locations", 2),
+	("/asset_type", 2),
+	("/asset_status", 2),
+	("/users", 4),
+]
+
+
+# Statements the app runs while fetching path, starting from an empty cache
+def count_queries(client, path):
+	cache.clear()
+	statements = []
+
+	def record(conn, cursor, statement, parameters, context, executemany):
+		statements.append(statement)
+
+	with client.application.app_context():
+		engine = db.engine
+	event.listen(engine, "before_cursor_execute", record)
+	try:
+		response = client.get(path)
+	finally:
+		event.remove(engine, "before_cursor_execute", record)
+	assert response.status_code == 200, path
+	return len(statements)
+
+
+@pytest.mark.parametrize("path, expected", LIST_PAGES)
+def test_list_page_query_count(client, path, expected):
+	small = count_queries(client, f"{path}?page_size=5")
+	large = count_queries(client, f"{path}?page_size=50")
+	assert small == large, f"{path} runs more statements for a larger page"
+	assert large == expected
@@ -0,0 +1,14 @@
+from models import db, Vendor
+
+
+# Related names are split into words the same way as asset text
+def test_related_names_match_on_token_boundaries(app, client):
+	with app.app_context():
+		vendor = db.session.get(Vendor, 1)
+		vendor.name = "Dell/Tech"
+		db.session.commit()
+
+	for term in ("tech", "dell", "Dell/Tech"):
+		page = client.get(f"/assets?search={term}").get_data(as_text=True)
+		assert "TAG-0000" in page, term
+	assert "TAG-0000" not in client.get("/assets?search=ech").get_data(as_text=True)